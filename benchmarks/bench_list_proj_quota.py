@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+
+"""
+Compare list_proj_quota latency between xfs_quota and quotactl backends
+
+Call this file as a script with TEST_MNT_POINT environment variable pointing to an XFS device mounted with prjquota options
+(quotactl requires root privileges, just like xfs_quota -x)
+"""
+
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from xfs_prjquota import XfsPrjQuota, BACKEND_XFS_QUOTA, BACKEND_QUOTACTL  # pylint: disable=wrong-import-position
+
+
+def bench(quota: XfsPrjQuota, rounds: int) -> list:
+    """
+    Call list_proj_quota rounds times and return every call duration
+
+    :param quota: XfsPrjQuota instance to benchmark
+    :type quota: XfsPrjQuota
+    :param rounds: Number of calls
+    :type rounds: int
+    :return: List of durations in seconds
+    :rtype: list
+    """
+
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        quota.list_proj_quota()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main() -> None:
+    """
+    Run benchmark for both backends and print results
+    """
+
+    argparser = argparse.ArgumentParser(description=__doc__.strip())
+    argparser.add_argument("-r", "--rounds", type=int, default=20, help="Number of list_proj_quota calls per backend")
+    args = argparser.parse_args()
+
+    mnt_point = os.environ.get("TEST_MNT_POINT", None)
+    assert mnt_point is not None, "Please call this script with TEST_MNT_POINT environment variable set"
+
+    reports = {}
+    for backend in (BACKEND_XFS_QUOTA, BACKEND_QUOTACTL):
+        quota = XfsPrjQuota(mnt_point, backend=backend)
+        reports[backend] = quota.list_proj_quota()
+        durations = bench(quota, args.rounds)
+        print(
+            "%-10s projects=%-8d min=%.3fms median=%.3fms max=%.3fms"
+            % (backend, len(reports[backend]), min(durations) * 1000, statistics.median(durations) * 1000, max(durations) * 1000)
+        )
+
+    if reports[BACKEND_XFS_QUOTA].keys() != reports[BACKEND_QUOTACTL].keys():
+        print("WARNING: backends did not report the same project ids")
+
+
+if __name__ == "__main__":
+    main()
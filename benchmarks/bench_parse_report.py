@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+
+"""
+Measure xfs_quota report parsing throughput on synthetic reports
+
+Compares the historical str/regex parser with current bytes parser, both building the dict and streaming lines,
+on block only reports ('report -p -n -N'), then current parser on reports with inode columns ('report -p -b -i -n -N')
+"""
+
+
+import io
+import os
+import sys
+import time
+import argparse
+from typing import Dict, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fakes import synthetic_report  # pylint: disable=wrong-import-position
+from xfs_prjquota import XfsPrjQuota, ProjectQuota, RE_QUOTA_REPORT  # pylint: disable=wrong-import-position
+
+
+def legacy_parse(stdout: bytes) -> Dict[int, ProjectQuota]:
+    """
+    Parser as it was before streaming support, kept here as reference
+
+    :param stdout: Raw stdout of xfs_quota command
+    :type stdout: bytes
+    :return: Dict with project id as key and namedtuple as value
+    :rtype: dict
+    """
+
+    parsed: Dict[int, ProjectQuota] = {}
+    for line in str(stdout, "utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        re_match = RE_QUOTA_REPORT.match(line)
+        assert re_match, "unable to parser xfs_quota report line: %r" % line
+
+        as_named_tuple = ProjectQuota(
+            proj_id=int(re_match.group("proj_id")),
+            used=int(re_match.group("used")) * 1024,
+            soft=int(re_match.group("soft")) * 1024,
+            hard=int(re_match.group("hard")) * 1024,
+            warn=int(re_match.group("warn")),
+            grace=re_match.group("grace"),
+        )
+        parsed[as_named_tuple.proj_id] = as_named_tuple
+    return parsed
+
+
+def streaming_sum(stdout: bytes) -> int:
+    """
+    Sum used bytes streaming lines from a file object, like iter_proj_quota does with xfs_quota stdout
+
+    :param stdout: Raw stdout of xfs_quota command
+    :type stdout: bytes
+    :return: Total used bytes
+    :rtype: int
+    """
+
+    parse_line = XfsPrjQuota._parse_xfs_quota_report_line  # pylint: disable=protected-access
+    total = 0
+    for line in io.BufferedReader(io.BytesIO(stdout)):  # type: ignore
+        quota = parse_line(line)
+        if quota is not None:
+            total += quota.used
+    return total
+
+
+def measure(func: Callable[[bytes], object], stdout: bytes, rounds: int) -> float:
+    """
+    Return best duration of rounds calls
+
+    :param func: Parser to call
+    :type func: callable
+    :param stdout: Report to parse
+    :type stdout: bytes
+    :param rounds: Number of calls
+    :type rounds: int
+    :return: Best duration in seconds
+    :rtype: float
+    """
+
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(stdout)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """
+    Run benchmark and print lines/s for each parser
+    """
+
+    argparser = argparse.ArgumentParser(description=__doc__.strip())
+    argparser.add_argument("-p", "--projects", type=int, nargs="+", default=[1000, 10000, 200000], help="Report sizes to benchmark")
+    argparser.add_argument("-r", "--rounds", type=int, default=5, help="Number of calls per parser, best one is kept")
+    args = argparser.parse_args()
+
+    assert legacy_parse(synthetic_report(100, inodes=False)) == XfsPrjQuota._parse_xfs_quota_report(synthetic_report(100, inodes=False))  # pylint: disable=protected-access
+
+    parsers = [
+        ("legacy str+regex", legacy_parse, False),
+        ("bytes split", XfsPrjQuota._parse_xfs_quota_report, False),  # pylint: disable=protected-access
+        ("streaming sum", streaming_sum, False),
+        ("bytes split -i", XfsPrjQuota._parse_xfs_quota_report, True),  # pylint: disable=protected-access
+    ]
+    for projects in args.projects:
+        reports = {x: synthetic_report(projects, inodes=x) for x in (False, True)}
+        for name, func, inodes in parsers:
+            duration = measure(func, reports[inodes], args.rounds)
+            print("%-8d %-18s %8.1fms %10.0f lines/s" % (projects, name, duration * 1000, projects / duration))
+
+
+if __name__ == "__main__":
+    main()
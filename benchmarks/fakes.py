@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+
+
+# pylint: disable=line-too-long
+
+
+"""
+Stand-ins allowing benchmarks to run anywhere, without XFS volume nor root privileges
+
+* synthetic_report builds xfs_quota report output of any size, fake_xfs_quota executable (next to this file) prints it
+* FakeFcntl replaces fcntl module of xfs_prjquota, FSGETXATTR/FSSETXATTR IOCTL are served from memory
+* FakeLibc replaces LIBC handle of xfs_prjquota, quotactl() is served from memory
+* FakePsutil replaces psutil module of xfs_prjquota, reporting a huge free space so synthetic limits always fit
+
+Called as a script, it writes a synthetic report to a file: fakes.py generate <projects> <path>
+"""
+
+
+import os
+import sys
+import errno
+import bisect
+import ctypes
+import fcntl
+import contextlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import xfs_prjquota  # pylint: disable=wrong-import-position
+
+
+#: Path of fake xfs_quota executable
+FAKE_XFS_QUOTA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_xfs_quota")
+
+
+def synthetic_report(projects: int, inodes: bool = True) -> bytes:
+    """
+    Build a fake xfs_quota -x -c 'report -p -b -i -n -N' output
+
+    :param projects: Number of project lines
+    :type projects: int
+    :param inodes: Add inode columns, like -i does, set to False for a 'report -p -n -N' output
+    :type inodes: bool, defaults to True
+    :return: Fake xfs_quota stdout
+    :rtype: bytes
+    """
+
+    lines = []
+    for proj_id in range(projects):
+        grace = "[7 days]" if proj_id % 10 == 0 else "[--------]"
+        line = "#%-10d %10d %10d %10d %5d %s" % (proj_id, proj_id * 37 % 10485760 + 4, 10485760, 12582912, 0, grace)
+        if inodes:
+            line += " %10d %10d %10d %5d [--------]" % (proj_id % 1000 + 1, 0, 100000, 0)
+        lines.append(line + "\n")
+    return "".join(lines).encode("utf-8")
+
+
+@contextlib.contextmanager
+def fake_xfs_quota_env(projects: int) -> Iterator[str]:
+    """
+    Context manager putting fake xfs_quota first in PATH, reporting given number of projects
+
+    Both xfs_prjquota (shutil.which) and child processes (check_xfs_proj_quota.py) will use it
+
+    :param projects: Number of projects fake xfs_quota reports
+    :type projects: int
+    :return: Directory prepended to PATH
+    :rtype: iterator
+    """
+
+    bin_dir = os.path.join(os.environ.get("TMPDIR", "/tmp"), "python-xfs-quota-bench-bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    link = os.path.join(bin_dir, "xfs_quota")
+    if not os.path.islink(link):
+        os.symlink(FAKE_XFS_QUOTA, link)
+
+    saved = {x: os.environ.get(x) for x in ("PATH", "FAKE_XFS_QUOTA_PROJECTS")}
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_XFS_QUOTA_PROJECTS"] = str(projects)
+    try:
+        yield bin_dir
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class FakeFcntl:
+    """
+    fcntl module stand-in, FSGETXATTR/FSSETXATTR IOCTL are served from an in memory dict indexed by (st_dev, st_ino)
+
+    Any other attribute is taken from real fcntl module
+    """
+
+    def __init__(self) -> None:
+        self.xattrs: Dict[Tuple[int, int], List[int]] = {}
+        self.calls = 0
+
+    def __getattr__(self, name: str):
+        return getattr(fcntl, name)
+
+    def ioctl(self, fd: int, request: int, arg, mutate_flag: bool = True) -> int:  # pylint: disable=unused-argument
+        """
+        Serve FSGETXATTR/FSSETXATTR from memory, same signature as fcntl.ioctl
+        """
+
+        self.calls += 1
+        stat = os.fstat(fd)
+        key = (stat.st_dev, stat.st_ino)
+        if request == xfs_prjquota.FS_IOC_FSGETXATTR:
+            arg[:] = type(arg)(arg.typecode, self.xattrs.get(key, [0, 0, 0, 0, 0]))
+            return 0
+        if request == xfs_prjquota.FS_IOC_FSSETXATTR:
+            self.xattrs[key] = list(arg)
+            return 0
+        raise OSError(errno.ENOTTY, "Unsupported IOCTL %#x" % request)
+
+
+class FakeLibc:  # pylint: disable=too-few-public-methods
+    """
+    libc stand-in implementing quotactl() for project quotas from an in memory dict
+
+    :param projects: Number of projects with usage to create, ids 0 to projects - 1
+    :type projects: int
+    """
+
+    def __init__(self, projects: int = 0) -> None:
+        #: Project id as key and [bcount, bsoft, bhard] in 512 bytes blocks as value
+        self.quotas: Dict[int, List[int]] = {x: [(x * 37 % 10485760 + 4) * 2, 20971520, 25165824] for x in range(projects)}
+        #: Project id as key and [icount, isoft, ihard] as value, projects missing here have no inode used nor limit
+        self.inodes: Dict[int, List[int]] = {x: [x % 1000 + 1, 0, 100000] for x in range(projects)}
+        self._sorted_ids: Optional[List[int]] = None
+        self.calls = 0
+
+    def quotactl(self, cmd: int, _device: bytes, proj_id: int, dquot_ref) -> int:
+        """
+        Serve Q_XGETQUOTA, Q_XGETNEXTQUOTA and Q_XSETQLIM, same return convention as libc (errno set with ctypes.set_errno)
+        """
+
+        self.calls += 1
+        dquot = dquot_ref._obj  # pylint: disable=protected-access
+        command = cmd >> 8
+
+        if command == xfs_prjquota.Q_XSETQLIM:
+            current = self.quotas.setdefault(proj_id, [0, 0, 0])
+            if dquot.d_fieldmask & xfs_prjquota.FS_DQ_BSOFT:
+                current[1] = dquot.d_blk_softlimit
+            if dquot.d_fieldmask & xfs_prjquota.FS_DQ_BHARD:
+                current[2] = dquot.d_blk_hardlimit
+            if dquot.d_fieldmask & (xfs_prjquota.FS_DQ_ISOFT | xfs_prjquota.FS_DQ_IHARD):
+                inodes = self.inodes.setdefault(proj_id, [0, 0, 0])
+                if dquot.d_fieldmask & xfs_prjquota.FS_DQ_ISOFT:
+                    inodes[1] = dquot.d_ino_softlimit
+                if dquot.d_fieldmask & xfs_prjquota.FS_DQ_IHARD:
+                    inodes[2] = dquot.d_ino_hardlimit
+            self._sorted_ids = None
+            return 0
+
+        if command == xfs_prjquota.Q_XGETNEXTQUOTA:
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted(self.quotas)
+            index = self._bisect(proj_id)
+            if index == len(self._sorted_ids):
+                ctypes.set_errno(errno.ENOENT)
+                return -1
+            proj_id = self._sorted_ids[index]
+        elif command != xfs_prjquota.Q_XGETQUOTA or proj_id not in self.quotas:
+            ctypes.set_errno(errno.ENOENT)
+            return -1
+
+        dquot.d_id = proj_id
+        dquot.d_bcount, dquot.d_blk_softlimit, dquot.d_blk_hardlimit = self.quotas[proj_id]
+        dquot.d_icount, dquot.d_ino_softlimit, dquot.d_ino_hardlimit = self.inodes.get(proj_id, (0, 0, 0))
+        return 0
+
+    def _bisect(self, proj_id: int) -> int:
+        """
+        Index of first known project id greater or equal to proj_id
+        """
+
+        return bisect.bisect_left(self._sorted_ids, proj_id)  # type: ignore
+
+
+class DiskUsage(NamedTuple):
+    """
+    Same fields as psutil.disk_usage result
+    """
+
+    total: int
+    used: int
+    free: int
+    percent: float
+
+
+class FakePsutil:  # pylint: disable=too-few-public-methods
+    """
+    psutil module stand-in, every path has the same (huge by default) free space
+
+    :param free: Free space reported in bytes
+    :type free: int, defaults to 1 EiB
+    """
+
+    def __init__(self, free: int = 1024 ** 6) -> None:
+        self.free = free
+
+    def disk_usage(self, _path) -> DiskUsage:
+        """
+        Same signature as psutil.disk_usage
+        """
+
+        return DiskUsage(total=self.free, used=0, free=self.free, percent=0.0)
+
+
+@contextlib.contextmanager
+def fake_kernel(projects: int = 0) -> Iterator[Tuple[FakeFcntl, FakeLibc, FakePsutil]]:
+    """
+    Context manager replacing IOCTL, quotactl() and psutil calls of xfs_prjquota by in memory stand-ins
+
+    Pass device parameter to XfsPrjQuota so mount checks (psutil.disk_partitions) are skipped
+
+    :param projects: Number of projects known by fake quotactl()
+    :type projects: int
+    :return: Tuple of FakeFcntl, FakeLibc and FakePsutil instances in use
+    :rtype: iterator
+    """
+
+    fake_fcntl = FakeFcntl()
+    fake_libc = FakeLibc(projects)
+    fake_psutil = FakePsutil()
+    saved = (xfs_prjquota.fcntl, xfs_prjquota.LIBC, xfs_prjquota.psutil)
+    xfs_prjquota.fcntl = fake_fcntl  # type: ignore
+    xfs_prjquota.LIBC = fake_libc  # type: ignore
+    xfs_prjquota.psutil = fake_psutil  # type: ignore
+    try:
+        yield fake_fcntl, fake_libc, fake_psutil
+    finally:
+        xfs_prjquota.fcntl, xfs_prjquota.LIBC, xfs_prjquota.psutil = saved
+
+
+if __name__ == "__main__":
+
+    assert len(sys.argv) == 4 and sys.argv[1] == "generate", "usage: %s generate <projects> <path>" % sys.argv[0]
+    TMP_PATH = "%s.%d.tmp" % (sys.argv[3], os.getpid())
+    with open(TMP_PATH, "wb") as report_fh:
+        report_fh.write(synthetic_report(int(sys.argv[2])))
+    os.replace(TMP_PATH, sys.argv[3])
@@ -0,0 +1,298 @@
+#!/usr/bin/python3
+
+
+# pylint: disable=line-too-long
+
+
+"""
+Run every benchmark against stand-ins (fake xfs_quota executable, in memory IOCTL and quotactl) and save results as JSON
+
+No XFS volume nor root privileges needed, so results only track xfs_prjquota own overhead (forks, parsing, Python code)
+Pass a previous results file with --compare to flag regressions
+"""
+
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fakes import synthetic_report, fake_xfs_quota_env, fake_kernel  # pylint: disable=wrong-import-position
+from xfs_prjquota import XfsPrjQuota, BACKEND_XFS_QUOTA, BACKEND_QUOTACTL  # pylint: disable=wrong-import-position
+
+#: Root of the repository, where check_xfs_proj_quota.py lives
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+#: Fake block device given to XfsPrjQuota so psutil mount checks are skipped
+FAKE_DEVICE = "/dev/fake"
+
+#: Benchmarked as an extra backend: xfs_quota backend with a long-running XfsQuotaSession process
+BACKEND_XFS_QUOTA_SESSION = BACKEND_XFS_QUOTA + "+session"
+
+
+def measure(func: Callable[[], Any], rounds: int) -> Dict[str, float]:
+    """
+    Call func rounds times and return duration statistics
+
+    :param func: Function to measure
+    :type func: callable
+    :param rounds: Number of calls
+    :type rounds: int
+    :return: Dict with min, median and max durations in seconds
+    :rtype: dict
+    """
+
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return {"min": min(durations), "median": statistics.median(durations), "max": max(durations)}
+
+
+def rounds_for(size: int, rounds: int) -> int:
+    """
+    Lower number of rounds for big sizes so a whole run stays in minutes
+
+    :param size: Number of projects
+    :type size: int
+    :param rounds: Requested number of rounds
+    :type rounds: int
+    :return: Rounds to run
+    :rtype: int
+    """
+
+    return max(1, min(rounds, 1000000 // max(size, 1)))
+
+
+def make_quota(mnt_point: str, backend: str, **kwargs: Any) -> XfsPrjQuota:
+    """
+    Build XfsPrjQuota instance for given benchmarked backend
+
+    :param mnt_point: Directory used as mount point
+    :type mnt_point: str
+    :param backend: BACKEND_XFS_QUOTA, BACKEND_QUOTACTL or BACKEND_XFS_QUOTA_SESSION
+    :type backend: str
+    :return: XfsPrjQuota instance, to be closed
+    :rtype: XfsPrjQuota
+    """
+
+    if backend == BACKEND_XFS_QUOTA_SESSION:
+        return XfsPrjQuota(mnt_point, backend=BACKEND_XFS_QUOTA, device=FAKE_DEVICE, session=True, **kwargs)
+    return XfsPrjQuota(mnt_point, backend=backend, device=FAKE_DEVICE, **kwargs)
+
+
+def bench_parse(sizes: List[int], rounds: int) -> List[Dict[str, Any]]:
+    """
+    Measure report parsing throughput
+
+    :param sizes: Report sizes (projects) to benchmark
+    :type sizes: list
+    :param rounds: Number of calls per size
+    :type rounds: int
+    :return: Results
+    :rtype: list
+    """
+
+    results = []
+    for size in sizes:
+        stdout = synthetic_report(size)
+        stats = measure(lambda: XfsPrjQuota._parse_xfs_quota_report(stdout), rounds_for(size, rounds))  # pylint: disable=protected-access,cell-var-from-loop
+        results.append({"bench": "parse_report", "size": size, "seconds": stats, "lines_per_second": size / stats["min"] if stats["min"] else 0.0})
+    return results
+
+
+def bench_list_proj_quota(sizes: List[int], rounds: int, mnt_point: str, backends: List[str]) -> List[Dict[str, Any]]:
+    """
+    Measure list_proj_quota latency with fake xfs_quota executable and fake quotactl()
+
+    :param sizes: Number of projects to benchmark
+    :type sizes: list
+    :param rounds: Number of calls per size
+    :type rounds: int
+    :param mnt_point: Directory used as mount point
+    :type mnt_point: str
+    :param backends: Backends to benchmark
+    :type backends: list
+    :return: Results
+    :rtype: list
+    """
+
+    results = []
+    for size in sizes:
+        for backend in backends:
+            with fake_xfs_quota_env(size), fake_kernel(size):
+                quota = make_quota(mnt_point, backend)
+                assert len(quota.list_proj_quota()) == size, "stand-in did not report expected number of projects"
+                stats = measure(quota.list_proj_quota, rounds_for(size, rounds))
+                quota.close()
+            results.append({"bench": "list_proj_quota", "backend": backend, "size": size, "seconds": stats})
+    return results
+
+
+def bench_provisioning(sizes: List[int], operations: int, mnt_point: str, backends: List[str]) -> List[Dict[str, Any]]:
+    """
+    Measure provisioning operations per second: allocate project id, create folder, tag it and set limits with free space check
+
+    Existing projects count matters because free space checks rely on a quota report
+
+    :param sizes: Number of already existing projects to benchmark
+    :type sizes: list
+    :param operations: Number of folders provisioned per size, lowered for big sizes
+    :type operations: int
+    :param mnt_point: Directory used as mount point
+    :type mnt_point: str
+    :param backends: Backends to benchmark
+    :type backends: list
+    :return: Results
+    :rtype: list
+    """
+
+    results = []
+    for size in sizes:
+        # Without ledger every operation fetches a report, keep big sizes runs short
+        size_operations = max(5, min(operations, 1000000 // max(size, 1)))
+        for backend in backends:
+            for ledger in (False, True):
+                with fake_xfs_quota_env(size), fake_kernel(size), tempfile.TemporaryDirectory(dir=mnt_point) as root:
+                    quota = make_quota(mnt_point, backend, reservation_ledger=ledger, id_range=(size + 1, size + size_operations + 1))
+                    # Do not account reports building project id allocator and reservation ledger
+                    _ = quota.id_allocator
+                    if ledger:
+                        _ = quota.ledger
+
+                    start = time.perf_counter()
+                    for index in range(size_operations):
+                        path = os.path.join(root, "folder_%d" % index)
+                        os.mkdir(path)
+                        proj_id = quota.allocate_project_id()
+                        quota.set_proj_id_for_path(path, proj_id)
+                        quota.set_quota_for_proj_id(proj_id, soft=1024 * 1024, hard=1024 * 1024)
+                    duration = time.perf_counter() - start
+                    quota.close()
+
+                results.append({"bench": "provisioning", "backend": backend, "ledger": ledger, "size": size, "operations": size_operations, "seconds": duration, "ops_per_second": size_operations / duration})
+    return results
+
+
+def bench_nagios_check(sizes: List[int], rounds: int, mnt_point: str) -> List[Dict[str, Any]]:
+    """
+    Measure check_xfs_proj_quota.py wall time (interpreter start-up included) for a single path and for all projects
+
+    :param sizes: Number of projects to benchmark
+    :type sizes: list
+    :param rounds: Number of runs per size
+    :type rounds: int
+    :param mnt_point: Directory given as path to check
+    :type mnt_point: str
+    :return: Results
+    :rtype: list
+    """
+
+    script = os.path.join(REPO_DIR, "check_xfs_proj_quota.py")
+    results = []
+    for size in sizes:
+        with fake_xfs_quota_env(size):
+            for mode, extra_args in (("single_path", []), ("all_projects", ["--all-projects"])):
+                cmd = [sys.executable, script, "--path", mnt_point, "--warning", "100", "--critical", "100"] + extra_args
+
+                def run(cmd: List[str] = cmd) -> None:
+                    process = subprocess.run(cmd, stdout=subprocess.PIPE, check=False)
+                    assert process.returncode in (0, 1, 2), "check failed: %r" % process.stdout
+
+                stats = measure(run, rounds_for(size, rounds))
+                results.append({"bench": "nagios_check", "mode": mode, "size": size, "seconds": stats})
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline_file: str, tolerance: float) -> int:
+    """
+    Compare results with a previous run and print regressions
+
+    :param results: Results of this run
+    :type results: list
+    :param baseline_file: JSON file written by a previous run
+    :type baseline_file: str
+    :param tolerance: Allowed slowdown ratio, e.g: 0.2 for 20%
+    :type tolerance: float
+    :return: Number of regressions found
+    :rtype: int
+    """
+
+    def key(result: Dict[str, Any]) -> str:
+        return json.dumps({k: v for k, v in result.items() if not isinstance(v, (dict, float))}, sort_keys=True)
+
+    def duration(result: Dict[str, Any]) -> float:
+        return result["seconds"]["min"] if isinstance(result["seconds"], dict) else result["seconds"] / result.get("operations", 1)
+
+    with open(baseline_file, "r") as baseline_fh:
+        baseline = {key(x): x for x in json.load(baseline_fh)["results"]}
+
+    regressions = 0
+    for result in results:
+        previous = baseline.get(key(result))
+        if previous is None:
+            continue
+        ratio = duration(result) / duration(previous) if duration(previous) else 1.0
+        if ratio > 1 + tolerance:
+            regressions += 1
+            print("REGRESSION %s: %.2fx slower" % (key(result), ratio))
+    return regressions
+
+
+def main() -> None:
+    """
+    Run selected benchmarks, print and save results
+    """
+
+    benches = ["parse", "list", "provisioning", "check"]
+    argparser = argparse.ArgumentParser(description=__doc__.strip())
+    argparser.add_argument("-b", "--bench", type=str, nargs="+", choices=benches, default=benches, help="Benchmarks to run")
+    argparser.add_argument("-s", "--sizes", type=int, nargs="+", default=[10, 1000, 100000, 1000000], help="Number of projects to benchmark")
+    argparser.add_argument("-r", "--rounds", type=int, default=10, help="Number of calls per measure, lowered for big sizes")
+    argparser.add_argument("-n", "--operations", type=int, default=200, help="Number of folders provisioned per size")
+    backends = [BACKEND_XFS_QUOTA, BACKEND_XFS_QUOTA_SESSION, BACKEND_QUOTACTL]
+    argparser.add_argument("-B", "--backend", type=str, nargs="+", choices=backends, default=backends, help="Backends to benchmark")
+    argparser.add_argument("-o", "--output", type=str, default="benchmark-results.json", help="JSON file to write results to")
+    argparser.add_argument("-c", "--compare", type=str, default=None, help="Previous JSON results to compare with, exit code is 1 on regression")
+    argparser.add_argument("-t", "--tolerance", type=float, default=0.2, help="Allowed slowdown ratio when comparing")
+    args = argparser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="python-xfs-quota-bench-") as mnt_point:
+        if "parse" in args.bench:
+            results.extend(bench_parse(args.sizes, args.rounds))
+        if "list" in args.bench:
+            results.extend(bench_list_proj_quota(args.sizes, args.rounds, mnt_point, args.backend))
+        if "provisioning" in args.bench:
+            results.extend(bench_provisioning(args.sizes, args.operations, mnt_point, args.backend))
+        if "check" in args.bench:
+            results.extend(bench_nagios_check(args.sizes, args.rounds, mnt_point))
+
+    for result in results:
+        print(json.dumps(result, sort_keys=True))
+
+    git_rev: Optional[str]
+    try:
+        git_rev = subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        git_rev = None
+
+    with open(args.output, "w") as output_fh:
+        metadata = {"time": time.time(), "git_rev": git_rev, "python": platform.python_version(), "platform": platform.platform()}
+        json.dump({"metadata": metadata, "results": results}, output_fh, indent=2, sort_keys=True)
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,27 +14,73 @@ import sys
 try:
     import os
     import re
+    import glob
+    import time
+    import errno
     import fcntl
     import array
+    import ctypes
+    import mmap
     import shutil
+    import struct
     import pathlib
     import argparse
-    import subprocess
-    from typing import Dict, Union, NamedTuple
+    from typing import Any, Callable, Dict, List, Set, Tuple, Union, Optional, Iterable, NamedTuple, Iterator
 except Exception as exc:  # pylint: disable=broad-except
     print("UNKNOWN: Got exception: %s: %s" % (exc.__class__.__name__, exc))
     sys.exit(3)
 
+#: Nagios state names indexed by exit code
+NAGIOS_STATES = {0: "OK", 1: "WARNING", 2: "CRITICAL", 3: "UNKNOWN"}
+
+#: Nagios states severity, used to find the worst one
+NAGIOS_SEVERITY = {0: 0, 1: 1, 3: 2, 2: 3}
+
 #: Hex value of IOCTL to get extended attributes
 FS_IOC_FSGETXATTR = 0x801C581F
 
+#: Hex value of quotactl command to get quota of a given id
+Q_XGETQUOTA = 0x5803
+
+#: Hex value of quotactl command to get quota of the next id having one
+Q_XGETNEXTQUOTA = 0x5809
+
+#: Value of quotactl quota type for project quotas
+PRJQUOTA = 2
+
+#: Size in bytes of the basic blocks used by XFS to account quotas in fs_disk_quota struct
+XFS_BB_SIZE = 512
+
+#: Backend name to query quotas by calling xfs_quota binary
+BACKEND_XFS_QUOTA = "xfs_quota"
+
+#: Backend name to query quotas by calling quotactl() directly
+BACKEND_QUOTACTL = "quotactl"
+
+#: Number of samples kept per project in usage history files by default (24 hours of 5 minutes checks)
+HISTORY_SIZE = 288
+
+#: Minimum number of samples needed to compute a growth rate
+HISTORY_MIN_SAMPLES = 3
+
+#: RE matcher for octal escaped chars in /proc/self/mounts entries
+RE_MOUNTS_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+#: RE matcher for inode columns following block ones when xfs_quota is given -i, optional so block only output still parses
+RE_QUOTA_INODES = r"(?:\s+(?P<iused>[0-9]+)\s+(?P<isoft>[0-9]+)\s+(?P<ihard>[0-9]+)\s+(?P<iwarn>[0-9]+)\s+\[(?P<igrace>[^\]]+)\])?"
+
 #: RE matcher for xfs_quota report entries
-RE_QUOTA_REPORT = re.compile(r"^#(?P<proj_id>[0-9]+)\s+(?P<used>[0-9]+)\s+(?P<soft>[0-9]+)\s+(?P<hard>[0-9]+)\s+(?P<warn>[0-9]+)\s+\[(?P<grace>.+)\]$")
+RE_QUOTA_REPORT = re.compile(r"^#(?P<proj_id>[0-9]+)\s+(?P<used>[0-9]+)\s+(?P<soft>[0-9]+)\s+(?P<hard>[0-9]+)\s+(?P<warn>[0-9]+)\s+\[(?P<grace>[^\]]+)\]" + RE_QUOTA_INODES + "$")
+
+#: RE matcher for xfs_quota quota output, device name is wrapped on its own line when too long
+RE_QUOTA_OUTPUT = re.compile(r"^\S+\s+(?P<used>[0-9]+)\s+(?P<soft>[0-9]+)\s+(?P<hard>[0-9]+)\s+(?P<warn>[0-9]+)\s+\[(?P<grace>[^\]]+)\]" + RE_QUOTA_INODES)
 
 
 class ProjectQuota(NamedTuple):
     """
     NamedTuple representing quota usage for a given project id
+
+    used/soft/hard are in bytes, iused/isoft/ihard are inode counts (left to 0 by block only xfs_quota output)
     """
 
     proj_id: int
@@ -43,6 +89,220 @@ class ProjectQuota(NamedTuple):
     hard: int
     warn: int
     grace: str
+    iused: int = 0
+    isoft: int = 0
+    ihard: int = 0
+    iwarn: int = 0
+    igrace: str = "--------"
+
+
+class CallTiming(NamedTuple):
+    """
+    NamedTuple representing one instrumented call (subprocess, parse, ioctl or quotactl), passed to instrument callback
+    """
+
+    kind: str
+    name: str
+    duration: float
+    size: int
+    error: Optional[str]
+
+
+class CheckTarget(NamedTuple):
+    """
+    NamedTuple representing a path to be checked along with its thresholds
+    """
+
+    path: str
+    warning: int
+    critical: int
+
+
+class PerfData(NamedTuple):
+    """
+    NamedTuple representing one Nagios perfdata item, check label is prepended to name when many results are aggregated
+    """
+
+    name: str
+    value: str
+
+
+class CheckResult(NamedTuple):
+    """
+    NamedTuple representing the outcome of checking one path (or project)
+    """
+
+    code: int
+    label: str
+    message: str
+    summary: str
+    perfdata: List[PerfData]
+
+
+class FsDiskQuota(ctypes.Structure):  # pylint: disable=too-few-public-methods
+    """
+    ctypes mapping of fs_disk_quota struct used by XFS quotactl commands (see linux/dqblk_xfs.h)
+
+    Block values are expressed in 512 bytes basic blocks
+    """
+
+    _fields_ = [
+        ("d_version", ctypes.c_int8),
+        ("d_flags", ctypes.c_int8),
+        ("d_fieldmask", ctypes.c_uint16),
+        ("d_id", ctypes.c_uint32),
+        ("d_blk_hardlimit", ctypes.c_uint64),
+        ("d_blk_softlimit", ctypes.c_uint64),
+        ("d_ino_hardlimit", ctypes.c_uint64),
+        ("d_ino_softlimit", ctypes.c_uint64),
+        ("d_bcount", ctypes.c_uint64),
+        ("d_icount", ctypes.c_uint64),
+        ("d_itimer", ctypes.c_int32),
+        ("d_btimer", ctypes.c_int32),
+        ("d_iwarns", ctypes.c_uint16),
+        ("d_bwarns", ctypes.c_uint16),
+        ("d_itimer_hi", ctypes.c_int8),
+        ("d_btimer_hi", ctypes.c_int8),
+        ("d_rtbtimer_hi", ctypes.c_int8),
+        ("d_padding2", ctypes.c_int8),
+        ("d_rtb_hardlimit", ctypes.c_uint64),
+        ("d_rtb_softlimit", ctypes.c_uint64),
+        ("d_rtbcount", ctypes.c_uint64),
+        ("d_rtbtimer", ctypes.c_int32),
+        ("d_rtbwarns", ctypes.c_uint16),
+        ("d_padding3", ctypes.c_int16),
+        ("d_padding4", ctypes.c_char * 8),
+    ]
+
+
+class UsageHistory:
+    """
+    Fixed-size ring buffer of (timestamp, used bytes) samples of one project, stored in a memory mapped file
+
+    Sums of a least squares linear regression are updated on every append (oldest sample being subtracted once the
+    ring is full) so growth rate is computed in constant time whatever the number of samples, they are recomputed
+    from samples whenever the ring wraps to bound floating point drift. Times and sizes are summed relative to the
+    oldest sample (base) to keep sums small. File is locked (flock) until close
+
+    :param path: History file, created if missing and reset if its layout does not match
+    :type path: str
+    :param capacity: Number of samples kept
+    :type capacity: int, defaults to HISTORY_SIZE
+    """
+
+    #: File header: magic, capacity, count, head (next slot), base time, base used, sum t, sum used, sum t^2, sum t*used
+    HEADER = struct.Struct("<8sIII4x6d")
+
+    #: One sample: UNIX timestamp and used bytes
+    SAMPLE = struct.Struct("<dQ")
+
+    #: Identifies history files, last two chars being layout version
+    MAGIC = b"XFSPQH01"
+
+    def __init__(self, path: str, capacity: int = HISTORY_SIZE) -> None:
+        assert isinstance(capacity, int) and capacity >= HISTORY_MIN_SAMPLES, "capacity parameter must be an integer greater or equal to %d" % HISTORY_MIN_SAMPLES
+
+        size = self.HEADER.size + capacity * self.SAMPLE.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+        self._header = list(self.HEADER.unpack_from(self._map, 0))
+        if self._header[0] != self.MAGIC or self._header[1] != capacity:
+            self._header = [self.MAGIC, capacity, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+    def close(self) -> None:
+        """
+        Unmap and close file, releasing its lock
+        """
+
+        self._map.close()
+        os.close(self._fd)
+
+    @staticmethod
+    def file_name(volume_path: str, proj_id: int) -> str:
+        """
+        Build history file name of a project, / and % of volume path being percent encoded so names cannot collide
+
+        :param volume_path: Mount point of the volume
+        :type volume_path: str
+        :param proj_id: Project id
+        :type proj_id: int
+        :return: File name, e.g: srv%2Fdata-42.hist
+        :rtype: str
+        """
+
+        return "%s-%d.hist" % (volume_path.strip("/").replace("%", "%25").replace("/", "%2F") or "%2F", proj_id)
+
+    def _sample(self, index: int) -> Tuple[float, int]:
+        """
+        Read sample stored in given slot
+
+        :param index: Slot index
+        :type index: int
+        :return: Timestamp and used bytes
+        :rtype: tuple
+        """
+
+        return self.SAMPLE.unpack_from(self._map, self.HEADER.size + index * self.SAMPLE.size)
+
+    def append(self, timestamp: float, used: int) -> None:
+        """
+        Store a sample, replacing the oldest one if ring is full, and update regression sums
+
+        :param timestamp: UNIX timestamp of sample
+        :type timestamp: float
+        :param used: Used bytes
+        :type used: int
+        """
+
+        _magic, capacity, count, head, base_t, base_y, sum_t, sum_y, sum_tt, sum_ty = self._header
+        if count == 0:
+            base_t, base_y = timestamp, used
+        if count == capacity:
+            old_t, old_y = self._sample(head)
+            delta_t, delta_y = old_t - base_t, old_y - base_y
+            sum_t, sum_y, sum_tt, sum_ty = sum_t - delta_t, sum_y - delta_y, sum_tt - delta_t * delta_t, sum_ty - delta_t * delta_y
+        else:
+            count += 1
+
+        self.SAMPLE.pack_into(self._map, self.HEADER.size + head * self.SAMPLE.size, timestamp, used)
+        delta_t, delta_y = timestamp - base_t, used - base_y
+        sum_t, sum_y, sum_tt, sum_ty = sum_t + delta_t, sum_y + delta_y, sum_tt + delta_t * delta_t, sum_ty + delta_t * delta_y
+        head = (head + 1) % capacity
+
+        # Ring wrapped, start again from exact sums relative to the oldest sample
+        if head == 0:
+            samples = [self._sample(x) for x in range(capacity)]
+            base_t, base_y = samples[0]
+            sum_t = sum(x[0] - base_t for x in samples)
+            sum_y = sum(x[1] - base_y for x in samples)
+            sum_tt = sum((x[0] - base_t) ** 2 for x in samples)
+            sum_ty = sum((x[0] - base_t) * (x[1] - base_y) for x in samples)
+
+        self._header = [self.MAGIC, capacity, count, head, base_t, base_y, sum_t, sum_y, sum_tt, sum_ty]
+        self.HEADER.pack_into(self._map, 0, *self._header)
+
+    def growth_rate(self) -> Optional[float]:
+        """
+        Compute usage growth rate as the slope of the least squares line of stored samples
+
+        :return: Growth rate in bytes per second (negative if usage decreases), None if not enough samples
+        :rtype: float
+        """
+
+        count, sum_t, sum_y, sum_tt, sum_ty = self._header[2], self._header[6], self._header[7], self._header[8], self._header[9]
+        denominator = count * sum_tt - sum_t * sum_t
+        if count < HISTORY_MIN_SAMPLES or denominator <= 0:
+            return None
+        return (count * sum_ty - sum_t * sum_y) / denominator
 
 
 class XfsProjQuotaCheck:
@@ -50,24 +310,67 @@ class XfsProjQuotaCheck:
     Class to check XFS filesystems project (folder) quota in Python
 
     Could be easily ported to Ext4 as it uses FS_IOC_FSGETXATTR/FS_IOC_FSSETXATTR IOCTL to assign project id to folder
-    But it currently relies on xfs_quota binary to assign quota to a project and report usage but this could probably done
-    by calling another binary or figure out which IOCTL to send to do that but that's too much work atm for me
+    It relies on xfs_quota binary to report usage by default, but usage can also be reported by calling quotactl()
+    directly with backend=BACKEND_QUOTACTL
 
     Be careful, as the class relies on xfs_quota shell calls it cannot be considered as thread/process safe
 
     :param mnt_point: Filesystem mount point to handle quota for
     :type mnt_point: str or pathlib.Path
+    :param backend: How to report quota usage, BACKEND_XFS_QUOTA (fork xfs_quota) or BACKEND_QUOTACTL (call quotactl() directly)
+    :type backend: str, defaults to BACKEND_XFS_QUOTA
+    :param instrument: Callback receiving a CallTiming for every subprocess, parse, ioctl and quotactl call, None disables instrumentation
+    :type instrument: callable, defaults to None
     """
 
-    def __init__(self, mnt_point: str) -> None:
+    def __init__(self, mnt_point: str, backend: str = BACKEND_XFS_QUOTA, instrument: Optional[Callable[[CallTiming], None]] = None) -> None:
         assert isinstance(mnt_point, (str, pathlib.Path)) and str(mnt_point).startswith(
             "/"
         ), "mount_point parameter must be a non-emtpy string (or pathlib.Path) starting with /"
         self.mnt_point = pathlib.Path(mnt_point) if isinstance(mnt_point, str) else mnt_point
 
-        xfs_quota = shutil.which("xfs_quota")
-        assert xfs_quota, "xfs_quota command not found, may I suggest apt install xfsprogs ?"
-        self.xfs_quota = xfs_quota
+        assert backend in (BACKEND_XFS_QUOTA, BACKEND_QUOTACTL), "backend parameter must be one of %s or %s" % (BACKEND_XFS_QUOTA, BACKEND_QUOTACTL)
+        self.backend = backend
+
+        assert instrument is None or callable(instrument), "instrument parameter must be a callable or None"
+        self.instrument = instrument
+
+        if self.backend == BACKEND_QUOTACTL:
+            self.device = self.find_device(str(self.mnt_point))
+            # Symbols of the running interpreter already include libc ones, avoids ctypes.util costly import and ldconfig fork
+            self.libc = ctypes.CDLL(None, use_errno=True)
+            self.libc.quotactl.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_void_p]
+            self.libc.quotactl.restype = ctypes.c_int
+        else:
+            xfs_quota = shutil.which("xfs_quota")
+            assert xfs_quota, "xfs_quota command not found, may I suggest apt install xfsprogs ?"
+            self.xfs_quota = xfs_quota
+
+    def _call(self, kind: str, name: str, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Call func and report its duration, output size and outcome to instrument callback if any
+
+        :param kind: Call kind: subprocess, parse or ioctl
+        :type kind: str
+        :param name: Call name, e.g: report
+        :type name: str
+        :param func: Function to call with args
+        :type func: callable
+        :return: Whatever func returned
+        :rtype: any
+        """
+
+        if self.instrument is None:
+            return func(*args)
+
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as exc:
+            self.instrument(CallTiming(kind, name, time.perf_counter() - start, 0, "%s: %s" % (exc.__class__.__name__, exc)))
+            raise
+        self.instrument(CallTiming(kind, name, time.perf_counter() - start, len(result) if isinstance(result, (bytes, dict)) else 0, None))
+        return result
 
     def get_proj_id_for_path(self, path: Union[str, pathlib.Path]) -> int:
         """
@@ -91,15 +394,18 @@ class XfsProjQuotaCheck:
         assert path.is_dir(), "provided path %s is not an existing directory" % path
 
         path_fd = os.open(path, os.O_DIRECTORY)
-        ret_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
-        fcntl.ioctl(path_fd, FS_IOC_FSGETXATTR, ret_struct, True)  # type: ignore
+        try:
+            ret_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
+            self._call("ioctl", "FSGETXATTR", fcntl.ioctl, path_fd, FS_IOC_FSGETXATTR, ret_struct, True)
+        finally:
+            os.close(path_fd)
 
         return ret_struct[3]  # project id stored at index 3, see fsxattr struct definition
 
     @staticmethod
     def _parse_xfs_quota_report(stdout: bytes) -> Dict[int, ProjectQuota]:
         """
-        Parse xfs_quota -x -c 'report -p -n -N' output
+        Parse xfs_quota -x -c 'report -p -b -i -n -N' output
 
         See list_proj_quota method instead
 
@@ -124,24 +430,225 @@ class XfsProjQuotaCheck:
                 hard=int(re_match.group("hard")) * 1024,
                 warn=int(re_match.group("warn")),
                 grace=re_match.group("grace"),
+                iused=int(re_match.group("iused") or 0),
+                isoft=int(re_match.group("isoft") or 0),
+                ihard=int(re_match.group("ihard") or 0),
+                iwarn=int(re_match.group("iwarn") or 0),
+                igrace=re_match.group("igrace") or "--------",
             )
             parsed[as_named_tuple.proj_id] = as_named_tuple
 
         return parsed
 
+    @staticmethod
+    def _format_grace(timer: int) -> str:
+        """
+        Format quota grace timer the same way xfs_quota report does (without brackets)
+
+        :param timer: Timer value from fs_disk_quota struct (expiry as UNIX timestamp, 0 if not running)
+        :type timer: int
+        :return: Grace string as found between brackets in xfs_quota report, e.g: -------- or 7 days
+        :rtype: str
+        """
+
+        if timer == 0:
+            return "--------"
+
+        remaining = max(timer - int(time.time()), 0)
+        if remaining > 86400:
+            remaining += 30  # xfs_quota rounds so a freshly set grace does not show one day less
+        days, remaining = divmod(remaining, 86400)
+        hours, remaining = divmod(remaining, 3600)
+        minutes, seconds = divmod(remaining, 60)
+
+        if days > 0 or (hours == 0 and minutes == 0 and seconds == 0):
+            return "%d %s" % (days, "day" if days == 1 else "days")
+        return "%02d:%02d:%02d" % (hours, minutes, seconds)
+
+    def _quotactl(self, cmd: int, proj_id: int, dquot: FsDiskQuota) -> None:
+        """
+        Call quotactl() for given project id against mnt_point block device
+
+        :param cmd: Quotactl XFS command, e.g: Q_XGETQUOTA (QCMD with PRJQUOTA will be applied)
+        :type cmd: int
+        :param proj_id: Project id to send command for
+        :type proj_id: int
+        :param dquot: Struct to be filled by the kernel
+        :type dquot: FsDiskQuota
+        :raises OSError: If quotactl() call failed
+        """
+
+        start = time.perf_counter()
+        ret = self.libc.quotactl((cmd << 8) | PRJQUOTA, self.device.encode("utf-8"), proj_id, ctypes.byref(dquot))
+        err = ctypes.get_errno() if ret != 0 else 0
+        if self.instrument is not None:
+            name = "Q_XGETQUOTA" if cmd == Q_XGETQUOTA else "Q_XGETNEXTQUOTA"
+            self.instrument(CallTiming("quotactl", name, time.perf_counter() - start, ctypes.sizeof(dquot), os.strerror(err) if err else None))
+        if ret != 0:
+            raise OSError(err, "quotactl on %s (%s) for project id %d failed: %s" % (self.device, self.mnt_point, proj_id, os.strerror(err)))
+
+    def _fs_disk_quota_to_project_quota(self, dquot: FsDiskQuota) -> ProjectQuota:
+        """
+        Convert a fs_disk_quota struct returned by quotactl() into a ProjectQuota namedtuple
+
+        :param dquot: Struct filled by Q_XGETQUOTA or Q_XGETNEXTQUOTA quotactl command
+        :type dquot: FsDiskQuota
+        :return: Namedtuple with soft/hard/used values in bytes
+        :rtype: ProjectQuota
+        """
+
+        # Timers are signed 32 bits values extended with 8 more high bits on bigtime enabled filesystems
+        btimer = (dquot.d_btimer & 0xFFFFFFFF) | ((dquot.d_btimer_hi & 0xFF) << 32)
+        itimer = (dquot.d_itimer & 0xFFFFFFFF) | ((dquot.d_itimer_hi & 0xFF) << 32)
+
+        return ProjectQuota(
+            proj_id=dquot.d_id,
+            used=dquot.d_bcount * XFS_BB_SIZE,
+            soft=dquot.d_blk_softlimit * XFS_BB_SIZE,
+            hard=dquot.d_blk_hardlimit * XFS_BB_SIZE,
+            warn=dquot.d_bwarns,
+            grace=self._format_grace(btimer),
+            iused=dquot.d_icount,
+            isoft=dquot.d_ino_softlimit,
+            ihard=dquot.d_ino_hardlimit,
+            iwarn=dquot.d_iwarns,
+            igrace=self._format_grace(itimer),
+        )
+
+    def _iter_proj_quota_quotactl(self) -> Iterator[ProjectQuota]:
+        """
+        Walk all project quotas of mnt_point using Q_XGETNEXTQUOTA quotactl command
+
+        Projects without any block nor inode used are skipped, just like xfs_quota report -b -i does
+
+        :return: Iterator of namedtuple with soft/hard/used values in bytes
+        :rtype: iterator
+        """
+
+        dquot = FsDiskQuota()
+        next_id = 0
+        while next_id <= 0xFFFFFFFF:
+            try:
+                self._quotactl(Q_XGETNEXTQUOTA, next_id, dquot)
+            except OSError as exc:
+                if exc.errno == errno.ENOENT:  # No more project id having quota
+                    return
+                raise
+            if dquot.d_bcount or dquot.d_icount:
+                yield self._fs_disk_quota_to_project_quota(dquot)
+            next_id = dquot.d_id + 1
+
     def list_proj_quota(self) -> Dict[int, ProjectQuota]:
         """
-        Query mnt_point with xfs_quota and return a dict indexed by project id and usage/limit values
+        Query mnt_point with xfs_quota (or quotactl) and return a dict indexed by project id and usage/limit values
 
         :return: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
         :rtype: dict
         """
 
-        # -p project quota, -n numeric project id, -N hide header
-        cmd = [self.xfs_quota, "-x", "-c", "report -p -n -N", str(self.mnt_point)]
-        stdout = subprocess.check_output(cmd)
+        if self.backend == BACKEND_QUOTACTL:
+            return {x.proj_id: x for x in self._iter_proj_quota_quotactl()}
+
+        import subprocess  # pylint: disable=import-outside-toplevel # Not needed with quotactl backend, keep plugin start-up low
+
+        # -p project quota, -b blocks, -i inodes, -n numeric project id, -N hide header
+        cmd = [self.xfs_quota, "-x", "-c", "report -p -b -i -n -N", str(self.mnt_point)]
+        stdout = self._call("subprocess", "report", subprocess.check_output, cmd)
 
-        return self._parse_xfs_quota_report(stdout)
+        return self._call("parse", "report", self._parse_xfs_quota_report, stdout)
+
+    @staticmethod
+    def _parse_xfs_quota_output(proj_id: int, stdout: bytes) -> Optional[ProjectQuota]:
+        """
+        Parse xfs_quota -x -c 'quota -p -b -i -n -N <proj_id>' output
+
+        See get_proj_quota method instead
+
+        :param proj_id: Project id quota has been queried for, not part of the output
+        :type proj_id: int
+        :param stdout: Raw stdout of xfs_quota command
+        :type stdout: bytes
+        :return: Namedtuple with soft/hard/used values in bytes or None if project has no quota
+        :rtype: ProjectQuota
+        """
+
+        output = str(stdout, "utf-8").strip()
+        if not output:
+            return None
+        re_match = RE_QUOTA_OUTPUT.match(output)
+        assert re_match, "unable to parser xfs_quota quota output: %r" % output
+
+        return ProjectQuota(
+            proj_id=proj_id,
+            used=int(re_match.group("used")) * 1024,  # KiB, just like report command
+            soft=int(re_match.group("soft")) * 1024,
+            hard=int(re_match.group("hard")) * 1024,
+            warn=int(re_match.group("warn")),
+            grace=re_match.group("grace"),
+            iused=int(re_match.group("iused") or 0),
+            isoft=int(re_match.group("isoft") or 0),
+            ihard=int(re_match.group("ihard") or 0),
+            iwarn=int(re_match.group("iwarn") or 0),
+            igrace=re_match.group("igrace") or "--------",
+        )
+
+    def get_proj_quota(self, proj_id: int) -> Optional[ProjectQuota]:
+        """
+        Query mnt_point with xfs_quota (or quotactl) for a single project id
+
+        Cost does not depend on the number of projects on the volume, unlike list_proj_quota
+        With quotactl backend, a project having limits but neither blocks nor inodes used is returned as well, contrary to
+        list_proj_quota. With xfs_quota backend it is not (None is returned), quota command skipping such projects without -v
+
+        :param proj_id: Project id to get quota for
+        :type proj_id: int
+        :return: Namedtuple with soft/hard/used values in bytes or None if project has no quota
+        :rtype: ProjectQuota
+        """
+
+        assert isinstance(proj_id, int) and 0 <= proj_id <= 0xFFFFFFFF, "proj_id parameter must be an integer between 0 and 2^32-1"
+
+        if self.backend == BACKEND_QUOTACTL:
+            dquot = FsDiskQuota()
+            try:
+                self._quotactl(Q_XGETQUOTA, proj_id, dquot)
+            except OSError as exc:
+                if exc.errno == errno.ENOENT:  # No quota for this project id
+                    return None
+                raise
+            return self._fs_disk_quota_to_project_quota(dquot)
+
+        import subprocess  # pylint: disable=import-outside-toplevel # Not needed with quotactl backend, keep plugin start-up low
+
+        # -p project quota, -b blocks, -i inodes, -n numeric project id, -N hide header
+        cmd = [self.xfs_quota, "-x", "-c", "quota -p -b -i -n -N %d" % proj_id, str(self.mnt_point)]
+        stdout = self._call("subprocess", "quota", subprocess.check_output, cmd)
+
+        return self._call("parse", "quota", self._parse_xfs_quota_output, proj_id, stdout)
+
+    def get_proj_quotas(self, proj_ids: Iterable[int]) -> Dict[int, ProjectQuota]:
+        """
+        Query quota for given project ids only, projects without quota are not part of the returned dict
+
+        With quotactl backend each project is queried individually, with xfs_quota backend it only
+        does so for a single project, a full report being cheaper than forking xfs_quota many times
+
+        :param proj_ids: Project ids to get quota for
+        :type proj_ids: iterable
+        :return: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
+
+        proj_ids = set(proj_ids)
+        if self.backend == BACKEND_XFS_QUOTA and len(proj_ids) > 1:
+            return {k: v for k, v in self.list_proj_quota().items() if k in proj_ids}
+
+        quotas = {}
+        for proj_id in proj_ids:
+            quota = self.get_proj_quota(proj_id)
+            if quota is not None:
+                quotas[proj_id] = quota
+        return quotas
 
     @staticmethod
     def sizeof_fmt(num: Union[int, float], suffix: str = "B") -> str:
@@ -163,6 +670,26 @@ class XfsProjQuotaCheck:
             num /= 1024.0
         return "%.1f%s%s" % (num, "Yi", suffix)
 
+    @staticmethod
+    def find_device(mnt_point: str) -> str:
+        """
+        Find block device mounted on given mount point, required to call quotactl()
+
+        :param mnt_point: Mount point to find block device for
+        :type mnt_point: str
+        :raises AssertionError: If provided mount point cannot be found in /proc/self/mounts
+        :return: Block device path, e.g: /dev/sdb1
+        :rtype: str
+        """
+
+        with open("/proc/self/mounts", "r") as mounts_fh:
+            for line in mounts_fh:
+                device, mount_point = line.split(" ", 2)[:2]
+                # Spaces and other special chars are escaped as octal in /proc/self/mounts
+                if RE_MOUNTS_ESCAPE.sub(lambda x: chr(int(x.group(1), 8)), mount_point) == mnt_point:
+                    return RE_MOUNTS_ESCAPE.sub(lambda x: chr(int(x.group(1), 8)), device)
+        raise AssertionError("mount_point %s does not seems to be mounted" % mnt_point)
+
     @staticmethod
     def find_mount_point(path: str) -> str:
         """
@@ -190,6 +717,82 @@ class NagiosArgumentParser(argparse.ArgumentParser):
         sys.exit(3)
 
 
+def parse_thresholds_file(path: str, warning: int, critical: int) -> List[CheckTarget]:
+    """
+    Parse per-path thresholds file
+
+    One path (or glob pattern) per line optionally followed by warning and critical percentages,
+    separated by spaces, empty lines and lines starting with # are ignored, e.g:
+
+    /srv/tenants/* 80 90
+
+    :param path: Path of thresholds file
+    :type path: str
+    :param warning: Warning threshold used when a line does not provide one
+    :type warning: int
+    :param critical: Critical threshold used when a line does not provide one
+    :type critical: int
+    :raises ValueError: If a line cannot be parsed
+    :return: List of paths to check along with their thresholds
+    :rtype: list
+    """
+
+    targets = []
+    with open(path, "r") as thresholds_fh:
+        for line_number, line in enumerate(thresholds_fh, start=1):
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            if len(fields) not in (1, 3):
+                raise ValueError("%s line %d: expected path [warning critical], got %r" % (path, line_number, line.strip()))
+            line_warning, line_critical = (int(fields[1]), int(fields[2])) if len(fields) == 3 else (warning, critical)
+            for matching in expand_path(fields[0]):
+                targets.append(CheckTarget(path=matching, warning=line_warning, critical=line_critical))
+    return targets
+
+
+def expand_path(path: str) -> List[str]:
+    """
+    Expand glob pattern into matching paths, paths without magic chars are returned as is
+
+    :param path: Path or glob pattern
+    :type path: str
+    :return: Matching paths, sorted
+    :rtype: list
+    """
+
+    if not glob.has_magic(path):
+        return [path]
+    return sorted(glob.glob(path))
+
+
+def load_path_index(db_file: str, volume_path: str) -> Dict[int, List[str]]:
+    """
+    Read project roots below a volume from a path index database (see ProjectPathIndex in xfs_prjquota.py)
+
+    :param db_file: SQLite database file, opened read-only
+    :type db_file: str
+    :param volume_path: Mount point of the volume
+    :type volume_path: str
+    :return: Dict with project id as key and sorted folder paths as value
+    :rtype: dict
+    """
+
+    import sqlite3  # pylint: disable=import-outside-toplevel # Only needed with --path-index, keep plugin start-up low
+    import urllib.parse  # pylint: disable=import-outside-toplevel
+
+    root = os.path.normpath(volume_path)
+    where, params = ("1", ()) if root == "/" else ("path = ? OR (path > ? AND path < ?)", (root, root + "/", root + "0"))
+    mapping: Dict[int, List[str]] = {}
+    conn = sqlite3.connect("file:%s?mode=ro" % urllib.parse.quote(db_file), uri=True)
+    try:
+        for path, proj_id in conn.execute("SELECT path, proj_id FROM paths WHERE %s ORDER BY path" % where, params):
+            mapping.setdefault(proj_id, []).append(path)
+    finally:
+        conn.close()
+    return mapping
+
+
 def parse_args() -> argparse.Namespace:
     """
     Parse command line arguments
@@ -199,37 +802,95 @@ def parse_args() -> argparse.Namespace:
     """
 
     argparser = NagiosArgumentParser(description=__doc__.strip())
-    argparser.add_argument("-P", "--path", type=str, required=True, metavar="/var/log", help="Patht to be checked")
+    argparser.add_argument("-P", "--path", type=str, action="append", default=[], metavar="/var/log", help="Patht to be checked, may be repeated or be a glob pattern")
+    argparser.add_argument("-G", "--glob", type=str, action="append", default=[], metavar="/srv/tenants/*", help="Glob pattern of paths to be checked, may be repeated")
+    argparser.add_argument("-T", "--thresholds-file", type=str, metavar="/etc/nagios/xfs_quota.conf", help="File with one path (or glob) per line followed by its warning and critical thresholds")
+    argparser.add_argument("-A", "--all-projects", action="store_true", help="Check every project having a limit on the volumes provided paths belong to")
+    argparser.add_argument("-I", "--path-index", type=str, default=None, metavar="/var/lib/xfs_prjquota/paths.sqlite", help="Path index database used to name folders of projects checked with --all-projects")
+    argparser.add_argument("-R", "--history-dir", type=str, default=None, metavar="/var/lib/check_xfs_proj_quota", help="Directory of per project usage history files, enables time to full forecast")
+    argparser.add_argument("--history-size", type=int, default=HISTORY_SIZE, metavar=str(HISTORY_SIZE), help="Number of samples kept per project, growth rate is computed over them")
+    argparser.add_argument("--warning-hours", type=float, default=None, metavar="48", help="Raise a warning if quota is forecast to be full within given hours")
+    argparser.add_argument("--critical-hours", type=float, default=None, metavar="12", help="Raise an error if quota is forecast to be full within given hours")
+    argparser.add_argument("-D", "--timings", action="store_true", help="Add time spent in xfs_quota, quotactl, IOCTL and parsing calls to perfdata")
     argparser.add_argument("-W", "--warning", type=int, default=75, metavar="75", help="Percentage of FDs use raising a warning")
     argparser.add_argument("-C", "--critical", type=int, default=85, metavar="85", help="Percentage of FDs use raising an error")
+    argparser.add_argument(
+        "-B", "--backend", type=str, default=BACKEND_XFS_QUOTA, choices=[BACKEND_XFS_QUOTA, BACKEND_QUOTACTL], help="How to query quota usage, forking xfs_quota or calling quotactl()"
+    )
     args = argparser.parse_args()
 
+    if not args.path and not args.glob and not args.thresholds_file:
+        argparser.error("At least one of --path, --glob or --thresholds-file is required")
+
     if args.warning > args.critical:
         argparser.error("Warning threshold cannot be greater than critical one")
 
     if args.warning < 0 or args.warning > 100 or args.critical < 0 or args.critical > 100:
         argparser.error("Warning/critical tresholds must be a percentage between and 100")
 
-    return args
+    if (args.warning_hours is not None or args.critical_hours is not None) and not args.history_dir:
+        argparser.error("--warning-hours and --critical-hours require --history-dir")
 
+    if args.warning_hours is not None and args.critical_hours is not None and args.warning_hours < args.critical_hours:
+        argparser.error("Warning hours threshold cannot be lower than critical one")
 
-def main(config: argparse.Namespace) -> None:  # pylint: disable=too-many-locals
-    """
-    Process everything
+    if args.history_size < HISTORY_MIN_SAMPLES:
+        argparser.error("History size must be at least %d samples" % HISTORY_MIN_SAMPLES)
 
-    :param config: argparse.Namespace instance representing command line arguments
-    :rtype config: argparse.Namespace
-    """
+    args.targets = [CheckTarget(path=x, warning=args.warning, critical=args.critical) for pattern in args.path + args.glob for x in expand_path(pattern)]
+    if args.thresholds_file:
+        try:
+            args.targets.extend(parse_thresholds_file(args.thresholds_file, args.warning, args.critical))
+        except (OSError, ValueError) as exc:
+            argparser.error("Unable to read thresholds file: %s" % exc)
+
+    # Same path matched many times, first thresholds win
+    unique_targets: Dict[str, CheckTarget] = {}
+    for target in args.targets:
+        unique_targets.setdefault(target.path, target)
+    args.targets = list(unique_targets.values())
+    if not args.targets:
+        argparser.error("No path matched provided patterns")
 
-    # Need to find mount point of the volume the path to be checked belongs to
-    volume_path = XfsProjQuotaCheck.find_mount_point(config.path)
-    xfs_proj_quota = XfsProjQuotaCheck(volume_path)
+    for target in args.targets:
+        if target.warning > target.critical or target.warning < 0 or target.critical > 100:
+            argparser.error("Invalid warning/critical tresholds for path %s" % target.path)
+
+    return args
 
-    # Then we get path project id and find matching XFS quota
-    project_id = xfs_proj_quota.get_proj_id_for_path(config.path)
-    quotas = xfs_proj_quota.list_proj_quota()
-    assert project_id in quotas, "No quotas have been found for project_id=%d, are you sure provided path %s has quota enabled ?" % (project_id, config.path)
-    quota = quotas[project_id]
+
+def evaluate(
+    label: str,
+    quota: ProjectQuota,
+    warning: int,
+    critical: int,
+    volume_path: str,
+    history: Optional[UsageHistory] = None,
+    warning_hours: Optional[float] = None,
+    critical_hours: Optional[float] = None,
+) -> CheckResult:  # pylint: disable=too-many-arguments,too-many-locals
+    """
+    Compare project quota usage against thresholds, inode usage is compared against the same thresholds if project has an inode limit
+
+    :param label: What is being checked, used in message and perfdata, e.g: path /var/log
+    :type label: str
+    :param quota: Project quota to check
+    :type quota: ProjectQuota
+    :param warning: Percentage of quota use raising a warning
+    :type warning: int
+    :param critical: Percentage of quota use raising an error
+    :type critical: int
+    :param volume_path: Mount point of the volume, its size is used when project has no limit
+    :type volume_path: str
+    :param history: Usage history of the project (current usage already appended), enables time to full forecast
+    :type history: UsageHistory, defaults to None
+    :param warning_hours: Raise a warning if limit is forecast to be reached within given hours, only used with history
+    :type warning_hours: float, defaults to None
+    :param critical_hours: Raise an error if limit is forecast to be reached within given hours, only used with history
+    :type critical_hours: float, defaults to None
+    :return: Nagios status, message and perfdata
+    :rtype: CheckResult
+    """
 
     # Use soft limit first, if unset uses hard
     used = quota.used
@@ -246,50 +907,245 @@ def main(config: argparse.Namespace) -> None:  # pylint: disable=too-many-locals
     used_percent = int(round(used * 100 / limit))
 
     # Provide human readable size for state message
-    used_human = xfs_proj_quota.sizeof_fmt(used)
-    limit_human = xfs_proj_quota.sizeof_fmt(limit)
+    used_human = XfsProjQuotaCheck.sizeof_fmt(used)
+    limit_human = XfsProjQuotaCheck.sizeof_fmt(limit)
 
     # Compute Nagios perfdata for capacity planning
-    warning_bytes = config.warning * limit / 100
-    critical_bytes = config.critical * limit / 100
+    warning_bytes = warning * limit / 100
+    critical_bytes = critical * limit / 100
     perfdata = [
-        "used_percent=%d%%;%d;%d;0;100" % (used_percent, config.warning, config.critical),
-        "used_bytes=%dB;%d;%d;%d;%d" % (used, warning_bytes, critical_bytes, 0, limit),
+        PerfData("used_percent", "%d%%;%d;%d;0;100" % (used_percent, warning, critical)),
+        PerfData("used_bytes", "%dB;%d;%d;%d;%d" % (used, warning_bytes, critical_bytes, 0, limit)),
     ]
 
     # Verify thresholds
-    if used_percent > config.critical:
-        message = "CRITICAL: Quota used %d%% (%s/%s) for path %s is above critical %d%% limit%s" % (
-            used_percent,
-            used_human,
-            limit_human,
-            config.path,
-            config.critical,
-            " (WARNING: No quota configured)" if not quota_found else "",
-        )
+    if used_percent > critical:
+        message = "Quota used %d%% (%s/%s) for %s is above critical %d%% limit" % (used_percent, used_human, limit_human, label, critical)
         code = 2
-    elif used_percent > config.warning:
-        message = "WARNING: Quota used %d%% (%s/%s) for path %s is above warning %d%% limit%s" % (
-            used_percent,
-            used_human,
-            limit_human,
-            config.path,
-            config.warning,
-            " (WARNING: No quota configured)" if not quota_found else "",
-        )
+    elif used_percent > warning:
+        message = "Quota used %d%% (%s/%s) for %s is above warning %d%% limit" % (used_percent, used_human, limit_human, label, warning)
         code = 1
     else:
-        message = "OK: Quota used %d%% (%s/%s) for path %s is below warning %d%% limit%s" % (
-            used_percent,
-            used_human,
-            limit_human,
-            config.path,
-            config.warning,
-            " (WARNING: No quota configured)" if not quota_found else "",
-        )
+        message = "Quota used %d%% (%s/%s) for %s is below warning %d%% limit" % (used_percent, used_human, limit_human, label, warning)
         code = 0
+    summary = "%s %d%%" % (label, used_percent)
+
+    # Inodes are only checked against an inode limit, same report gave their usage so there is no extra call
+    inode_limit = quota.isoft if quota.isoft != 0 else quota.ihard
+    if inode_limit != 0:
+        inodes_percent = int(round(quota.iused * 100 / inode_limit))
+        perfdata.append(PerfData("used_inodes_percent", "%d%%;%d;%d;0;100" % (inodes_percent, warning, critical)))
+        perfdata.append(PerfData("used_inodes", "%d;%d;%d;%d;%d" % (quota.iused, warning * inode_limit / 100, critical * inode_limit / 100, 0, inode_limit)))
+        inodes_code = 2 if inodes_percent > critical else 1 if inodes_percent > warning else 0
+        message += ", inodes used %d%% (%d/%d)" % (inodes_percent, quota.iused, inode_limit)
+        if inodes_code:
+            message += " which is above %s %d%% limit" % ("critical" if inodes_code == 2 else "warning", critical if inodes_code == 2 else warning)
+            summary += " inodes %d%%" % inodes_percent
+            code = max(code, inodes_code)
+
+    # Forecast when limit will be reached at current growth rate, U is Nagios undetermined perfdata value
+    # Thresholds use "N:" range syntax (alert below N seconds), a bare N would mean alert above it
+    if history is not None:
+        growth_rate = history.growth_rate()
+        time_to_full = max(limit - used, 0) / growth_rate if growth_rate is not None and growth_rate > 0 else None
+        perfdata.append(
+            PerfData(
+                "time_to_full",
+                "%s;%s;%s;0;"
+                % (
+                    "%ds" % time_to_full if time_to_full is not None else "U",
+                    "%d:" % (warning_hours * 3600) if warning_hours is not None else "",
+                    "%d:" % (critical_hours * 3600) if critical_hours is not None else "",
+                ),
+            )
+        )
+        if time_to_full is not None:
+            hours = time_to_full / 3600
+            forecast_code, limit_hours = 0, 0.0
+            if critical_hours is not None and hours < critical_hours:
+                forecast_code, limit_hours = 2, critical_hours
+            elif warning_hours is not None and hours < warning_hours:
+                forecast_code, limit_hours = 1, warning_hours
+            message += ", full in %.1f hours at current growth rate (%s/hour)" % (hours, XfsProjQuotaCheck.sizeof_fmt(growth_rate * 3600))  # type: ignore
+            if forecast_code:
+                message += " which is below %s %g hours limit" % ("critical" if forecast_code == 2 else "warning", limit_hours)
+                summary += " full in %.1fh" % hours
+                code = max(code, forecast_code)
+
+    no_quota = " (WARNING: No quota configured)" if not quota_found and inode_limit == 0 else ""
+    return CheckResult(code=code, label=label, message="%s: %s%s" % (NAGIOS_STATES[code], message, no_quota), summary=summary, perfdata=perfdata)
+
+
+def record_usage(history_dir: str, history_size: int, volume_path: str, quota: ProjectQuota, instrument: Optional[Callable[[CallTiming], None]] = None) -> UsageHistory:  # pylint: disable=too-many-arguments
+    """
+    Open usage history of a project and append its current usage
+
+    :param history_dir: Directory of history files
+    :type history_dir: str
+    :param history_size: Number of samples kept per project
+    :type history_size: int
+    :param volume_path: Mount point of the volume
+    :type volume_path: str
+    :param quota: Current project quota
+    :type quota: ProjectQuota
+    :param instrument: Callback receiving a CallTiming for history update, see XfsProjQuotaCheck
+    :type instrument: callable, defaults to None
+    :return: History of the project, to be closed
+    :rtype: UsageHistory
+    """
+
+    start = time.perf_counter()
+    history = UsageHistory(os.path.join(history_dir, UsageHistory.file_name(volume_path, quota.proj_id)), history_size)
+    history.append(time.time(), quota.used)
+    if instrument is not None:
+        instrument(CallTiming("history", "append", time.perf_counter() - start, 0, None))
+    return history
+
+
+def check_targets(config: argparse.Namespace, instrument: Optional[Callable[[CallTiming], None]] = None) -> List[CheckResult]:
+    """
+    Check every target path, fetching only one quota report per volume
+
+    :param config: argparse.Namespace instance representing command line arguments
+    :rtype config: argparse.Namespace
+    :param instrument: Callback receiving a CallTiming for every system call, see XfsProjQuotaCheck
+    :type instrument: callable, defaults to None
+    :return: One result per path (per project with --all-projects)
+    :rtype: list
+    """
+
+    # Group paths by volume so each volume report is fetched once
+    by_volume: Dict[str, List[CheckTarget]] = {}
+    for target in config.targets:
+        by_volume.setdefault(XfsProjQuotaCheck.find_mount_point(target.path), []).append(target)
+
+    if config.history_dir:
+        os.makedirs(config.history_dir, exist_ok=True)
+
+    results = []
+    for volume_path, targets in by_volume.items():
+        results.extend(check_volume(config, volume_path, targets, instrument=instrument))
+
+    return results
+
+
+def check_volume(config: argparse.Namespace, volume_path: str, targets: List[CheckTarget], instrument: Optional[Callable[[CallTiming], None]] = None) -> List[CheckResult]:  # pylint: disable=too-many-locals
+    """
+    Check target paths of a single volume (every project with --all-projects)
+
+    :param config: argparse.Namespace instance representing command line arguments
+    :rtype config: argparse.Namespace
+    :param volume_path: Mount point of the volume
+    :type volume_path: str
+    :param targets: Paths to check, belonging to this volume
+    :type targets: list
+    :param instrument: Callback receiving a CallTiming for every system call, see XfsProjQuotaCheck
+    :type instrument: callable, defaults to None
+    :return: One result per path (per project with --all-projects)
+    :rtype: list
+    """
+
+    # Project ids whose usage has been appended to history during this run
+    recorded: Set[int] = set()
+
+    def evaluate_quota(label: str, quota: ProjectQuota, warning: int, critical: int) -> CheckResult:
+        if not config.history_dir:
+            return evaluate(label, quota, warning, critical, volume_path, warning_hours=config.warning_hours, critical_hours=config.critical_hours)
+        # Many paths may belong to the same project, record its usage once and only reopen history afterwards
+        if quota.proj_id in recorded:
+            history = UsageHistory(os.path.join(config.history_dir, UsageHistory.file_name(volume_path, quota.proj_id)), config.history_size)
+        else:
+            history = record_usage(config.history_dir, config.history_size, volume_path, quota, instrument=instrument)
+            recorded.add(quota.proj_id)
+        # Close history (and release its lock) right away instead of keeping one open per project until the end
+        try:
+            return evaluate(label, quota, warning, critical, volume_path, history=history, warning_hours=config.warning_hours, critical_hours=config.critical_hours)
+        finally:
+            history.close()
+
+    results = []
+    xfs_proj_quota = XfsProjQuotaCheck(volume_path, backend=config.backend, instrument=instrument)
+
+    if config.all_projects:
+        proj_paths = load_path_index(config.path_index, volume_path) if config.path_index else {}
+        for proj_id, quota in sorted(xfs_proj_quota.list_proj_quota().items()):
+            if quota.soft or quota.hard or quota.isoft or quota.ihard:
+                paths = " (%s)" % ", ".join(proj_paths[proj_id]) if proj_id in proj_paths else ""
+                results.append(evaluate_quota("project %d%s on %s" % (proj_id, paths, volume_path), quota, config.warning, config.critical))
+        return results
+
+    # Only query projects of checked paths, not the whole volume
+    project_ids: Dict[CheckTarget, Union[int, Exception]] = {}
+    for target in targets:
+        try:
+            project_ids[target] = xfs_proj_quota.get_proj_id_for_path(target.path)
+        except (AssertionError, OSError) as exc:
+            project_ids[target] = exc
+    quotas = xfs_proj_quota.get_proj_quotas(x for x in project_ids.values() if isinstance(x, int))
+
+    for target in targets:
+        label = "path %s" % target.path
+        project_id = project_ids[target]
+        try:
+            if isinstance(project_id, Exception):
+                raise project_id
+            assert project_id in quotas, "No quotas have been found for project_id=%d, are you sure provided path %s has quota enabled ?" % (project_id, target.path)
+        except (AssertionError, OSError) as exc:
+            if len(config.targets) == 1:
+                raise
+            results.append(CheckResult(code=3, label=label, message="UNKNOWN: %s: %s" % (label, exc), summary="%s unknown" % label, perfdata=[]))
+            continue
+        results.append(evaluate_quota(label, quotas[project_id], target.warning, target.critical))
+
+    return results
+
+
+def aggregate(results: List[CheckResult]) -> Tuple[int, str]:
+    """
+    Build a single Nagios status line out of many results, exit code is the worst one
+
+    :param results: Results to aggregate
+    :type results: list
+    :return: Nagios exit code and status line with perfdata
+    :rtype: tuple
+    """
+
+    if len(results) == 1:
+        result = results[0]
+        return result.code, "%s|%s" % (result.message, " ".join("%s=%s" % (x.name, x.value) for x in result.perfdata))
+
+    # UNKNOWN is worse than WARNING but not than CRITICAL
+    code = max((x.code for x in results), key=lambda x: NAGIOS_SEVERITY[x], default=3)
+    counts = ["%d %s" % (len([x for x in results if x.code == state]), NAGIOS_STATES[state]) for state in (2, 1, 3, 0)]
+    details = ["%s: %s" % (NAGIOS_STATES[state], ", ".join(x.summary for x in results if x.code == state)) for state in (2, 1, 3) if any(x.code == state for x in results)]
+    message = "%s: %s out of %d checked%s" % (NAGIOS_STATES[code], ", ".join(counts), len(results), " (%s)" % "; ".join(details) if details else "")
+    perfdata = ["'%s %s'=%s" % (result.label.replace("'", "''"), x.name, x.value) for result in results for x in result.perfdata]
+
+    return code, "%s|%s" % (message, " ".join(perfdata))
+
+
+def main(config: argparse.Namespace) -> None:
+    """
+    Process everything
+
+    :param config: argparse.Namespace instance representing command line arguments
+    :rtype config: argparse.Namespace
+    """
+
+    timings: List[CallTiming] = []
+    results = check_targets(config, instrument=timings.append if config.timings else None)
+    if not results:
+        print("UNKNOWN: No project with quota found")
+        sys.exit(3)
 
-    print("%s|%s" % (message, " ".join(perfdata)))
+    code, output = aggregate(results)
+    if timings:
+        totals: Dict[str, float] = {}
+        for timing in timings:
+            key = "%s_%s_seconds" % (timing.kind, timing.name.lower())
+            totals[key] = totals.get(key, 0.0) + timing.duration
+        output += " " + " ".join("%s=%.6fs" % x for x in sorted(totals.items()))
+    print(output)
     sys.exit(code)
 
 
@@ -1,6 +1,6 @@
 /*
 
-Resolve constants value (as hex) from linux/fs.h
+Resolve constants value (as hex) from linux/fs.h, linux/quota.h and linux/dqblk_xfs.h
 
 Please `apt install linux-libc-dev libc6-dev` if you don't have the file
 
@@ -11,10 +11,17 @@ And run `./resolve-ioctl-val`
 */
 
 #include <linux/fs.h>
+#include <linux/quota.h>
+#include <linux/dqblk_xfs.h>
 #include <stdio.h>
 
 void main() {
   printf("FS_IOC_FSGETXATTR: 0x%x\n", FS_IOC_FSGETXATTR);
   printf("FS_IOC_FSSETXATTR: 0x%x\n", FS_IOC_FSSETXATTR);
   printf("FS_XFLAG_PROJINHERIT: 0x%x\n", FS_XFLAG_PROJINHERIT);
+  printf("Q_XGETQUOTA: 0x%x\n", Q_XGETQUOTA);
+  printf("Q_XGETNEXTQUOTA: 0x%x\n", Q_XGETNEXTQUOTA);
+  printf("Q_XSETQLIM: 0x%x\n", Q_XSETQLIM);
+  printf("PRJQUOTA: 0x%x\n", PRJQUOTA);
+  printf("sizeof(struct fs_disk_quota): %zu\n", sizeof(struct fs_disk_quota));
 }
@@ -5,120 +5,4462 @@
 Class to handle XFS filesystems project (folder) quota in Python
 
 Could be easily ported to Ext4 as it uses FS_IOC_FSGETXATTR/FS_IOC_FSSETXATTR IOCTL to assign project id to folder
-But it currently relies on xfs_quota binary to assign quota to a project and report usage but this could probably done
-by calling another binary or figure out which IOCTL to send to do that but that's too much work atm for me
+It relies on xfs_quota binary to assign quota to a project and report usage by default, but both can also be
+done by calling quotactl() directly (Q_XGETNEXTQUOTA/Q_XSETQLIM) to avoid forking and parsing xfs_quota output
 
-TODO: Implement async API for asyncio usage
+AsyncXfsPrjQuota provides the same API as coroutines for asyncio usage
 
-Be careful, as the class relies on xfs_quota shell calls it cannot be considered as thread/process safe
+Individual calls are not serialized: allocating an id and setting limits with separate calls may race with other
+threads or processes, use create_quota_dir/release_quota_dir (or provisioning_lock) which run as one transaction
+under a per filesystem flock()
 """
 
 
 import re
 import os
+import json
+import time
+import heapq
+import bisect
+import asyncio
+import functools
+import contextlib
 import array
+import errno
 import fcntl
+import ctypes
+import ctypes.util
+import select
 import shutil
+import sqlite3
 import logging
+import selectors
 import pathlib
+import threading
 import subprocess
-from typing import Union, Optional, NamedTuple, Dict
+import concurrent.futures
+from typing import Union, Optional, NamedTuple, Dict, Iterator, AsyncIterator, Iterable, List, Set, Tuple, Sequence, Callable, Any, Literal, overload
 
 import psutil  # type: ignore
 
+try:
+    import numpy  # type: ignore
+except ImportError:  # pragma: no cover
+    numpy = None  # pylint: disable=invalid-name
+
 #: Hex value of IOCTL to get extended attributes (see resolve-ioctl-val.c for more details)
 FS_IOC_FSGETXATTR = 0x801C581F
 
-#: Hex value of IOCTL to set extended attributes (see resolve-ioctl-val.c for more details)
-FS_IOC_FSSETXATTR = 0x401C5820
+#: Hex value of IOCTL to set extended attributes (see resolve-ioctl-val.c for more details)
+FS_IOC_FSSETXATTR = 0x401C5820
+
+#: Hex value for fsx_xflags attr of struct fsxattr to set project id inheritance
+FS_XFLAG_PROJINHERIT = 0x200
+
+#: Hex value of quotactl command to get quota of a given id (see resolve-ioctl-val.c for more details)
+Q_XGETQUOTA = 0x5803
+
+#: Hex value of quotactl command to get quota of the next id having one (see resolve-ioctl-val.c for more details)
+Q_XGETNEXTQUOTA = 0x5809
+
+#: Hex value of quotactl command to set quota limits of a given id (see resolve-ioctl-val.c for more details)
+Q_XSETQLIM = 0x5804
+
+#: Value of quotactl quota type for project quotas (see resolve-ioctl-val.c for more details)
+PRJQUOTA = 2
+
+#: Version of fs_disk_quota struct expected by the kernel
+FS_DQUOT_VERSION = 1
+
+#: Hex value for d_flags attr of struct fs_disk_quota for project quotas
+FS_PROJ_QUOTA = 0x2
+
+#: Hex value for d_fieldmask attr of struct fs_disk_quota to set inode soft limit
+FS_DQ_ISOFT = 0x1
+
+#: Hex value for d_fieldmask attr of struct fs_disk_quota to set inode hard limit
+FS_DQ_IHARD = 0x2
+
+#: Hex value for d_fieldmask attr of struct fs_disk_quota to set block soft limit
+FS_DQ_BSOFT = 0x4
+
+#: Hex value for d_fieldmask attr of struct fs_disk_quota to set block hard limit
+FS_DQ_BHARD = 0x8
+
+#: Size in bytes of the basic blocks used by XFS to account quotas in fs_disk_quota struct
+XFS_BB_SIZE = 512
+
+#: Greatest project id (project ids are 32 bits unsigned integers, -1 being reserved)
+PROJECT_ID_MAX = 0xFFFFFFFE
+
+#: Backend name to query quotas by calling xfs_quota binary
+BACKEND_XFS_QUOTA = "xfs_quota"
+
+#: Backend name to query quotas by calling quotactl() directly
+BACKEND_QUOTACTL = "quotactl"
+
+#: Maximum number of xfs_quota -c commands chained in a single process, keeps command line below ARG_MAX
+XFS_QUOTA_MAX_BATCH_COMMANDS = 10000
+
+#: xfs_quota command reporting project quotas: -p project quota, -b blocks, -i inodes, -n numeric project id, -N hide header
+XFS_QUOTA_REPORT_COMMAND = "report -p -b -i -n -N"
+
+#: xfs_quota command querying a single project quota, same columns as XFS_QUOTA_REPORT_COMMAND
+XFS_QUOTA_QUOTA_COMMAND = "quota -p -b -i -n -N %d"
+
+#: Prompt printed by interactive xfs_quota before reading each command
+XFS_QUOTA_PROMPT = b"xfs_quota> "
+
+#: Unknown command sent after every XfsQuotaSession request, xfs_quota error about it marks the end of the response
+XFS_QUOTA_SENTINEL = "__xfs_prjquota_end_%d__"
+
+#: Directories tried in order for create_quota_dir/release_quota_dir lock files, first writable one is used
+PROVISIONING_LOCK_DIRS = ("/run/lock", "/tmp")
+
+#: Size of random token written at the start of lock file by every provisioning, tells whether someone else provisioned since
+PROVISIONING_GENERATION_SIZE = 16
+
+#: Value of "format" key in export_snapshot header line
+SNAPSHOT_FORMAT = "python-xfs-quota-snapshot"
+
+#: Version of export_snapshot file layout, restore_snapshot refuses newer versions
+SNAPSHOT_VERSION = 2
+
+#: RE matcher for octal escaped chars in /proc/self/mountinfo entries
+RE_MOUNTS_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+#: Size of buffer used to read xfs_quota stdout when streaming report
+XFS_QUOTA_READ_BUFFER_SIZE = 256 * 1024
+
+#: RE matcher for inode columns following block ones when xfs_quota is given -i, optional so block only output still parses
+RE_QUOTA_INODES = r"(?:\s+(?P<iused>[0-9]+)\s+(?P<isoft>[0-9]+)\s+(?P<ihard>[0-9]+)\s+(?P<iwarn>[0-9]+)\s+\[(?P<igrace>[^\]]+)\])?"
+
+#: RE matcher for xfs_quota report entries
+RE_QUOTA_REPORT = re.compile(r"^#(?P<proj_id>[0-9]+)\s+(?P<used>[0-9]+)\s+(?P<soft>[0-9]+)\s+(?P<hard>[0-9]+)\s+(?P<warn>[0-9]+)\s+\[(?P<grace>[^\]]+)\]" + RE_QUOTA_INODES + "$")
+
+#: RE matcher for xfs_quota quota command output, device name may be wrapped on its own line when too long
+RE_QUOTA_OUTPUT = re.compile(r"^\S+\s+(?P<used>[0-9]+)\s+(?P<soft>[0-9]+)\s+(?P<hard>[0-9]+)\s+(?P<warn>[0-9]+)\s+\[(?P<grace>[^\]]+)\]" + RE_QUOTA_INODES)
+
+#: Raw grace fields (brackets and line ending included) already decoded by report parser, they only have a few distinct values
+GRACE_STRINGS: Dict[bytes, str] = {}
+
+#: Maximum number of entries kept in GRACE_STRINGS
+GRACE_STRINGS_MAX = 1024
+
+#: RE matcher for xfs_quota report entries, working on raw bytes
+RE_QUOTA_REPORT_BYTES = re.compile(RE_QUOTA_REPORT.pattern.encode("utf-8"))
+
+#: Quotactl command names, used as CallTiming name
+QUOTACTL_COMMAND_NAMES = {Q_XGETQUOTA: "Q_XGETQUOTA", Q_XGETNEXTQUOTA: "Q_XGETNEXTQUOTA", Q_XSETQLIM: "Q_XSETQLIM"}
+
+#: QuotaWatcher level of a project below warning threshold (or without limit)
+QUOTA_LEVEL_OK = "ok"
+
+#: QuotaWatcher level of a project above warning threshold
+QUOTA_LEVEL_WARNING = "warning"
+
+#: QuotaWatcher level of a project above critical threshold
+QUOTA_LEVEL_CRITICAL = "critical"
+
+#: Default upper bounds in seconds of TimingRegistry histogram buckets
+TIMING_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class ProjectQuota(NamedTuple):
+    """
+    NamedTuple representing quota usage for a given project id
+
+    used/soft/hard are in bytes, iused/isoft/ihard are inode counts (left to 0 by block only xfs_quota output)
+    """
+
+    proj_id: int
+    used: int
+    soft: int
+    hard: int
+    warn: int
+    grace: str
+    iused: int = 0
+    isoft: int = 0
+    ihard: int = 0
+    iwarn: int = 0
+    igrace: str = "--------"
+
+
+class QuotaEvent(NamedTuple):
+    """
+    NamedTuple representing a project quota change detected by QuotaWatcher
+
+    previous is None for a project showing up in report and current is None for a project no longer in it,
+    levels are QUOTA_LEVEL_OK, QUOTA_LEVEL_WARNING or QUOTA_LEVEL_CRITICAL
+    """
+
+    proj_id: int
+    previous: Optional[ProjectQuota]
+    current: Optional[ProjectQuota]
+    previous_level: str
+    level: str
+
+    @staticmethod
+    def in_grace(quota: Optional[ProjectQuota]) -> bool:
+        """
+        True if block or inode soft limit grace timer of given project is running (or expired)
+        """
+
+        return quota is not None and bool(quota.grace.strip("-") or quota.igrace.strip("-"))
+
+    @property
+    def usage_changed(self) -> bool:
+        """
+        True if used bytes or used inodes changed
+        """
+
+        previous, current = self.previous, self.current
+        return (previous.used if previous else 0, previous.iused if previous else 0) != (current.used if current else 0, current.iused if current else 0)
+
+    @property
+    def threshold_crossed(self) -> bool:
+        """
+        True if level changed, in any direction
+        """
+
+        return self.level != self.previous_level
+
+    @property
+    def grace_entered(self) -> bool:
+        """
+        True if soft limit grace timer started
+        """
+
+        return not self.in_grace(self.previous) and self.in_grace(self.current)
+
+    @property
+    def grace_left(self) -> bool:
+        """
+        True if soft limit grace timer stopped
+        """
+
+        return self.in_grace(self.previous) and not self.in_grace(self.current)
+
+
+class QuotaLimits(NamedTuple):
+    """
+    NamedTuple representing limits to be applied to a given project id
+
+    soft/hard are in bytes and None means no limit, isoft/ihard None means leave inode limit unchanged
+    """
+
+    soft: Optional[int] = None
+    hard: Optional[int] = None
+    isoft: Optional[int] = None
+    ihard: Optional[int] = None
+
+
+class BatchResult(NamedTuple):
+    """
+    NamedTuple representing outcome of a batch of limits applied with set_quotas_for_proj_ids
+    """
+
+    succeeded: List[int]
+    failed: Dict[int, str]
+
+
+class RestoreResult(NamedTuple):
+    """
+    NamedTuple representing outcome of restore_snapshot
+
+    limits holds projects whose limits had to be changed, tagged/tag_failed folders whose project id had to be changed
+    """
+
+    limits: BatchResult
+    limits_unchanged: int
+    tagged: List[str]
+    tags_unchanged: int
+    tag_failed: Dict[str, str]
+
+
+class PathProjId(NamedTuple):
+    """
+    NamedTuple representing project id and fsxattr flags of a path
+    """
+
+    proj_id: int
+    xflags: int
+
+
+class TreeProgress(NamedTuple):
+    """
+    NamedTuple representing progress of set_proj_id_for_tree
+    """
+
+    scanned: int
+    changed: int
+    skipped: int
+    errors: int
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        """
+        Scanned inodes per second
+        """
+
+        return self.scanned / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class AuditMismatch(NamedTuple):
+    """
+    NamedTuple representing an inode found by audit_project below the audited tree but not charged to the audited project
+
+    allocated is in bytes (st_blocks * 512)
+    """
+
+    path: str
+    proj_id: int
+    allocated: int
+
+
+class AuditResult(NamedTuple):
+    """
+    NamedTuple representing outcome of audit_project, bytes are allocated bytes (st_blocks * 512) and hardlinks are counted once
+
+    mismatches holds at most max_mismatches entries while mismatch_count and mismatch_bytes account all of them,
+    quota_used is None if project has no quota
+    """
+
+    proj_id: int
+    scanned: int
+    charged: int
+    charged_bytes: int
+    mismatches: List[AuditMismatch]
+    mismatch_count: int
+    mismatch_bytes: int
+    hardlinks: int
+    errors: int
+    quota_used: Optional[int]
+    elapsed: float
+
+    @property
+    def delta(self) -> int:
+        """
+        Bytes charged to project by quota report but not found in the tree (negative if tree holds more than reported),
+        non-zero values come from project inodes outside the tree, hardlinks to outside or deleted but still open files
+        """
+
+        return (self.quota_used or 0) - self.charged_bytes
+
+
+class CallTiming(NamedTuple):
+    """
+    NamedTuple representing one instrumented call, passed to instrument callback
+
+    kind is one of subprocess, session, parse, ioctl, quotactl, psutil or lock and name tells which call it was
+    (e.g: report, FSGETXATTR, Q_XGETQUOTA, disk_usage). size is stdout length in bytes for subprocess and session calls,
+    number of parsed entries for parse calls and struct size for quotactl calls (0 otherwise)
+    error is None if call succeeded
+    """
+
+    kind: str
+    name: str
+    duration: float
+    size: int
+    error: Optional[str]
+
+
+class FsDiskQuota(ctypes.Structure):  # pylint: disable=too-few-public-methods
+    """
+    ctypes mapping of fs_disk_quota struct used by XFS quotactl commands (see linux/dqblk_xfs.h)
+
+    Block values are expressed in 512 bytes basic blocks
+    """
+
+    _fields_ = [
+        ("d_version", ctypes.c_int8),
+        ("d_flags", ctypes.c_int8),
+        ("d_fieldmask", ctypes.c_uint16),
+        ("d_id", ctypes.c_uint32),
+        ("d_blk_hardlimit", ctypes.c_uint64),
+        ("d_blk_softlimit", ctypes.c_uint64),
+        ("d_ino_hardlimit", ctypes.c_uint64),
+        ("d_ino_softlimit", ctypes.c_uint64),
+        ("d_bcount", ctypes.c_uint64),
+        ("d_icount", ctypes.c_uint64),
+        ("d_itimer", ctypes.c_int32),
+        ("d_btimer", ctypes.c_int32),
+        ("d_iwarns", ctypes.c_uint16),
+        ("d_bwarns", ctypes.c_uint16),
+        ("d_itimer_hi", ctypes.c_int8),
+        ("d_btimer_hi", ctypes.c_int8),
+        ("d_rtbtimer_hi", ctypes.c_int8),
+        ("d_padding2", ctypes.c_int8),
+        ("d_rtb_hardlimit", ctypes.c_uint64),
+        ("d_rtb_softlimit", ctypes.c_uint64),
+        ("d_rtbcount", ctypes.c_uint64),
+        ("d_rtbtimer", ctypes.c_int32),
+        ("d_rtbwarns", ctypes.c_uint16),
+        ("d_padding3", ctypes.c_int16),
+        ("d_padding4", ctypes.c_char * 8),
+    ]
+
+
+#: libc handle used to call quotactl()
+LIBC = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+LIBC.quotactl.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_void_p]
+LIBC.quotactl.restype = ctypes.c_int
+
+
+def qcmd(cmd: int, quota_type: int) -> int:
+    """
+    Python version of QCMD macro from linux/quota.h
+
+    :param cmd: Quotactl command, e.g: Q_XGETQUOTA
+    :type cmd: int
+    :param quota_type: Quota type, e.g: PRJQUOTA
+    :type quota_type: int
+    :returns: Value to be passed as quotactl() cmd parameter
+    :rtype: int
+    """
+
+    return (cmd << 8) | (quota_type & 0x00FF)
+
+
+@contextlib.contextmanager
+def profile_calls(output: Optional[str] = None, sort: str = "cumulative", limit: int = 30) -> Iterator[Any]:
+    """
+    Context manager running enclosed code under cProfile
+
+    Stats are dumped to output file (to be loaded with pstats or snakeviz) or logged at info level
+
+    :param output: File to dump stats to, None to log the most expensive calls
+    :type output: str, defaults to None
+    :param sort: pstats sort key used when logging
+    :type sort: str, defaults to cumulative
+    :param limit: Number of calls logged
+    :type limit: int, defaults to 30
+    :returns: cProfile.Profile instance
+    :rtype: iterator
+    """
+
+    import io  # pylint: disable=import-outside-toplevel
+    import pstats  # pylint: disable=import-outside-toplevel
+    import cProfile  # pylint: disable=import-outside-toplevel
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output is not None:
+            profiler.dump_stats(output)
+        else:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+            logging.getLogger("profile_calls").info("Profiling results:\n%s", stream.getvalue())
+
+
+class _SharedDirFd:
+    """
+    Directory fd shared by its pending subdirectories, closed once each of them has been opened relative to it
+
+    :param fd: Directory fd
+    :type fd: int
+    :param refs: Number of subdirectories still to be opened
+    :type refs: int
+    """
+
+    def __init__(self, fd: int, refs: int) -> None:
+        self.fd = fd
+        self.refs = refs
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        """
+        Drop one reference, close fd when it was the last one
+        """
+
+        with self._lock:
+            self.refs -= 1
+            last = self.refs == 0
+        if last:
+            os.close(self.fd)
+
+
+def parallel_walk(
+    root: str,
+    visit: Callable[[int, str, "os.DirEntry[str]"], None],
+    workers: int = 8,
+    skip_files: Optional[Callable[[str], bool]] = None,
+    dir_done: Optional[Callable[[str], None]] = None,
+    on_error: Optional[Callable[[str, OSError], None]] = None,
+) -> None:  # pylint: disable=too-many-arguments
+    """
+    Walk a directory tree with a pool of threads, opening every entry relative to its parent directory fd
+
+    Directories are processed depth-first from a shared stack so pending work stays bounded by tree depth and fanout,
+    symlinks and special files (devices, fifos, sockets) are skipped, the root directory itself is not visited
+
+    :param root: Absolute path of directory to walk
+    :type root: str
+    :param visit: Called from worker threads with (fd opened on entry, parent directory path, os.DirEntry), fd is closed afterwards
+    :type visit: callable
+    :param workers: Number of threads
+    :type workers: int, defaults to 8
+    :param skip_files: Called with a directory path, return True to skip visiting its non directory entries
+    :type skip_files: callable, defaults to None
+    :param dir_done: Called with a directory path once all its entries have been visited, not called if it could not be listed
+    :type dir_done: callable, defaults to None
+    :param on_error: Called with (path, exception) when a directory cannot be opened or listed or an entry cannot be opened or visited, errors are raised by default
+    :type on_error: callable, defaults to None
+    """
+
+    assert isinstance(workers, int) and workers > 0, "workers parameter must be a positive integer"
+
+    pending: List[Tuple[Optional[_SharedDirFd], str, str]] = [(None, root, root)]
+    active = 0
+    failure: List[BaseException] = []
+    cond = threading.Condition()
+
+    def process_dir(parent: Optional[_SharedDirFd], name: str, dir_path: str) -> None:
+        try:
+            try:
+                dir_fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=None if parent is None else parent.fd)
+            finally:
+                if parent is not None:
+                    parent.release()
+            try:
+                with os.scandir(dir_fd) as scan:
+                    entries = list(scan)
+            except BaseException:
+                os.close(dir_fd)
+                raise
+        except OSError as exc:
+            if on_error is None:
+                raise
+            on_error(dir_path, exc)
+            return
+
+        skip = skip_files is not None and skip_files(dir_path)
+        subdirs = []
+        try:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if not is_dir and (skip or not entry.is_file(follow_symlinks=False)):
+                        continue
+                    entry_fd = os.open(entry.name, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_NOCTTY, dir_fd=dir_fd)
+                    try:
+                        visit(entry_fd, dir_path, entry)
+                    finally:
+                        os.close(entry_fd)
+                except OSError as exc:
+                    if on_error is None:
+                        raise
+                    on_error(os.path.join(dir_path, entry.name), exc)
+                    continue
+                if is_dir:
+                    subdirs.append(entry.name)
+        except BaseException:
+            os.close(dir_fd)
+            raise
+
+        # Subdirectories are opened relative to this directory, its fd stays open until all of them are
+        shared_fd = _SharedDirFd(dir_fd, len(subdirs)) if subdirs else None
+        if shared_fd is None:
+            os.close(dir_fd)
+        if dir_done is not None:
+            dir_done(dir_path)
+        with cond:
+            pending.extend((shared_fd, x, os.path.join(dir_path, x)) for x in subdirs)
+            cond.notify_all()
+
+    def worker() -> None:
+        nonlocal active
+        while True:
+            with cond:
+                while not pending and active and not failure:
+                    cond.wait()
+                if failure or (not pending and not active):
+                    cond.notify_all()
+                    return
+                item = pending.pop()
+                active += 1
+            try:
+                process_dir(*item)
+            except BaseException as exc:  # pylint: disable=broad-except
+                with cond:
+                    failure.append(exc)
+            finally:
+                with cond:
+                    active -= 1
+                    cond.notify_all()
+
+    threads = [threading.Thread(target=worker, name="parallel_walk-%d" % x, daemon=True) for x in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Walk aborted on failure, release parent fds of subdirectories that were never processed
+    for parent, _, _ in pending:
+        if parent is not None:
+            parent.release()
+
+    if failure:
+        raise failure[0]
+
+
+class XfsPrjQuotaNoSpace(Exception):
+    """
+    Raised when requested quota cannot be fulfilled
+
+    :param message: Exception error message
+    :type message: str
+    :param max_available_bytes: Maximum available bytes on this storage
+    :type max_available_bytes: int
+    """
+
+    def __init__(self, message: str, max_available_bytes: int) -> None:
+        super().__init__(message)
+        self.max_available_bytes = max_available_bytes
+
+
+class XfsPrjQuotaNoProjectId(Exception):
+    """
+    Raised when no more project id can be allocated in configured range
+    """
+
+
+class XfsPrjQuotaQuotactlError(subprocess.CalledProcessError, OSError):
+    """
+    Raised when a quotactl() call failed
+
+    Subclass of subprocess.CalledProcessError, just like a failed xfs_quota command of the other backend, so callers
+    do not need to change when switching backend, and of OSError with errno set to the quotactl() error
+
+    :param err: Error number set by quotactl()
+    :type err: int
+    :param cmd: Quotactl command name and arguments
+    :type cmd: list
+    :param message: Exception error message
+    :type message: str
+    """
+
+    def __init__(self, err: int, cmd: List[str], message: str) -> None:
+        subprocess.CalledProcessError.__init__(self, -1, cmd)
+        self.args = (err, message)
+        self.errno = err
+        self.strerror = os.strerror(err)
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.message
+
+
+class XfsQuotaSessionError(Exception):
+    """
+    Raised when xfs_quota session process died and could not be restarted
+    """
+
+
+class ProjectIdAllocator:
+    """
+    Allocate project ids without querying quota report each time
+
+    Ids greater or equal to next_id have never been allocated, ids lower than it are only handed out again once
+    released (or found unused by from_used_ids). Free ids are kept as sorted disjoint ranges, so memory and state
+    file size grow with the number of free ranges whatever the size of the id space, and lookups are O(log n)
+
+    State can be persisted to a JSON file (written atomically after each change) so a restart does not need a report
+
+    :param min_id: Lowest project id that can be allocated (0 is the default project and cannot be allocated)
+    :type min_id: int, defaults to 1
+    :param max_id: Greatest project id that can be allocated
+    :type max_id: int, defaults to PROJECT_ID_MAX
+    :param state_file: Path of JSON file to persist allocator state to, None to keep it in memory only
+    :type state_file: str or pathlib.Path, defaults to None
+    """
+
+    #: Version of state file format, version 1 files (free ids listed one by one) are still loaded
+    STATE_VERSION = 2
+
+    def __init__(self, min_id: int = 1, max_id: int = PROJECT_ID_MAX, state_file: Optional[Union[str, pathlib.Path]] = None) -> None:
+
+        assert isinstance(min_id, int) and min_id > 0, "min_id parameter must be a positive integer"
+        assert isinstance(max_id, int) and min_id <= max_id <= PROJECT_ID_MAX, "max_id parameter must be an integer between min_id and %d" % PROJECT_ID_MAX
+        assert state_file is None or isinstance(state_file, (str, pathlib.Path)), "state_file parameter must be a string (or pathlib.Path) or None"
+
+        self.min_id = min_id
+        self.max_id = max_id
+        self.state_file = pathlib.Path(state_file) if isinstance(state_file, str) else state_file
+
+        #: Lowest project id never allocated
+        self.next_id = min_id
+        # Free ranges below next_id, first and last id (inclusive) of range i are _free_starts[i] and _free_ends[i]
+        self._free_starts: List[int] = []
+        self._free_ends: List[int] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_used_ids(cls, used_ids: Iterable[int], min_id: int = 1, max_id: int = PROJECT_ID_MAX, state_file: Optional[Union[str, pathlib.Path]] = None) -> "ProjectIdAllocator":
+        """
+        Build allocator from project ids currently in use, usually taken from a quota report
+
+        Unused ids lower than greatest used one are free ranges, so they are handed out first
+
+        :param used_ids: Project ids in use
+        :type used_ids: iterable
+        :returns: Allocator handing out unused ids below greatest used one first, then greater ones (within range)
+        :rtype: ProjectIdAllocator
+        """
+
+        allocator = cls(min_id=min_id, max_id=max_id, state_file=state_file)
+        previous = min_id - 1
+        for proj_id in sorted({x for x in used_ids if min_id <= x <= max_id}):
+            if proj_id > previous + 1:
+                allocator._free_starts.append(previous + 1)
+                allocator._free_ends.append(proj_id - 1)
+            previous = proj_id
+        allocator.next_id = previous + 1
+        allocator.save()
+        return allocator
+
+    @classmethod
+    def load(cls, state_file: Union[str, pathlib.Path]) -> "ProjectIdAllocator":
+        """
+        Build allocator from a state file written by a previous instance
+
+        :param state_file: Path of JSON file allocator state was persisted to
+        :type state_file: str or pathlib.Path
+        :raises AssertionError: If state file cannot be understood
+        :returns: Allocator in the same state as when it was saved
+        :rtype: ProjectIdAllocator
+        """
+
+        with open(state_file, "r") as state_fh:
+            state = json.load(state_fh)
+        assert state.get("version") in (1, cls.STATE_VERSION), "unsupported allocator state file version in %s" % state_file
+
+        allocator = cls(min_id=state["min_id"], max_id=state["max_id"], state_file=state_file)
+        allocator.next_id = state["next_id"]
+        if state["version"] == 1:
+            for proj_id in sorted(state["free"]):
+                if allocator._free_ends and allocator._free_ends[-1] == proj_id - 1:
+                    allocator._free_ends[-1] = proj_id
+                else:
+                    allocator._free_starts.append(proj_id)
+                    allocator._free_ends.append(proj_id)
+        else:
+            allocator._free_starts = [x[0] for x in state["free"]]
+            allocator._free_ends = [x[1] for x in state["free"]]
+        return allocator
+
+    def save(self) -> None:
+        """
+        Atomically persist allocator state to state_file (if any)
+        """
+
+        if self.state_file is None:
+            return
+
+        state = {"version": self.STATE_VERSION, "min_id": self.min_id, "max_id": self.max_id, "next_id": self.next_id, "free": list(zip(self._free_starts, self._free_ends))}
+        tmp_file = self.state_file.with_name(self.state_file.name + ".tmp")
+        with open(tmp_file, "w") as state_fh:
+            json.dump(state, state_fh)
+            state_fh.flush()
+            os.fsync(state_fh.fileno())
+        os.replace(tmp_file, self.state_file)
+
+    def _free_range_index(self, proj_id: int) -> int:
+        """
+        Find free range containing given project id
+
+        :param proj_id: Project id to look for
+        :type proj_id: int
+        :returns: Index of range in _free_starts/_free_ends, -1 if project id is not free
+        :rtype: int
+        """
+
+        idx = bisect.bisect_right(self._free_starts, proj_id) - 1
+        return idx if idx >= 0 and self._free_ends[idx] >= proj_id else -1
+
+    def allocate(self) -> int:
+        """
+        Hand out a free project id, lowest released one first
+
+        :raises XfsPrjQuotaNoProjectId: If every project id in range is in use
+        :returns: Project id that can be assigned
+        :rtype: int
+        """
+
+        with self._lock:
+            proj_id = self._peek()
+            if self._free_starts:
+                if self._free_starts[0] == self._free_ends[0]:
+                    del self._free_starts[0], self._free_ends[0]
+                else:
+                    self._free_starts[0] += 1
+            else:
+                self.next_id += 1
+            self.save()
+        return proj_id
+
+    def peek(self) -> int:
+        """
+        Tell which project id allocate would hand out, without allocating it
+
+        :raises XfsPrjQuotaNoProjectId: If every project id in range is in use
+        :returns: Project id allocate would return
+        :rtype: int
+        """
+
+        with self._lock:
+            return self._peek()
+
+    def _peek(self) -> int:
+        """
+        Lock free version of peek, see peek method instead
+        """
+
+        if self._free_starts:
+            return self._free_starts[0]
+        if self.next_id > self.max_id:
+            raise XfsPrjQuotaNoProjectId("No more project id available between %d and %d" % (self.min_id, self.max_id))
+        return self.next_id
+
+    def release(self, proj_id: int) -> None:
+        """
+        Give back a project id so it can be allocated again
+
+        :param proj_id: Project id no longer in use
+        :type proj_id: int
+        """
+
+        assert isinstance(proj_id, int) and proj_id >= 0, "proj_id parameter must be a positive or zero integer"
+
+        with self._lock:
+            if not self.min_id <= proj_id < self.next_id:
+                return
+            idx = bisect.bisect_right(self._free_starts, proj_id)
+            if idx > 0 and self._free_ends[idx - 1] >= proj_id:  # Already free
+                return
+            # Merge with adjacent free ranges so their number stays minimal
+            join_previous = idx > 0 and self._free_ends[idx - 1] == proj_id - 1
+            join_next = idx < len(self._free_starts) and self._free_starts[idx] == proj_id + 1
+            if join_previous and join_next:
+                self._free_ends[idx - 1] = self._free_ends[idx]
+                del self._free_starts[idx], self._free_ends[idx]
+            elif join_previous:
+                self._free_ends[idx - 1] = proj_id
+            elif join_next:
+                self._free_starts[idx] = proj_id
+            else:
+                self._free_starts.insert(idx, proj_id)
+                self._free_ends.insert(idx, proj_id)
+            self.save()
+
+    def mark_used(self, proj_id: int) -> None:
+        """
+        Record a project id has been assigned without calling allocate (e.g: chosen by caller)
+
+        Never allocated ids skipped by a project id greater than next_id become free
+
+        :param proj_id: Project id now in use
+        :type proj_id: int
+        """
+
+        assert isinstance(proj_id, int) and proj_id >= 0, "proj_id parameter must be a positive or zero integer"
+
+        with self._lock:
+            idx = self._free_range_index(proj_id)
+            if idx >= 0:
+                start, end = self._free_starts[idx], self._free_ends[idx]
+                if start == end:
+                    del self._free_starts[idx], self._free_ends[idx]
+                elif proj_id == start:
+                    self._free_starts[idx] = proj_id + 1
+                elif proj_id == end:
+                    self._free_ends[idx] = proj_id - 1
+                else:
+                    self._free_ends[idx] = proj_id - 1
+                    self._free_starts.insert(idx + 1, proj_id + 1)
+                    self._free_ends.insert(idx + 1, end)
+            elif self.min_id <= proj_id <= self.max_id and proj_id >= self.next_id:
+                if proj_id > self.next_id:
+                    self._free_starts.append(self.next_id)
+                    self._free_ends.append(proj_id - 1)
+                self.next_id = proj_id + 1
+            else:
+                return
+            self.save()
+
+
+class ReservationLedger:
+    """
+    Keep track of space reserved by project quotas (max of soft and hard limit of each project)
+
+    Built once from a quota report then updated as a delta whenever a limit changes, so admission checks
+    are O(1) instead of summing the whole report
+
+    Reservation of a project replaces its previous one, i.e: growing a 10GiB project to 15GiB only needs 5GiB
+
+    :param mnt_point: Filesystem mount point free space is checked for
+    :type mnt_point: str or pathlib.Path
+    :param reservations: Dict with project id as key and reserved bytes as value
+    :type reservations: dict, defaults to None
+    :param overcommit_ratio: Allow reserving free space multiplied by this ratio (1.0 means no overcommit)
+    :type overcommit_ratio: float, defaults to 1.0
+    """
+
+    def __init__(self, mnt_point: Union[str, pathlib.Path], reservations: Optional[Dict[int, int]] = None, overcommit_ratio: float = 1.0) -> None:
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        assert isinstance(overcommit_ratio, (int, float)) and overcommit_ratio > 0, "overcommit_ratio parameter must be a positive number"
+
+        self.mnt_point = mnt_point
+        self.overcommit_ratio = overcommit_ratio
+        self.reservations: Dict[int, int] = {k: v for k, v in (reservations or {}).items() if v}
+        self.total_reserved = sum(self.reservations.values())
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_report(cls, mnt_point: Union[str, pathlib.Path], quotas: Dict[int, ProjectQuota], overcommit_ratio: float = 1.0) -> "ReservationLedger":
+        """
+        Build ledger from a quota report
+
+        :param mnt_point: Filesystem mount point free space is checked for
+        :type mnt_point: str or pathlib.Path
+        :param quotas: Quota report, as returned by XfsPrjQuota.list_proj_quota
+        :type quotas: dict
+        :param overcommit_ratio: Allow reserving free space multiplied by this ratio (1.0 means no overcommit)
+        :type overcommit_ratio: float, defaults to 1.0
+        :returns: Ledger holding current reservations
+        :rtype: ReservationLedger
+        """
+
+        return cls(mnt_point, {k: max(v.soft, v.hard) for k, v in quotas.items()}, overcommit_ratio=overcommit_ratio)
+
+    def update(self, proj_id: int, soft: int, hard: int) -> None:
+        """
+        Record new limits of a project
+
+        :param proj_id: Project id whose limits changed
+        :type proj_id: int
+        :param soft: New soft limit in bytes (0 means no limit)
+        :type soft: int
+        :param hard: New hard limit in bytes (0 means no limit)
+        :type hard: int
+        """
+
+        reserved = max(soft, hard)
+        with self._lock:
+            self.total_reserved += reserved - self.reservations.get(proj_id, 0)
+            if reserved:
+                self.reservations[proj_id] = reserved
+            else:
+                self.reservations.pop(proj_id, None)
+
+    def available(self, free_space: Optional[int] = None) -> int:
+        """
+        Compute space that can still be reserved
+
+        :param free_space: Free space on mnt_point in bytes, None to query it
+        :type free_space: int, defaults to None
+        :returns: Available non reserved bytes (may be negative if already overbooked)
+        :rtype: int
+        """
+
+        if free_space is None:
+            free_space = psutil.disk_usage(self.mnt_point).free
+        return int(free_space * self.overcommit_ratio) - self.total_reserved
+
+    def requested(self, limits: Dict[int, QuotaLimits]) -> int:
+        """
+        Compute additional bytes needed to apply given limits, current reservation of these projects being replaced
+
+        :param limits: Dict with project id as key and QuotaLimits as value
+        :type limits: dict
+        :returns: Additional bytes to reserve (may be negative when shrinking)
+        :rtype: int
+        """
+
+        return sum([max(x.soft or 0, x.hard or 0) - self.reservations.get(k, 0) for k, x in limits.items()])
+
+    def can_reserve(self, soft: int, hard: int, proj_id: Optional[int] = None, free_space: Optional[int] = None) -> bool:
+        """
+        Dry-run reservation: tell whether given limits could be set, without raising nor reserving anything
+
+        :param soft: Soft limit in bytes (0 means no limit)
+        :type soft: int
+        :param hard: Hard limit in bytes (0 means no limit)
+        :type hard: int
+        :param proj_id: Project id the limits are for, its current reservation is replaced, None for a new project
+        :type proj_id: int, defaults to None
+        :param free_space: Free space on mnt_point in bytes, None to query it (pass it when calling in a tight loop)
+        :type free_space: int, defaults to None
+        :returns: True if limits fit in non reserved space
+        :rtype: bool
+        """
+
+        current = self.reservations.get(proj_id, 0) if proj_id is not None else 0
+        return max(soft, hard) - current <= self.available(free_space)
+
+    def raise_not_enough_space(self, soft: int, hard: int, proj_id: Optional[int] = None, free_space: Optional[int] = None) -> None:
+        """
+        Raise exception if given limits cannot be fulfilled, soft and hard are checked in a single call
+
+        :param soft: Soft limit in bytes (0 means no limit)
+        :type soft: int
+        :param hard: Hard limit in bytes (0 means no limit)
+        :type hard: int
+        :param proj_id: Project id the limits are for, its current reservation is replaced, None for a new project
+        :type proj_id: int, defaults to None
+        :param free_space: Free space on mnt_point in bytes, None to query it
+        :type free_space: int, defaults to None
+        :raises XfsPrjQuotaNoSpace: If requested limits exceed available non reserved space
+        """
+
+        current = self.reservations.get(proj_id, 0) if proj_id is not None else 0
+        self._raise_if_above(max(soft, hard) - current, self.available(free_space))
+
+    def raise_not_enough_space_for_batch(self, limits: Dict[int, QuotaLimits], free_space: Optional[int] = None) -> None:
+        """
+        Raise exception if the whole batch of limits cannot be fulfilled
+
+        :param limits: Dict with project id as key and QuotaLimits as value
+        :type limits: dict
+        :param free_space: Free space on mnt_point in bytes, None to query it
+        :type free_space: int, defaults to None
+        :raises XfsPrjQuotaNoSpace: If requested limits exceed available non reserved space
+        """
+
+        self._raise_if_above(self.requested(limits), self.available(free_space))
+
+    def _raise_if_above(self, requested: int, available_space: int) -> None:
+        """
+        Raise exception if requested bytes exceed available ones
+
+        :param requested: Bytes to reserve
+        :type requested: int
+        :param available_space: Available non reserved bytes
+        :type available_space: int
+        :raises XfsPrjQuotaNoSpace: If requested exceed available_space
+        """
+
+        if requested > available_space:
+            err_msg = "Cannot allocate %d more bytes quota, max available is %d bytes" % (requested, available_space)
+            self.logger.error(err_msg)
+            raise XfsPrjQuotaNoSpace(err_msg, max_available_bytes=available_space)
+
+
+class ProjectPathIndex:
+    """
+    Persistent reverse index of folders project ids are assigned to, stored in a SQLite database
+
+    Only project roots are indexed (folders whose project id differs from their parent one), so the index size
+    follows the number of projects, not files. Both directions are a single B-tree lookup: path to project id through
+    primary key, project id to paths through a secondary index
+
+    Kept up to date by XfsPrjQuota instances created with path_index, rebuilt from scratch with a parallel tree walk
+    by XfsPrjQuota.rebuild_path_index. Can be shared by threads and processes (SQLite locking with WAL journal)
+
+    :param db_file: SQLite database file, created if missing
+    :type db_file: str or pathlib.Path
+    """
+
+    #: Version of database schema, stored as SQLite user_version
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_file: Union[str, pathlib.Path]) -> None:
+
+        assert isinstance(db_file, (str, pathlib.Path)) and str(db_file), "db_file parameter must be a non-empty string (or pathlib.Path)"
+        self.db_file = pathlib.Path(db_file) if isinstance(db_file, str) else db_file
+
+        self._lock = threading.Lock()
+        # Autocommit mode, multi statements changes are wrapped in explicit transactions
+        self._conn = sqlite3.connect(str(self.db_file), timeout=30.0, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            assert version in (0, self.SCHEMA_VERSION), "unsupported path index schema version %d in %s" % (version, self.db_file)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS paths (path TEXT PRIMARY KEY, proj_id INTEGER NOT NULL) WITHOUT ROWID")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS paths_proj_id ON paths (proj_id)")
+            self._conn.execute("PRAGMA user_version=%d" % self.SCHEMA_VERSION)
+
+    def close(self) -> None:
+        """
+        Close database, instance must not be used anymore afterwards
+        """
+
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _normalize(path: Union[str, pathlib.Path]) -> str:
+        """
+        Normalize path without resolving symlinks, so the same folder is always stored the same way
+
+        :param path: Absolute path
+        :type path: str or pathlib.Path
+        :returns: Normalized path
+        :rtype: str
+        """
+
+        assert isinstance(path, (str, pathlib.Path)) and str(path).startswith("/"), "path parameter must be a string (or pathlib.Path) starting with /"
+        return os.path.normpath(str(path))
+
+    @staticmethod
+    def _subtree_where(root: str) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Build SQL condition matching root and every path below it, as a primary key range scan
+
+        :param root: Normalized root path
+        :type root: str
+        :returns: Condition and its parameters
+        :rtype: tuple
+        """
+
+        if root == "/":
+            return "1", ()
+        # "0" is the character right after "/", LIKE would need escaping of % and _ found in paths
+        return "path = ? OR (path > ? AND path < ?)", (root, root + "/", root + "0")
+
+    def set(self, path: Union[str, pathlib.Path], proj_id: int) -> None:
+        """
+        Record project id assigned to a folder, 0 removes it from index
+
+        :param path: Folder path
+        :type path: str or pathlib.Path
+        :param proj_id: Project id assigned to it
+        :type proj_id: int
+        """
+
+        assert isinstance(proj_id, int) and proj_id >= 0, "proj_id parameter must be a positive or zero integer"
+
+        path = self._normalize(path)
+        with self._lock:
+            if proj_id:
+                self._conn.execute("INSERT OR REPLACE INTO paths (path, proj_id) VALUES (?, ?)", (path, proj_id))
+            else:
+                self._conn.execute("DELETE FROM paths WHERE path = ?", (path,))
+
+    def replace_tree(self, root: Union[str, pathlib.Path], entries: Dict[str, int]) -> None:
+        """
+        Replace every indexed folder below root (root included) by given entries, in a single transaction
+
+        :param root: Root of the tree
+        :type root: str or pathlib.Path
+        :param entries: Dict with folder path (below root) as key and project id as value
+        :type entries: dict
+        """
+
+        root = self._normalize(root)
+        where, params = self._subtree_where(root)
+        rows = [(self._normalize(k), v) for k, v in entries.items() if v]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM paths WHERE " + where, params)
+                self._conn.executemany("INSERT OR REPLACE INTO paths (path, proj_id) VALUES (?, ?)", rows)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def get(self, path: Union[str, pathlib.Path]) -> Optional[int]:
+        """
+        Get project id recorded for a folder
+
+        :param path: Folder path
+        :type path: str or pathlib.Path
+        :returns: Project id or None if folder is not a project root
+        :rtype: int
+        """
+
+        with self._lock:
+            row = self._conn.execute("SELECT proj_id FROM paths WHERE path = ?", (self._normalize(path),)).fetchone()
+        return row[0] if row is not None else None
+
+    def paths(self, proj_id: int) -> List[str]:
+        """
+        Get folders a project id is assigned to
+
+        :param proj_id: Project id
+        :type proj_id: int
+        :returns: Sorted folder paths, empty if project is unknown
+        :rtype: list
+        """
+
+        with self._lock:
+            return [x[0] for x in self._conn.execute("SELECT path FROM paths WHERE proj_id = ? ORDER BY path", (proj_id,))]
+
+    def project_root(self, path: Union[str, pathlib.Path]) -> Optional[Tuple[str, int]]:
+        """
+        Find closest indexed folder containing given path, i.e: the project root it belongs to
+
+        :param path: Any path
+        :type path: str or pathlib.Path
+        :returns: Tuple of project root path and project id, None if no parent folder is indexed
+        :rtype: tuple
+        """
+
+        current = self._normalize(path)
+        with self._lock:
+            while True:
+                row = self._conn.execute("SELECT proj_id FROM paths WHERE path = ?", (current,)).fetchone()
+                if row is not None:
+                    return current, row[0]
+                if current == "/":
+                    return None
+                current = os.path.dirname(current)
+
+    def mapping(self, root: Union[str, pathlib.Path] = "/") -> Dict[int, List[str]]:
+        """
+        Get every indexed folder below root, grouped by project id
+
+        :param root: Only return folders below this path (e.g: a mount point)
+        :type root: str or pathlib.Path, defaults to /
+        :returns: Dict with project id as key and sorted folder paths as value
+        :rtype: dict
+        """
+
+        where, params = self._subtree_where(self._normalize(root))
+        mapping: Dict[int, List[str]] = {}
+        with self._lock:
+            for path, proj_id in self._conn.execute("SELECT path, proj_id FROM paths WHERE %s ORDER BY path" % where, params):
+                mapping.setdefault(proj_id, []).append(path)
+        return mapping
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM paths").fetchone()[0]
+
+
+class QuotaTable:
+    """
+    Compact columnar representation of a quota report, for bulk analytics on huge project counts
+
+    Each field is stored in its own array.array column (a few dozens of bytes per project instead of hundreds
+    for a dict of ProjectQuota), grace strings are stored once and referenced by index. Aggregation helpers are
+    vectorised with NumPy when installed (arrays are shared without copy), plain Python loops are used otherwise
+
+    Lookup by project id stays O(1) through a hash index
+    """
+
+    def __init__(self) -> None:
+        self.proj_ids = array.array("I")
+        self.used = array.array("Q")
+        self.soft = array.array("Q")
+        self.hard = array.array("Q")
+        self.warn = array.array("I")
+        self.grace = array.array("H")
+        self.iused = array.array("Q")
+        self.isoft = array.array("Q")
+        self.ihard = array.array("Q")
+        self.iwarn = array.array("I")
+        self.igrace = array.array("H")
+
+        #: Distinct grace strings, grace and igrace columns hold index in this list
+        self.grace_values: List[str] = []
+        self._grace_index: Dict[str, int] = {}
+        self._index: Dict[int, int] = {}
+
+    @classmethod
+    def from_quotas(cls, quotas: Iterable[ProjectQuota]) -> "QuotaTable":
+        """
+        Build table from ProjectQuota items, e.g: list_proj_quota().values() or iter_proj_quota()
+
+        :param quotas: Iterable of ProjectQuota namedtuples
+        :type quotas: iterable
+        :returns: Table holding all provided project quotas
+        :rtype: QuotaTable
+        """
+
+        table = cls()
+        for quota in quotas:
+            table.append(quota)
+        return table
+
+    def append(self, quota: ProjectQuota) -> None:
+        """
+        Add (or replace) one project quota
+
+        :param quota: Project quota to store
+        :type quota: ProjectQuota
+        """
+
+        grace_idx = self._grace_index.get(quota.grace)
+        if grace_idx is None:
+            grace_idx = self._grace_index[quota.grace] = len(self.grace_values)
+            self.grace_values.append(quota.grace)
+        igrace_idx = self._grace_index.get(quota.igrace)
+        if igrace_idx is None:
+            igrace_idx = self._grace_index[quota.igrace] = len(self.grace_values)
+            self.grace_values.append(quota.igrace)
+
+        row = self._index.get(quota.proj_id)
+        if row is not None:
+            self.used[row], self.soft[row], self.hard[row], self.warn[row], self.grace[row] = quota.used, quota.soft, quota.hard, quota.warn, grace_idx
+            self.iused[row], self.isoft[row], self.ihard[row], self.iwarn[row], self.igrace[row] = quota.iused, quota.isoft, quota.ihard, quota.iwarn, igrace_idx
+            return
+
+        self._index[quota.proj_id] = len(self.proj_ids)
+        self.proj_ids.append(quota.proj_id)
+        self.used.append(quota.used)
+        self.soft.append(quota.soft)
+        self.hard.append(quota.hard)
+        self.warn.append(quota.warn)
+        self.grace.append(grace_idx)
+        self.iused.append(quota.iused)
+        self.isoft.append(quota.isoft)
+        self.ihard.append(quota.ihard)
+        self.iwarn.append(quota.iwarn)
+        self.igrace.append(igrace_idx)
+
+    def _row(self, row: int) -> ProjectQuota:
+        """
+        Rebuild ProjectQuota namedtuple from a row
+
+        :param row: Row number
+        :type row: int
+        :returns: Project quota stored at this row
+        :rtype: ProjectQuota
+        """
+
+        grace_values = self.grace_values
+        return ProjectQuota(
+            self.proj_ids[row],
+            self.used[row],
+            self.soft[row],
+            self.hard[row],
+            self.warn[row],
+            grace_values[self.grace[row]],
+            self.iused[row],
+            self.isoft[row],
+            self.ihard[row],
+            self.iwarn[row],
+            grace_values[self.igrace[row]],
+        )
+
+    def __len__(self) -> int:
+        return len(self.proj_ids)
+
+    def __contains__(self, proj_id: object) -> bool:
+        return proj_id in self._index
+
+    def __getitem__(self, proj_id: int) -> ProjectQuota:
+        return self._row(self._index[proj_id])
+
+    def __iter__(self) -> Iterator[ProjectQuota]:
+        for row in range(len(self.proj_ids)):
+            yield self._row(row)
+
+    def get(self, proj_id: int, default: Optional[ProjectQuota] = None) -> Optional[ProjectQuota]:
+        """
+        Get quota of given project id
+
+        :param proj_id: Project id to look for
+        :type proj_id: int
+        :param default: Returned if project id is not in table
+        :type default: ProjectQuota, defaults to None
+        :returns: Project quota or default
+        :rtype: ProjectQuota
+        """
+
+        row = self._index.get(proj_id)
+        return default if row is None else self._row(row)
+
+    def to_dict(self) -> Dict[int, ProjectQuota]:
+        """
+        Convert table into the dict returned by XfsPrjQuota.list_proj_quota
+
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
+
+        return {x.proj_id: x for x in self}
+
+    def total_reserved(self) -> int:
+        """
+        Sum of space reserved by all projects (max of soft and hard limit of each project)
+
+        :returns: Reserved bytes
+        :rtype: int
+        """
+
+        if numpy is not None:
+            return int(numpy.maximum(numpy.frombuffer(self.soft, dtype=numpy.uint64), numpy.frombuffer(self.hard, dtype=numpy.uint64)).sum())
+        return sum(map(max, self.soft, self.hard))
+
+    def usage_ratios(self, inodes: bool = False) -> Sequence[float]:
+        """
+        Used space ratio of each row, against soft limit or hard one if soft is unset (0.0 when there is no limit)
+
+        :param inodes: Compute used inodes ratio against inode limits instead
+        :type inodes: bool, defaults to False
+        :returns: Ratios in rows order (numpy.ndarray if NumPy is installed, array.array otherwise)
+        :rtype: sequence
+        """
+
+        used_col, soft_col, hard_col = (self.iused, self.isoft, self.ihard) if inodes else (self.used, self.soft, self.hard)
+
+        if numpy is not None:
+            used = numpy.frombuffer(used_col, dtype=numpy.uint64).astype(numpy.float64)
+            soft = numpy.frombuffer(soft_col, dtype=numpy.uint64)
+            limit = numpy.where(soft != 0, soft, numpy.frombuffer(hard_col, dtype=numpy.uint64)).astype(numpy.float64)
+            ratios = numpy.zeros(len(self), dtype=numpy.float64)
+            numpy.divide(used, limit, out=ratios, where=limit != 0)
+            return ratios
+
+        return array.array("d", [used / limit if limit else 0.0 for used, limit in zip(used_col, map(lambda x, y: x or y, soft_col, hard_col))])
+
+    def over(self, percent: float, inodes: bool = False) -> List[int]:
+        """
+        Find projects using more than given percentage of their limit
+
+        :param percent: Usage percentage threshold, e.g: 85
+        :type percent: float
+        :param inodes: Compare used inodes with inode limits instead of used space with block limits
+        :type inodes: bool, defaults to False
+        :returns: Matching project ids
+        :rtype: list
+        """
+
+        ratio = percent / 100
+        ratios = self.usage_ratios(inodes)
+        if numpy is not None:
+            return numpy.frombuffer(self.proj_ids, dtype=numpy.uint32)[ratios > ratio].tolist()  # type: ignore
+        return [proj_id for proj_id, x in zip(self.proj_ids, ratios) if x > ratio]
+
+    def top_n(self, count: int, column: str = "used") -> List[ProjectQuota]:
+        """
+        Find projects with greatest value for given column
+
+        :param count: Number of projects to return
+        :type count: int
+        :param column: Column to sort on, used, soft, hard, warn, iused, isoft, ihard or iwarn
+        :type column: str, defaults to used
+        :returns: Project quotas, greatest first
+        :rtype: list
+        """
+
+        assert column in ("used", "soft", "hard", "warn", "iused", "isoft", "ihard", "iwarn"), "column parameter must be one of used, soft, hard, warn, iused, isoft, ihard or iwarn"
+        values = getattr(self, column)
+        count = min(count, len(self))
+        if count <= 0:
+            return []
+
+        if numpy is not None:
+            as_numpy = numpy.frombuffer(values, dtype=numpy.uint64 if values.typecode == "Q" else numpy.uint32)
+            rows = numpy.argpartition(as_numpy, -count)[-count:]
+            rows = rows[numpy.argsort(as_numpy[rows], kind="stable")[::-1]]
+            return [self._row(int(x)) for x in rows]
+        return [self._row(x) for x in heapq.nlargest(count, range(len(values)), key=values.__getitem__)]
+
+
+class TimingRegistry:
+    """
+    Histogram registry to be used as XfsPrjQuota instrument callback
+
+    Calls are aggregated by (kind, name): count, errors, total duration and output size plus a cumulative
+    duration histogram, so percentiles can be estimated and exported to a monitoring system
+
+    :param buckets: Upper bounds in seconds of histogram buckets, an infinite bucket is always added
+    :type buckets: tuple, defaults to TIMING_BUCKETS
+    """
+
+    def __init__(self, buckets: Sequence[float] = TIMING_BUCKETS) -> None:
+
+        assert list(buckets) == sorted(buckets) and buckets, "buckets parameter must be a non-empty sorted sequence"
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, timing: CallTiming) -> None:
+        """
+        Record one call, thread safe
+
+        :param timing: Call to record
+        :type timing: CallTiming
+        """
+
+        key = (timing.kind, timing.name)
+        with self._lock:
+            stat = self.stats.get(key)
+            if stat is None:
+                stat = self.stats[key] = {"count": 0, "errors": 0, "duration": 0.0, "size": 0, "max": 0.0, "buckets": [0] * len(self.buckets)}
+            stat["count"] += 1
+            stat["errors"] += timing.error is not None
+            stat["duration"] += timing.duration
+            stat["size"] += timing.size
+            stat["max"] = max(stat["max"], timing.duration)
+            for index, bound in enumerate(self.buckets):
+                if timing.duration <= bound:
+                    stat["buckets"][index] += 1
+                    break
+
+    def percentile(self, kind: str, name: str, percent: float) -> float:
+        """
+        Estimate duration percentile of given call from histogram (upper bound of the bucket it falls in)
+
+        :param kind: Call kind, e.g: subprocess
+        :type kind: str
+        :param name: Call name, e.g: report
+        :type name: str
+        :param percent: Percentile to estimate, between 0 and 100
+        :type percent: float
+        :returns: Duration in seconds, max recorded duration if it falls in infinite bucket, 0 if never called
+        :rtype: float
+        """
+
+        with self._lock:
+            stat = self.stats.get((kind, name))
+            return 0.0 if stat is None else self._percentile(stat, percent)
+
+    def _percentile(self, stat: Dict[str, Any], percent: float) -> float:
+        """
+        Estimate duration percentile from histogram of one call, see percentile method instead
+
+        Must be called with lock held
+
+        :param stat: Recorded stats of the call
+        :type stat: dict
+        :param percent: Percentile to estimate, between 0 and 100
+        :type percent: float
+        :returns: Duration in seconds
+        :rtype: float
+        """
+
+        threshold = stat["count"] * percent / 100
+        seen = 0
+        for bound, count in zip(self.buckets, stat["buckets"]):
+            seen += count
+            if seen >= threshold and count:
+                return min(bound, stat["max"])
+        return stat["max"]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summarize recorded calls
+
+        :returns: Dict with kind:name as key and count, errors, total/mean/p50/p99/max duration and size as value
+        :rtype: dict
+        """
+
+        # Built under lock so every entry is consistent with itself even while calls are being recorded
+        summary = {}
+        with self._lock:
+            for (kind, name), stat in sorted(self.stats.items()):
+                summary["%s:%s" % (kind, name)] = {
+                    "count": stat["count"],
+                    "errors": stat["errors"],
+                    "total": stat["duration"],
+                    "mean": stat["duration"] / stat["count"],
+                    "p50": self._percentile(stat, 50),
+                    "p99": self._percentile(stat, 99),
+                    "max": stat["max"],
+                    "size": stat["size"],
+                }
+        return summary
+
+    def reset(self) -> None:
+        """
+        Forget every recorded call
+        """
+
+        with self._lock:
+            self.stats = {}
+
+
+class XfsQuotaSession:
+    """
+    Keep one interactive xfs_quota -x process alive for a mount point and send it commands over stdin
+
+    Saves a fork, an exec and xfs_quota start-up (mount table parsing, device opening) on every call.
+    Interactive xfs_quota flushes stdout before reading each command, stderr is merged into stdout and every request
+    is followed by an unknown sentinel command: the "command ... not found" error it triggers marks the end of the response
+
+    Concurrent callers are serialised with a lock. A dead process is started again on next request and a request
+    interrupted because the process died is sent once more to the new one, xfs_quota report and limit commands being idempotent
+
+    :param xfs_quota: Path to xfs_quota executable
+    :type xfs_quota: str
+    :param mnt_point: Filesystem mount point commands apply to
+    :type mnt_point: str or pathlib.Path
+    :param timeout: Maximum seconds to wait for a response, process is killed when reached
+    :type timeout: float, defaults to 30.0
+    """
+
+    def __init__(self, xfs_quota: str, mnt_point: Union[str, pathlib.Path], timeout: float = 30.0) -> None:
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        assert isinstance(xfs_quota, str) and xfs_quota, "xfs_quota parameter must be a non-empty string"
+        self.xfs_quota = xfs_quota
+
+        assert isinstance(mnt_point, (str, pathlib.Path)) and str(mnt_point).startswith("/"), "mount_point parameter must be a non-emtpy string (or pathlib.Path) starting with /"
+        self.mnt_point = str(mnt_point)
+
+        assert isinstance(timeout, (int, float)) and timeout > 0, "timeout parameter must be a positive number"
+        self.timeout = timeout
+
+        #: Number of xfs_quota processes started so far
+        self.starts = 0
+
+        self._process: Optional["subprocess.Popen[bytes]"] = None
+        self._buffer = bytearray()
+        self._sentinels = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "XfsQuotaSession":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    @property
+    def running(self) -> bool:
+        """
+        True if xfs_quota process is started and alive
+        """
+
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> None:
+        """
+        Start xfs_quota process now instead of on first request, does nothing if already running
+
+        :raises XfsQuotaSessionError: If xfs_quota exited right after being started
+        """
+
+        with self._lock:
+            if not self.running:
+                self._start()
+
+    def close(self) -> None:
+        """
+        Stop xfs_quota process, a new one is started if session is used again
+        """
+
+        with self._lock:
+            self._stop()
+
+    def run(self, commands: Sequence[str], timeout: Optional[float] = None) -> bytes:
+        """
+        Send xfs_quota commands and wait for all of them to complete
+
+        :param commands: xfs_quota commands, as they would be given with -c
+        :type commands: list
+        :param timeout: Maximum seconds to wait for the response, None to use session timeout
+        :type timeout: float, defaults to None
+        :raises subprocess.TimeoutExpired: If response took too long, process is killed
+        :raises XfsQuotaSessionError: If xfs_quota died twice in a row
+        :returns: Whatever the commands printed on stdout and stderr, prompts removed
+        :rtype: bytes
+        """
+
+        assert commands and all(isinstance(x, str) and x and "\n" not in x for x in commands), "commands parameter must be a non-empty list of single line strings"
+        assert timeout is None or (isinstance(timeout, (int, float)) and timeout > 0), "timeout parameter must be a positive number or None"
+
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if not self.running:
+                        self._start()
+                    return self._exchange(commands, self.timeout if timeout is None else timeout)
+                except XfsQuotaSessionError as exc:
+                    self._stop()
+                    if attempt == 2:
+                        raise
+                    self.logger.warning("xfs_quota session for %s died (%s), starting a new one", self.mnt_point, exc)
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    def _start(self) -> None:
+        """
+        Start xfs_quota process and wait for it to be ready, lock must be held
+        """
+
+        self._stop()
+        # Sentinel is matched on xfs_quota error message, do not let it be translated
+        env = dict(os.environ, LC_ALL="C")
+        self._process = subprocess.Popen(  # pylint: disable=consider-using-with
+            [self.xfs_quota, "-x", self.mnt_point], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, bufsize=0
+        )
+        os.set_blocking(self._process.stdin.fileno(), False)  # type: ignore
+        self._buffer = bytearray()
+        self.starts += 1
+
+        output = self._exchange([], self.timeout)
+        if output.strip():
+            self.logger.warning("xfs_quota session for %s printed on start-up: %s", self.mnt_point, str(output, "utf-8", "replace").strip())
+        self.logger.debug("xfs_quota session started for %s with pid %d", self.mnt_point, self._process.pid)
+
+    def _stop(self, kill: bool = False) -> None:
+        """
+        Stop xfs_quota process if any, closing its stdin makes it exit, lock must be held
+
+        :param kill: Kill the process instead of waiting for it to exit
+        :type kill: bool, defaults to False
+        """
+
+        process, self._process = self._process, None
+        if process is None:
+            return
+
+        if not kill:
+            try:
+                process.stdin.close()  # type: ignore
+                process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                kill = True
+        if kill:
+            process.kill()
+            process.wait()
+        for pipe in (process.stdin, process.stdout):
+            try:
+                pipe.close()  # type: ignore
+            except OSError:
+                pass
+
+    def _exchange(self, commands: Sequence[str], timeout: float) -> bytes:
+        """
+        Write commands followed by a sentinel while reading output until sentinel error shows up, lock must be held
+
+        Writing and reading happen in the same loop so a large batch cannot dead-lock with both pipes full
+
+        :raises subprocess.TimeoutExpired: If sentinel error did not show up in time, process is killed
+        :raises XfsQuotaSessionError: If xfs_quota exited meanwhile
+        :returns: Output printed before sentinel error, prompts removed
+        :rtype: bytes
+        """
+
+        self._sentinels += 1
+        sentinel = XFS_QUOTA_SENTINEL % self._sentinels
+        marker = b'command "%s" not found\n' % sentinel.encode("utf-8")
+        payload = memoryview("".join("%s\n" % x for x in [*commands, sentinel]).encode("utf-8"))
+
+        process = self._process
+        assert process is not None, "xfs_quota session is not started"
+        stdin_fd = process.stdin.fileno()  # type: ignore
+        stdout_fd = process.stdout.fileno()  # type: ignore
+        buffer = self._buffer
+        deadline = time.monotonic() + timeout
+        search_from = 0
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(stdout_fd, selectors.EVENT_READ)
+            selector.register(stdin_fd, selectors.EVENT_WRITE)
+            while True:
+                end = buffer.find(marker, search_from)
+                if end != -1:
+                    break
+                search_from = max(0, len(buffer) - len(marker) + 1)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    output = bytes(buffer)
+                    self._stop(kill=True)
+                    raise subprocess.TimeoutExpired([self.xfs_quota, "-x", *commands, self.mnt_point], timeout, output=output)
+
+                for key, _ in selector.select(remaining):
+                    if key.fd == stdin_fd:
+                        try:
+                            payload = payload[os.write(stdin_fd, payload[:XFS_QUOTA_READ_BUFFER_SIZE]) :]
+                        except BlockingIOError:
+                            continue
+                        except BrokenPipeError as exc:
+                            raise XfsQuotaSessionError("xfs_quota exited while reading commands") from exc
+                        if not payload:
+                            selector.unregister(stdin_fd)
+                    else:
+                        chunk = os.read(stdout_fd, XFS_QUOTA_READ_BUFFER_SIZE)
+                        if not chunk:
+                            raise XfsQuotaSessionError("xfs_quota exited, last output: %r" % bytes(buffer[-200:]))
+                        buffer += chunk
+
+        output = bytes(buffer[:end]).replace(XFS_QUOTA_PROMPT, b"")
+        # Keep what follows the sentinel error (next prompt), it is removed with next response
+        del buffer[: end + len(marker)]
+        return output
+
+
+class XfsPrjQuota:
+    """
+    Class to handle XFS filesystems project (folder) quota in Python
+
+    Could be easily ported to Ext4 as it uses FS_IOC_FSGETXATTR/FS_IOC_FSSETXATTR IOCTL to assign project id to folder
+    It relies on xfs_quota binary to assign quota to a project and report usage by default, but both can also be
+    done by calling quotactl() directly with backend=BACKEND_QUOTACTL
+
+    Be careful, as the class relies on xfs_quota shell calls it cannot be considered as thread/process safe,
+    except create_quota_dir/release_quota_dir (and code run under provisioning_lock) that hold a lock per filesystem
+
+    See AsyncXfsPrjQuota for asyncio usage
+
+    :param mnt_point: Filesystem mount point to handle quota for
+    :type mnt_point: str or pathlib.Path
+    :param backend: How to report and set quotas, BACKEND_XFS_QUOTA (fork xfs_quota) or BACKEND_QUOTACTL (call quotactl() directly)
+    :type backend: str, defaults to BACKEND_XFS_QUOTA
+    :param cache_ttl: Keep quota report in cache for given seconds (updated by writes done through this instance), None disables caching
+    :type cache_ttl: float, defaults to None
+    :param id_range: Range (min, max) of project ids handed out by allocate_project_id, None for (1, PROJECT_ID_MAX)
+    :type id_range: tuple, defaults to None
+    :param id_state_file: JSON file to persist project id allocator state to, None to build it from a report on first use
+    :type id_state_file: str or pathlib.Path, defaults to None
+    :param reservation_ledger: Check free space against a ReservationLedger built from one report and updated by this instance writes
+    :type reservation_ledger: bool, defaults to False
+    :param overcommit_ratio: Allow reserving free space multiplied by this ratio, only used with reservation_ledger
+    :type overcommit_ratio: float, defaults to 1.0
+    :param device: Block device backing mnt_point if already known (e.g: from QuotaManager), mount checks are then skipped
+    :type device: str, defaults to None
+    :param instrument: Callback receiving a CallTiming for every subprocess, parse, ioctl, quotactl and psutil call (e.g: TimingRegistry instance), None disables instrumentation
+    :type instrument: callable, defaults to None
+    :param session: Send xfs_quota commands to a long-running XfsQuotaSession process instead of forking xfs_quota for each call, call close() when done
+    :type session: bool, defaults to False
+    :param session_timeout: Maximum seconds to wait for an xfs_quota session response, only used with session
+    :type session_timeout: float, defaults to 30.0
+    :param lock_dir: Directory of provisioning lock files, None for first writable of PROVISIONING_LOCK_DIRS
+    :type lock_dir: str, defaults to None
+    :param path_index: ProjectPathIndex (or its SQLite file) updated whenever a project id is assigned to a folder, None to disable
+    :type path_index: ProjectPathIndex, str or pathlib.Path, defaults to None
+    """
+
+    def __init__(
+        self,
+        mnt_point: Union[str, pathlib.Path],
+        backend: str = BACKEND_XFS_QUOTA,
+        cache_ttl: Optional[float] = None,
+        id_range: Optional[Tuple[int, int]] = None,
+        id_state_file: Optional[Union[str, pathlib.Path]] = None,
+        reservation_ledger: bool = False,
+        overcommit_ratio: float = 1.0,
+        device: Optional[str] = None,
+        instrument: Optional[Callable[[CallTiming], None]] = None,
+        session: bool = False,
+        session_timeout: float = 30.0,
+        lock_dir: Optional[str] = None,
+        path_index: Optional[Union[ProjectPathIndex, str, pathlib.Path]] = None,
+    ) -> None:  # pylint: disable=too-many-arguments,too-many-locals
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        assert instrument is None or callable(instrument), "instrument parameter must be a callable or None"
+        self.instrument = instrument
+
+        assert isinstance(mnt_point, (str, pathlib.Path)) and str(mnt_point).startswith(
+            "/"
+        ), "mount_point parameter must be a non-emtpy string (or pathlib.Path) starting with /"
+        self.mnt_point = pathlib.Path(mnt_point) if isinstance(mnt_point, str) else mnt_point
+
+        assert backend in (BACKEND_XFS_QUOTA, BACKEND_QUOTACTL), "backend parameter must be one of %s or %s" % (BACKEND_XFS_QUOTA, BACKEND_QUOTACTL)
+        self.backend = backend
+
+        #: Block device backing mnt_point, required by quotactl(), set by _check_part_mounted
+        assert device is None or (isinstance(device, str) and device), "device parameter must be a non-empty string or None"
+        self.device = device or ""
+
+        assert cache_ttl is None or (isinstance(cache_ttl, (int, float)) and cache_ttl >= 0), "cache_ttl parameter must be a positive number or None"
+        self.cache_ttl = cache_ttl
+        self._cache: Optional[Dict[int, ProjectQuota]] = None
+        self._cache_time = 0.0
+
+        #: Number of quota reports served from cache
+        self.cache_hits = 0
+        #: Number of quota reports actually fetched while cache was enabled
+        self.cache_misses = 0
+
+        assert id_range is None or (isinstance(id_range, tuple) and len(id_range) == 2), "id_range parameter must be a (min, max) tuple or None"
+        self.id_range = id_range or (1, PROJECT_ID_MAX)
+        self.id_state_file = id_state_file
+        self._id_allocator: Optional[ProjectIdAllocator] = None
+
+        assert reservation_ledger is True or reservation_ledger is False, "reservation_ledger parameter must be True or False"
+        self.reservation_ledger = reservation_ledger
+        self.overcommit_ratio = overcommit_ratio
+        self._ledger: Optional[ReservationLedger] = None
+
+        xfs_quota = shutil.which("xfs_quota")
+        assert xfs_quota or backend != BACKEND_XFS_QUOTA, "xfs_quota command not found, may I suggest apt install xfsprogs ?"
+        self.xfs_quota = xfs_quota or ""
+
+        assert session is True or session is False, "session parameter must be True or False"
+        assert not session or backend == BACKEND_XFS_QUOTA, "session parameter requires %s backend" % BACKEND_XFS_QUOTA
+        #: Long-running xfs_quota process, started on first use, None when session is disabled
+        self.session = XfsQuotaSession(self.xfs_quota, self.mnt_point, timeout=session_timeout) if session else None
+
+        assert lock_dir is None or (isinstance(lock_dir, str) and lock_dir.startswith("/")), "lock_dir parameter must be a string starting with / or None"
+        self.lock_dir = lock_dir
+        self._lock_path: Optional[str] = None
+        # Token this instance wrote to lock file on its last provisioning, None if it never provisioned
+        self._shared_generation: Optional[bytes] = None
+
+        assert path_index is None or isinstance(path_index, (ProjectPathIndex, str, pathlib.Path)), "path_index parameter must be a ProjectPathIndex, a string (or pathlib.Path) or None"
+        #: Reverse index of project roots, None when disabled
+        self.path_index = ProjectPathIndex(path_index) if isinstance(path_index, (str, pathlib.Path)) else path_index
+        self._owns_path_index = isinstance(path_index, (str, pathlib.Path))
+
+        if device is None:
+            self._check_part_mounted()  # check partition is here and properly mounted
+
+    def close(self) -> None:
+        """
+        Stop xfs_quota session process if any, it is started again if instance is used afterwards
+
+        Path index is closed too if it has been opened by this instance, it must not be used anymore afterwards
+        """
+
+        if self.session is not None:
+            self.session.close()
+        if self.path_index is not None and self._owns_path_index:
+            self.path_index.close()
+            self.path_index = None
+
+    def _session_run(self, name: str, commands: List[str]) -> bytes:
+        """
+        Send commands to xfs_quota session, instrumented as a session call
+
+        :param name: Call name, see CallTiming
+        :type name: str
+        :param commands: xfs_quota commands, as they would be given with -c
+        :type commands: list
+        :returns: Commands output, stdout and stderr merged
+        :rtype: bytes
+        """
+
+        assert self.session is not None, "xfs_quota session is not enabled"
+        return self._call("session", name, self.session.run, commands)
+
+    def _call(self, kind: str, name: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Call func and report its duration, output size and outcome to instrument callback if any
+
+        Every subprocess, ioctl and psutil call goes through this method, when instrumentation is disabled
+        the only overhead is one attribute lookup
+
+        :param kind: Call kind, see CallTiming
+        :type kind: str
+        :param name: Call name, see CallTiming
+        :type name: str
+        :param func: Function to call with args and kwargs
+        :type func: callable
+        :returns: Whatever func returned
+        :rtype: any
+        """
+
+        instrument = self.instrument
+        if instrument is None:
+            return func(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            instrument(CallTiming(kind, name, time.perf_counter() - start, 0, "%s: %s" % (exc.__class__.__name__, exc)))
+            raise
+
+        error = None
+        if isinstance(result, (bytes, dict, list)):
+            size = len(result)
+        elif isinstance(result, subprocess.CompletedProcess):
+            size = len(result.stdout or b"")
+            error = "exited with code %d" % result.returncode if result.returncode != 0 else None
+        else:
+            size = 0
+        instrument(CallTiming(kind, name, time.perf_counter() - start, size, error))
+        return result
+
+    @contextlib.contextmanager
+    def instrumented(self, instrument: Optional[Callable[[CallTiming], None]] = None) -> Iterator[Callable[[CallTiming], None]]:
+        """
+        Context manager instrumenting calls made by this instance while enclosed code runs, previous instrument is restored on exit
+
+        :param instrument: Callback receiving every CallTiming, None for a new TimingRegistry
+        :type instrument: callable, defaults to None
+        :returns: Callback in use, e.g: TimingRegistry to read summary from
+        :rtype: iterator
+        """
+
+        previous = self.instrument
+        self.instrument = instrument if instrument is not None else TimingRegistry()
+        try:
+            yield self.instrument
+        finally:
+            self.instrument = previous
+
+    def _ioctl_funcs(self) -> Tuple[Callable[..., Any], Callable[..., Any]]:
+        """
+        Get functions sending FSGETXATTR and FSSETXATTR IOCTL, for bulk loops
+
+        Plain fcntl.ioctl is returned when instrumentation is disabled so hot loops do not pay for _call
+
+        :returns: Tuple of FSGETXATTR and FSSETXATTR functions, both taking fcntl.ioctl arguments
+        :rtype: tuple
+        """
+
+        if self.instrument is None:
+            return fcntl.ioctl, fcntl.ioctl
+        return functools.partial(self._call, "ioctl", "FSGETXATTR", fcntl.ioctl), functools.partial(self._call, "ioctl", "FSSETXATTR", fcntl.ioctl)
+
+    def _free_space(self) -> int:
+        """
+        Get free space of mnt_point in bytes
+
+        :returns: Free bytes
+        :rtype: int
+        """
+
+        return self._call("psutil", "disk_usage", psutil.disk_usage, self.mnt_point).free
+
+    def _check_part_mounted(self) -> None:
+        """
+        Verify provided partition path is mounted and has proper prjquota options
+
+        :raises AssertionError: If provided mnt_point cannot be used with XFS project quotas
+        """
+
+        mounted = self._call("psutil", "disk_partitions", psutil.disk_partitions)
+        target_mounted = [x for x in mounted if x.mountpoint == str(self.mnt_point)]
+        assert target_mounted, "mount_point %s does not seems to be mounted" % self.mnt_point
+        assert target_mounted[0].fstype == "xfs", "mount_point %s is not an XFS partition" % self.mnt_point
+        assert "prjquota" in target_mounted[0].opts.split(","), "mount_point %s is not mounted with prjquota options" % self.mnt_point
+        self.device = target_mounted[0].device
+
+    def get_proj_id_for_path(self, path: Union[str, pathlib.Path]) -> int:
+        """
+        Get project id (int) for given path
+
+        I did not found any way to do this with xfs_quota command so I went the hard way
+
+        Send "FSGETXATTR" IOCTL and parse the returned struct which contains project id at index 3
+        (see linux/fs.h fsxattr struct definition)
+
+        :param path: Path to get project id for
+        :type path: str or pathlib.Path
+        :raises AssertionError: If provided path in not sub path of self.mnt_point or not an existing directory
+        :returns: Project id associated to this folder (0 means default project)
+        :rtype: int
+        """
+
+        assert isinstance(path, (str, pathlib.Path)) and path, "path parameter must be a non-emtpy string (or pathlib.Path)"
+        path = pathlib.Path(path) if isinstance(path, str) else path
+        assert self.mnt_point in path.parents or self.mnt_point == path, "provided path %s is not a sub path of %s" % (path, self.mnt_point)
+        assert path.is_dir(), "provided path %s is not an existing directory" % path
+
+        path_fd = os.open(path, os.O_DIRECTORY)
+        try:
+            ret_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
+            self._call("ioctl", "FSGETXATTR", fcntl.ioctl, path_fd, FS_IOC_FSGETXATTR, ret_struct, True)
+        finally:
+            os.close(path_fd)
+
+        return ret_struct[3]  # project id stored at index 3, see fsxattr struct definition
+
+    def get_proj_ids_for_paths(self, paths: Iterable[Union[str, pathlib.Path]], workers: Optional[int] = None, ignore_errors: bool = False) -> Dict[Union[str, pathlib.Path], PathProjId]:
+        """
+        Get project id and xflags for many paths at once
+
+        mnt_point is opened once and every path is opened relative to it, FSGETXATTR results are read into a
+        preallocated buffer (one per thread) and every fd is closed right away. Unlike get_proj_id_for_path,
+        paths may be files too
+
+        :param paths: Paths to get project id for, they must be sub paths of mnt_point
+        :type paths: iterable of str or pathlib.Path
+        :param workers: Number of threads sending IOCTL, None to do everything in calling thread
+        :type workers: int, defaults to None
+        :param ignore_errors: Log and leave out paths that cannot be opened instead of raising
+        :type ignore_errors: bool, defaults to False
+        :raises AssertionError: If a provided path in not sub path of self.mnt_point
+        :raises OSError: If a path cannot be opened and ignore_errors is False
+        :returns: Dict with provided paths as key and project id/xflags namedtuple as value
+        :rtype: dict
+        """
+
+        assert workers is None or (isinstance(workers, int) and workers > 0), "workers parameter must be a positive integer or None"
+
+        mnt_point = str(self.mnt_point)
+        mnt_prefix = mnt_point.rstrip("/") + "/"
+        relative_paths = []
+        for path in paths:
+            assert isinstance(path, (str, pathlib.Path)) and path, "paths parameter items must be non-emtpy strings (or pathlib.Path)"
+            normalized = os.path.normpath(str(path))
+            assert normalized == mnt_point or normalized.startswith(mnt_prefix), "provided path %s is not a sub path of %s" % (path, self.mnt_point)
+            relative_paths.append((path, normalized[len(mnt_prefix) :] or "."))
+
+        local = threading.local()
+        results: Dict[Union[str, pathlib.Path], PathProjId] = {}
+        get_xattr, _ = self._ioctl_funcs()
+
+        mnt_fd = os.open(mnt_point, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+
+            def lookup(item: Tuple[Union[str, pathlib.Path], str]) -> None:
+                path, relative_path = item
+                fsxattr_struct = getattr(local, "fsxattr_struct", None)
+                if fsxattr_struct is None:
+                    fsxattr_struct = local.fsxattr_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
+                try:
+                    path_fd = os.open(relative_path, os.O_RDONLY | os.O_NONBLOCK | os.O_NOCTTY, dir_fd=mnt_fd)
+                    try:
+                        get_xattr(path_fd, FS_IOC_FSGETXATTR, fsxattr_struct, True)
+                    finally:
+                        os.close(path_fd)
+                except OSError as exc:
+                    if not ignore_errors:
+                        raise
+                    self.logger.error("Unable to get project id for %s: %s", path, exc)
+                    return
+                results[path] = PathProjId(proj_id=fsxattr_struct[3], xflags=fsxattr_struct[0])
+
+            if workers is None:
+                for item in relative_paths:
+                    lookup(item)
+            else:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                    for _ in executor.map(lookup, relative_paths):
+                        pass
+        finally:
+            os.close(mnt_fd)
+
+        return results
+
+    def set_proj_id_for_path(self, path: Union[str, pathlib.Path], proj_id: int) -> None:
+        """
+        Set project id (int) for given path
+
+        Send "FSSETXATTR" IOCTL and enable FS_XFLAG_PROJINHERIT so subfolders/subfiles inherit from this setting
+        (see linux/fs.h fsxattr struct definition)
+
+        :param path: Path to set project id for
+        :type path: str or pathlib.Path
+        :param proj_id: Project id to set
+        :type proj_id: int
+        :raises AssertionError: If provided path in not sub path of self.mnt_point or not an existing directory
+        """
+
+        assert isinstance(path, (str, pathlib.Path)) and path, "path parameter must be a non-emtpy string (or pathlib.Path)"
+        path = pathlib.Path(path) if isinstance(path, str) else path
+        assert self.mnt_point in path.parents or self.mnt_point == path, "provided path %s is not a sub path of %s" % (path, self.mnt_point)
+        assert path.is_dir(), "provided path %s is not an existing directory" % path
+        assert isinstance(proj_id, int) and proj_id >= 0, "proj_id parameter must be a positive or zero integer"
+
+        path_fd = os.open(path, os.O_DIRECTORY)
+        try:
+            # Get current values first
+            fsxattr_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
+            self._call("ioctl", "FSGETXATTR", fcntl.ioctl, path_fd, FS_IOC_FSGETXATTR, fsxattr_struct, True)
+
+            # Set new value
+            fsxattr_struct[0] = fsxattr_struct[0] | FS_XFLAG_PROJINHERIT
+            fsxattr_struct[3] = proj_id
+            self._call("ioctl", "FSSETXATTR", fcntl.ioctl, path_fd, FS_IOC_FSSETXATTR, fsxattr_struct, True)
+        finally:
+            os.close(path_fd)
+
+        # Folder own usage now belongs to another project
+        self.invalidate_cache()
+        if self._id_allocator is not None and proj_id != 0:
+            self._id_allocator.mark_used(proj_id)
+        if self.path_index is not None:
+            self.path_index.set(path, proj_id)
+
+        self.logger.debug("Project id %d assigned to folder %s", proj_id, str(path))
+
+    def set_proj_id_for_tree(
+        self,
+        path: Union[str, pathlib.Path],
+        proj_id: int,
+        workers: int = 8,
+        progress: Optional[Callable[[TreeProgress], None]] = None,
+        progress_every: int = 10000,
+        resume_file: Optional[Union[str, pathlib.Path]] = None,
+    ) -> TreeProgress:  # pylint: disable=too-many-arguments,too-many-locals
+        """
+        Set project id (int) for given path and every file and folder already existing below it
+
+        set_proj_id_for_path only tags given folder, so existing content keeps its previous project id, this is the
+        parallel equivalent of xfs_quota project -s: tree is walked with a thread pool, FSGETXATTR/FSSETXATTR IOCTL
+        are sent on fds opened relative to their parent folder and inodes already having the right id are skipped
+
+        If resume_file is provided, folders whose content has been fully processed are appended to it, so an interrupted
+        run can be started again with the same resume_file and only walk (without touching files) these folders.
+        File is removed once the whole tree has been processed
+
+        :param path: Root of tree to set project id for
+        :type path: str or pathlib.Path
+        :param proj_id: Project id to set
+        :type proj_id: int
+        :param workers: Number of threads sending IOCTL
+        :type workers: int, defaults to 8
+        :param progress: Called with a TreeProgress every progress_every scanned inodes (from worker threads)
+        :type progress: callable, defaults to None
+        :param progress_every: Number of scanned inodes between two progress calls
+        :type progress_every: int, defaults to 10000
+        :param resume_file: Journal file allowing to resume an interrupted run
+        :type resume_file: str or pathlib.Path, defaults to None
+        :raises AssertionError: If provided path in not sub path of self.mnt_point or not an existing directory
+        :returns: Final counters (inodes that could not be updated are counted as errors and logged)
+        :rtype: TreeProgress
+        """
+
+        assert isinstance(progress_every, int) and progress_every > 0, "progress_every parameter must be a positive integer"
+
+        assert isinstance(path, (str, pathlib.Path)) and pathlib.Path(path).is_dir(), "provided path %s is not an existing directory" % path
+
+        # Root already carrying the project id (e.g: resumed or repeated run) is skipped like any other inode
+        root_current = self.get_proj_ids_for_paths([path])[path]
+        root_skipped = root_current.proj_id == proj_id and bool(root_current.xflags & FS_XFLAG_PROJINHERIT)
+
+        # Tag root folder first so anything created while walking inherits the new project id
+        self.set_proj_id_for_path(path, proj_id)
+        root = str(path)
+
+        counters = {"scanned": 1, "changed": 0 if root_skipped else 1, "skipped": 1 if root_skipped else 0, "errors": 0}
+        get_xattr, set_xattr = self._ioctl_funcs()
+        lock = threading.Lock()
+        local = threading.local()
+        start = time.monotonic()
+
+        def snapshot() -> TreeProgress:
+            return TreeProgress(elapsed=time.monotonic() - start, **counters)
+
+        def count(counter: str) -> None:
+            with lock:
+                counters[counter] += 1
+                if counter != "errors":
+                    counters["scanned"] += 1
+                    if progress is not None and counters["scanned"] % progress_every == 0:
+                        progress(snapshot())
+
+        def visit(entry_fd: int, _dir_path: str, entry: "os.DirEntry[str]") -> None:
+            fsxattr_struct = getattr(local, "fsxattr_struct", None)
+            if fsxattr_struct is None:
+                fsxattr_struct = local.fsxattr_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
+            get_xattr(entry_fd, FS_IOC_FSGETXATTR, fsxattr_struct, True)
+
+            xflags = fsxattr_struct[0] | FS_XFLAG_PROJINHERIT if entry.is_dir(follow_symlinks=False) else fsxattr_struct[0]
+            if fsxattr_struct[3] == proj_id and fsxattr_struct[0] == xflags:
+                count("skipped")
+                return
+
+            fsxattr_struct[0] = xflags
+            fsxattr_struct[3] = proj_id
+            set_xattr(entry_fd, FS_IOC_FSSETXATTR, fsxattr_struct, True)
+            count("changed")
+
+        def on_error(entry_path: str, exc: OSError) -> None:
+            self.logger.error("Unable to set project id %d on %s: %s", proj_id, entry_path, exc)
+            count("errors")
+
+        # Journal header ties it to a tree and a project id, a journal for something else is ignored
+        journal_header = "%d %s\n" % (proj_id, root)
+        completed: Set[str] = set()
+        journal_fh = None
+        if resume_file is not None:
+            if os.path.exists(resume_file):
+                with open(resume_file, "r") as resume_fh:
+                    if resume_fh.readline() == journal_header:
+                        completed = {x.rstrip("\n") for x in resume_fh}
+            journal_fh = open(resume_file, "w")  # pylint: disable=consider-using-with
+            journal_fh.write(journal_header)
+            journal_fh.writelines([x + "\n" for x in completed])
+            journal_fh.flush()
+
+        def dir_done(dir_path: str) -> None:
+            if journal_fh is not None and dir_path not in completed:
+                with lock:
+                    journal_fh.write(dir_path + "\n")
+                    journal_fh.flush()
+
+        try:
+            parallel_walk(root, visit, workers=workers, skip_files=completed.__contains__ if completed else None, dir_done=dir_done, on_error=on_error)
+        finally:
+            if journal_fh is not None:
+                journal_fh.close()
+
+        if resume_file is not None and counters["errors"] == 0:
+            os.unlink(resume_file)
+
+        # Project roots that were below path are now part of this project
+        if self.path_index is not None:
+            self.path_index.replace_tree(root, {root: proj_id})
+
+        result = snapshot()
+        self.logger.info(
+            "Project id %d assigned to tree %s: %d inodes scanned, %d changed, %d skipped, %d errors in %.1fs (%.0f inodes/s)",
+            proj_id,
+            root,
+            result.scanned,
+            result.changed,
+            result.skipped,
+            result.errors,
+            result.elapsed,
+            result.rate,
+        )
+        return result
+
+    def rebuild_path_index(self, root: Optional[Union[str, pathlib.Path]] = None, workers: int = 8) -> int:
+        """
+        Rebuild path index of a tree by walking its folders in parallel, files are not visited
+
+        Every folder whose project id differs from its parent one is recorded as a project root,
+        index entries found below root before the walk are replaced
+
+        :param root: Root of tree to index, None for the whole mount point
+        :type root: str or pathlib.Path, defaults to None
+        :param workers: Number of threads sending IOCTL
+        :type workers: int, defaults to 8
+        :raises AssertionError: If instance has no path index or root is not a sub path of self.mnt_point
+        :returns: Number of project roots found
+        :rtype: int
+        """
+
+        assert self.path_index is not None, "path_index is not enabled"
+        root_path = pathlib.Path(root) if root is not None else self.mnt_point
+        assert self.mnt_point in root_path.parents or self.mnt_point == root_path, "provided path %s is not a sub path of %s" % (root_path, self.mnt_point)
+
+        root_str = os.path.normpath(str(root_path))
+        start = time.monotonic()
+        entries = self._find_project_roots(root_str, workers)
+        self.path_index.replace_tree(root_str, entries)
+
+        found = len([x for x in entries.values() if x])
+        self.logger.info("Path index of %s rebuilt: %d project roots found in %.1fs", root_str, found, time.monotonic() - start)
+        return found
+
+    def _find_project_roots(self, root: str, workers: int) -> Dict[str, int]:
+        """
+        Walk folders of a tree in parallel and find the ones whose project id differs from their parent one
+
+        :param root: Normalized root of tree, always part of the result
+        :type root: str
+        :param workers: Number of threads sending IOCTL
+        :type workers: int
+        :returns: Dict with folder path as key and project id (possibly 0) as value
+        :rtype: dict
+        """
+
+        root_proj_id = self.get_proj_id_for_path(root)
+        entries = {root: root_proj_id}
+        # Project id of folders whose entries are being visited, dropped once done so memory follows the walk frontier
+        dir_proj_ids = {root: root_proj_id}
+        get_xattr, _ = self._ioctl_funcs()
+        lock = threading.Lock()
+
+        def visit(entry_fd: int, dir_path: str, entry: "os.DirEntry[str]") -> None:
+            fsxattr_struct = array.array("I", [0, 0, 0, 0, 0])
+            get_xattr(entry_fd, FS_IOC_FSGETXATTR, fsxattr_struct, True)
+            path = os.path.join(dir_path, entry.name)
+            with lock:
+                dir_proj_ids[path] = fsxattr_struct[3]
+                if fsxattr_struct[3] != dir_proj_ids[dir_path]:
+                    entries[path] = fsxattr_struct[3]
+
+        def dir_done(dir_path: str) -> None:
+            with lock:
+                dir_proj_ids.pop(dir_path, None)
+
+        def on_error(entry_path: str, exc: OSError) -> None:
+            self.logger.warning("Unable to read project id of %s: %s", entry_path, exc)
+
+        parallel_walk(root, visit, workers=workers, skip_files=lambda _: True, dir_done=dir_done, on_error=on_error)
+        return entries
+
+    def top_consumers(self, count: int = 10) -> List[Tuple[ProjectQuota, List[str]]]:
+        """
+        Get projects using the most space along with their folders, from a report and the path index (no tree walk)
+
+        :param count: Number of projects to return
+        :type count: int, defaults to 10
+        :raises AssertionError: If instance has no path index
+        :returns: List of (ProjectQuota, folder paths) tuples, greatest usage first
+        :rtype: list
+        """
+
+        assert self.path_index is not None, "path_index is not enabled"
+        table = self.list_proj_quota(as_table=True)
+        return [(x, self.path_index.paths(x.proj_id)) for x in table.top_n(count)]  # type: ignore
+
+    def audit_project(
+        self,
+        proj_id: int,
+        path: Union[str, pathlib.Path],
+        workers: int = 8,
+        max_mismatches: Optional[int] = 1000,
+        on_mismatch: Optional[Callable[[AuditMismatch], None]] = None,
+        max_hardlinks: Optional[int] = None,
+    ) -> AuditResult:  # pylint: disable=too-many-arguments,too-many-locals
+        """
+        Reconcile a project quota usage with what is actually stored below a folder, like du does but per project id
+
+        Tree is walked with a thread pool (see parallel_walk), FSGETXATTR IOCTL tells which project each inode is charged to
+        and allocated blocks are summed from st_blocks. Inodes charged to another project (e.g: created before the tree was
+        tagged) are reported as mismatches and usage found in the tree is compared with a single project quota query
+
+        Memory is bounded for huge trees: walk keeps only pending folders, mismatches beyond max_mismatches are only counted
+        (use on_mismatch to stream all of them) and with max_hardlinks set, multiply linked inodes seen once the hardlink
+        table is full are accounted st_blocks / st_nlink per link instead of being deduplicated
+
+        Symlinks and special files are not visited (see parallel_walk)
+
+        :param proj_id: Project id to audit
+        :type proj_id: int
+        :param path: Root of tree holding project data
+        :type path: str or pathlib.Path
+        :param workers: Number of threads sending IOCTL
+        :type workers: int, defaults to 8
+        :param max_mismatches: Maximum number of mismatches kept in result, None for no limit
+        :type max_mismatches: int, defaults to 1000
+        :param on_mismatch: Called with every AuditMismatch (from worker threads)
+        :type on_mismatch: callable, defaults to None
+        :param max_hardlinks: Maximum number of multiply linked inodes remembered for deduplication, None for no limit
+        :type max_hardlinks: int, defaults to None
+        :raises AssertionError: If provided path in not sub path of self.mnt_point or not an existing directory
+        :returns: Audit counters, mismatches and quota report usage
+        :rtype: AuditResult
+        """
+
+        assert isinstance(proj_id, int) and 0 <= proj_id <= 0xFFFFFFFF, "proj_id parameter must be an integer between 0 and 2^32-1"
+        assert max_mismatches is None or (isinstance(max_mismatches, int) and max_mismatches >= 0), "max_mismatches parameter must be a positive integer or None"
+        assert max_hardlinks is None or (isinstance(max_hardlinks, int) and max_hardlinks >= 0), "max_hardlinks parameter must be a positive integer or None"
+
+        root_proj_id = self.get_proj_id_for_path(path)
+        root = os.path.normpath(str(path))
+        root_stat = os.stat(root)
+        start = time.monotonic()
+
+        counters = {"scanned": 0, "charged": 0, "charged_bytes": 0, "mismatch_count": 0, "mismatch_bytes": 0, "hardlinks": 0, "errors": 0}
+        mismatches: List[AuditMismatch] = []
+        # Inode numbers of multiply linked files already accounted, only ones charged to proj_id need deduplication
+        seen_inodes: Set[int] = set()
+        get_xattr, _ = self._ioctl_funcs()
+        lock = threading.Lock()
+        local = threading.local()
+
+        def account(entry_path: str, entry_proj_id: int, entry_stat: os.stat_result, is_dir: bool) -> None:
+            allocated = entry_stat.st_blocks * XFS_BB_SIZE
+            with lock:
+                counters["scanned"] += 1
+                if entry_proj_id != proj_id:
+                    counters["mismatch_count"] += 1
+                    counters["mismatch_bytes"] += allocated
+                    mismatch = AuditMismatch(path=entry_path, proj_id=entry_proj_id, allocated=allocated)
+                    if max_mismatches is None or len(mismatches) < max_mismatches:
+                        mismatches.append(mismatch)
+                    if on_mismatch is not None:
+                        on_mismatch(mismatch)
+                    return
+                counters["charged"] += 1
+                if not is_dir and entry_stat.st_nlink > 1:
+                    if entry_stat.st_ino in seen_inodes:
+                        counters["hardlinks"] += 1
+                        return
+                    if max_hardlinks is None or len(seen_inodes) < max_hardlinks:
+                        seen_inodes.add(entry_stat.st_ino)
+                    else:
+                        allocated //= entry_stat.st_nlink
+                counters["charged_bytes"] += allocated
+
+        def visit(entry_fd: int, dir_path: str, entry: "os.DirEntry[str]") -> None:
+            fsxattr_struct = getattr(local, "fsxattr_struct", None)
+            if fsxattr_struct is None:
+                fsxattr_struct = local.fsxattr_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
+            get_xattr(entry_fd, FS_IOC_FSGETXATTR, fsxattr_struct, True)
+            account(os.path.join(dir_path, entry.name), fsxattr_struct[3], os.fstat(entry_fd), entry.is_dir(follow_symlinks=False))
+
+        def on_error(entry_path: str, exc: OSError) -> None:
+            self.logger.warning("Unable to audit %s: %s", entry_path, exc)
+            with lock:
+                counters["errors"] += 1
+
+        account(root, root_proj_id, root_stat, True)
+        parallel_walk(root, visit, workers=workers, on_error=on_error)
+
+        quota = self.get_proj_quota(proj_id)
+        result = AuditResult(
+            proj_id=proj_id, mismatches=mismatches, quota_used=quota.used if quota is not None else None, elapsed=time.monotonic() - start, **counters
+        )
+        self.logger.info(
+            "Project id %d audited on tree %s: %d inodes scanned, %d bytes charged, %d mismatching inodes (%d bytes), %d errors, %d bytes delta with quota report in %.1fs",
+            proj_id,
+            root,
+            result.scanned,
+            result.charged_bytes,
+            result.mismatch_count,
+            result.mismatch_bytes,
+            result.errors,
+            result.delta,
+            result.elapsed,
+        )
+        return result
+
+    @staticmethod
+    def _decode_grace(grace: bytes) -> Optional[str]:
+        """
+        Decode a raw grace field of xfs_quota report and remember it in GRACE_STRINGS
+
+        :param grace: Raw grace field, brackets (and line ending if any) included
+        :type grace: bytes
+        :returns: Grace without brackets or None if field is not enclosed in brackets
+        :rtype: str
+        """
+
+        stripped = grace.rstrip()
+        if stripped[:1] != b"[" or stripped[-1:] != b"]" or len(stripped) <= 2:
+            return None
+        grace_str = str(stripped[1:-1], "utf-8")
+        if len(GRACE_STRINGS) < GRACE_STRINGS_MAX:
+            GRACE_STRINGS[grace] = grace_str
+        return grace_str
+
+    @classmethod
+    def _parse_xfs_quota_report_line(cls, line: bytes) -> Optional[ProjectQuota]:
+        """
+        Parse one line of xfs_quota -x -c 'report -p -b -i -n -N' output
+
+        Bytes are split on whitespaces directly, RE_QUOTA_REPORT_BYTES is only used when this fast path fails
+        to keep the same validation (and error message) as before. Inode columns are optional so output of
+        'report -p -n -N' (blocks only) is still accepted, inode fields are left to 0 then
+
+        :param line: Raw line from xfs_quota stdout
+        :type line: bytes
+        :raises AssertionError: If line cannot be parsed
+        :returns: Namedtuple with soft/hard/used values in bytes and inode counters, None for blank lines
+        :rtype: ProjectQuota
+        """
+
+        fields = line.split(None, 5)
+        if not fields:
+            return None
+
+        try:
+            proj_id, used, soft, hard, warn, rest = fields
+            if proj_id[:1] == b"#" and proj_id[1:].isdigit() and used.isdigit() and soft.isdigit() and hard.isdigit() and warn.isdigit():
+                # Block only line whose grace has already been seen, rest is just the grace field
+                grace_str = GRACE_STRINGS.get(rest)
+                if grace_str is not None:
+                    # Positional arguments, way faster than keywords on hot path
+                    # For some reason setting quota in bytes, listing state in KiB
+                    return ProjectQuota(int(proj_id[1:]), int(used) * 1024, int(soft) * 1024, int(hard) * 1024, int(warn), grace_str)
+
+                # Grace may contain spaces (e.g: "[7 days]"), it ends at first closing bracket, inode columns follow
+                grace_end = rest.find(b"]") + 1
+                inodes = rest[grace_end:].split(None, 4)
+                if not inodes:
+                    grace_str = cls._decode_grace(rest)
+                    if grace_str is not None:
+                        return ProjectQuota(int(proj_id[1:]), int(used) * 1024, int(soft) * 1024, int(hard) * 1024, int(warn), grace_str)
+                else:
+                    iused, isoft, ihard, iwarn, igrace = inodes
+                    grace = rest[:grace_end]
+                    grace_str = GRACE_STRINGS.get(grace) or cls._decode_grace(grace)
+                    igrace_str = GRACE_STRINGS.get(igrace) or cls._decode_grace(igrace)
+                    if grace_str is not None and igrace_str is not None and iused.isdigit() and isoft.isdigit() and ihard.isdigit() and iwarn.isdigit():
+                        return ProjectQuota(int(proj_id[1:]), int(used) * 1024, int(soft) * 1024, int(hard) * 1024, int(warn), grace_str, int(iused), int(isoft), int(ihard), int(iwarn), igrace_str)
+        except ValueError:  # Not enough fields to unpack
+            pass
+
+        # Slow path, either this is a line the fast path does not handle or an invalid one
+        line = line.strip()
+        re_match = RE_QUOTA_REPORT_BYTES.match(line)
+        assert re_match, "unable to parser xfs_quota report line: %r" % str(line, "utf-8", "replace")
+
+        quota = ProjectQuota(
+            proj_id=int(re_match.group("proj_id")),
+            used=int(re_match.group("used")) * 1024,
+            soft=int(re_match.group("soft")) * 1024,
+            hard=int(re_match.group("hard")) * 1024,
+            warn=int(re_match.group("warn")),
+            grace=str(re_match.group("grace"), "utf-8"),
+        )
+        if re_match.group("iused") is not None:
+            quota = quota._replace(
+                iused=int(re_match.group("iused")),
+                isoft=int(re_match.group("isoft")),
+                ihard=int(re_match.group("ihard")),
+                iwarn=int(re_match.group("iwarn")),
+                igrace=str(re_match.group("igrace"), "utf-8"),
+            )
+        return quota
+
+    @classmethod
+    def _parse_xfs_quota_report(cls, stdout: bytes) -> Dict[int, ProjectQuota]:
+        """
+        Parse xfs_quota -x -c 'report -p -b -i -n -N' output
+
+        See list_proj_quota method instead
+
+        :param stdout: Raw stdout of xfs_quota command
+        :type stdout: bytes
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
+
+        parsed: Dict[int, ProjectQuota] = {}
+        parse_line = cls._parse_xfs_quota_report_line
+        for line in stdout.splitlines():
+            as_named_tuple = parse_line(line)
+            if as_named_tuple is not None:
+                parsed[as_named_tuple.proj_id] = as_named_tuple
+
+        return parsed
+
+    def iter_proj_quota(self) -> Iterator[ProjectQuota]:
+        """
+        Stream project quotas of mnt_point without building the whole report in memory
+
+        xfs_quota stdout is read and parsed incrementally (or quotactl walked one project at a time),
+        so callers can filter or aggregate huge reports, cache is not used nor updated
+
+        :raises subprocess.CalledProcessError: If xfs_quota exited with non zero code
+        :returns: Iterator of namedtuple with soft/hard/used values in bytes
+        :rtype: iterator
+        """
+
+        if self.backend == BACKEND_QUOTACTL:
+            yield from self._iter_proj_quota_quotactl()
+            return
+
+        if self.session is not None:
+            # Session response is read at once, only parsing is incremental
+            parse_line = self._parse_xfs_quota_report_line
+            for line in self._session_run("report", [XFS_QUOTA_REPORT_COMMAND]).splitlines():
+                as_named_tuple = parse_line(line)
+                if as_named_tuple is not None:
+                    yield as_named_tuple
+            return
+
+        cmd = self._report_cmd()
+        parse_line = self._parse_xfs_quota_report_line
+        start = time.perf_counter()
+        size = 0
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=XFS_QUOTA_READ_BUFFER_SIZE) as process:
+            try:
+                for line in process.stdout:  # type: ignore
+                    size += len(line)
+                    as_named_tuple = parse_line(line)
+                    if as_named_tuple is not None:
+                        yield as_named_tuple
+            finally:
+                # Consumer may stop iterating before the end of the report
+                if process.poll() is None:
+                    process.kill()
+            retcode = process.wait()
+
+        if self.instrument is not None:
+            # Parsing is interleaved with reading, its duration is included here
+            self.instrument(CallTiming("subprocess", "report_stream", time.perf_counter() - start, size, "exited with code %d" % retcode if retcode != 0 else None))
+
+        if retcode != 0:
+            raise subprocess.CalledProcessError(retcode, cmd)
+
+    @staticmethod
+    def _format_grace(timer: int) -> str:
+        """
+        Format quota grace timer the same way xfs_quota report does (without brackets)
+
+        :param timer: Timer value from fs_disk_quota struct (expiry as UNIX timestamp, 0 if not running)
+        :type timer: int
+        :returns: Grace string as found between brackets in xfs_quota report, e.g: -------- or 7 days
+        :rtype: str
+        """
+
+        if timer == 0:
+            return "--------"
+
+        remaining = max(timer - int(time.time()), 0)
+        if remaining > 86400:
+            remaining += 30  # xfs_quota rounds so a freshly set grace does not show one day less
+        days, remaining = divmod(remaining, 86400)
+        hours, remaining = divmod(remaining, 3600)
+        minutes, seconds = divmod(remaining, 60)
+
+        if days > 0 or (hours == 0 and minutes == 0 and seconds == 0):
+            return "%d %s" % (days, "day" if days == 1 else "days")
+        return "%02d:%02d:%02d" % (hours, minutes, seconds)
+
+    @classmethod
+    def _fs_disk_quota_to_project_quota(cls, dquot: FsDiskQuota) -> ProjectQuota:
+        """
+        Convert a fs_disk_quota struct returned by quotactl() into a ProjectQuota namedtuple
+
+        :param dquot: Struct filled by Q_XGETQUOTA or Q_XGETNEXTQUOTA quotactl command
+        :type dquot: FsDiskQuota
+        :returns: Namedtuple with soft/hard/used values in bytes
+        :rtype: ProjectQuota
+        """
+
+        # Timers are signed 32 bits values extended with 8 more high bits on bigtime enabled filesystems
+        btimer = (dquot.d_btimer & 0xFFFFFFFF) | ((dquot.d_btimer_hi & 0xFF) << 32)
+        itimer = (dquot.d_itimer & 0xFFFFFFFF) | ((dquot.d_itimer_hi & 0xFF) << 32)
+
+        return ProjectQuota(
+            proj_id=dquot.d_id,
+            used=dquot.d_bcount * XFS_BB_SIZE,
+            soft=dquot.d_blk_softlimit * XFS_BB_SIZE,
+            hard=dquot.d_blk_hardlimit * XFS_BB_SIZE,
+            warn=dquot.d_bwarns,
+            grace=cls._format_grace(btimer),
+            iused=dquot.d_icount,
+            isoft=dquot.d_ino_softlimit,
+            ihard=dquot.d_ino_hardlimit,
+            iwarn=dquot.d_iwarns,
+            igrace=cls._format_grace(itimer),
+        )
+
+    def _quotactl(self, cmd: int, proj_id: int, dquot: FsDiskQuota) -> None:
+        """
+        Call quotactl() for given project id against mnt_point block device
+
+        :param cmd: Quotactl XFS command, e.g: Q_XGETQUOTA (QCMD with PRJQUOTA will be applied)
+        :type cmd: int
+        :param proj_id: Project id to send command for
+        :type proj_id: int
+        :param dquot: Struct to be filled or read by the kernel
+        :type dquot: FsDiskQuota
+        :raises XfsPrjQuotaQuotactlError: If quotactl() call failed
+        """
+
+        instrument = self.instrument
+        start = time.perf_counter() if instrument is not None else 0.0
+
+        ret = LIBC.quotactl(qcmd(cmd, PRJQUOTA), self.device.encode("utf-8"), proj_id, ctypes.byref(dquot))
+        err = ctypes.get_errno() if ret != 0 else 0
+
+        if instrument is not None:
+            instrument(CallTiming("quotactl", QUOTACTL_COMMAND_NAMES.get(cmd, hex(cmd)), time.perf_counter() - start, ctypes.sizeof(dquot), os.strerror(err) if err else None))
+
+        if ret != 0:
+            name = QUOTACTL_COMMAND_NAMES.get(cmd, hex(cmd))
+            raise XfsPrjQuotaQuotactlError(err, ["quotactl", name, self.device, str(proj_id)], "quotactl %s on %s (%s) for project id %d failed: %s" % (name, self.device, self.mnt_point, proj_id, os.strerror(err)))
+
+    def _iter_proj_quota_quotactl(self, include_empty: bool = False) -> Iterator[ProjectQuota]:
+        """
+        Walk all project quotas of mnt_point using Q_XGETNEXTQUOTA quotactl command
+
+        Projects without any block nor inode used are skipped, just like xfs_quota report -b -i does
+
+        :param include_empty: Also yield projects without any block nor inode used but having limits
+        :type include_empty: bool, defaults to False
+        :returns: Iterator of namedtuple with soft/hard/used values in bytes
+        :rtype: iterator
+        """
+
+        dquot = FsDiskQuota()
+        next_id = 0
+        while next_id <= 0xFFFFFFFF:
+            try:
+                self._quotactl(Q_XGETNEXTQUOTA, next_id, dquot)
+            except OSError as exc:
+                if exc.errno == errno.ENOENT:  # No more project id having quota
+                    return
+                raise
+            if dquot.d_bcount or dquot.d_icount or (include_empty and (dquot.d_blk_softlimit or dquot.d_blk_hardlimit or dquot.d_ino_softlimit or dquot.d_ino_hardlimit)):
+                yield self._fs_disk_quota_to_project_quota(dquot)
+            next_id = dquot.d_id + 1
+
+    @overload
+    def list_proj_quota(self, as_table: Literal[False] = False) -> Dict[int, ProjectQuota]: ...
+
+    @overload
+    def list_proj_quota(self, as_table: Literal[True]) -> QuotaTable: ...
+
+    @overload
+    def list_proj_quota(self, as_table: bool) -> Union[Dict[int, ProjectQuota], QuotaTable]: ...
+
+    def list_proj_quota(self, as_table: bool = False) -> Union[Dict[int, ProjectQuota], QuotaTable]:
+        """
+        Query mnt_point with xfs_quota (or quotactl) and return a dict indexed by project id and usage/limit values
+
+        Report may come from cache if cache_ttl has been set
+
+        :param as_table: Return a compact QuotaTable instead of a dict (report is streamed into it if cache is disabled)
+        :type as_table: bool, defaults to False
+        :raises subprocess.CalledProcessError: If xfs_quota command (or quotactl() call, see XfsPrjQuotaQuotactlError) failed
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes (or QuotaTable)
+        :rtype: dict or QuotaTable
+        """
+
+        if as_table:
+            return QuotaTable.from_quotas(self._get_report().values() if self.cache_ttl is not None else self.iter_proj_quota())
+
+        return dict(self._get_report())  # Shallow copy so callers cannot alter cache
+
+    def refresh(self) -> Dict[int, ProjectQuota]:
+        """
+        Fetch a fresh quota report, bypassing and updating cache
+
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
+
+        self.invalidate_cache()
+        return dict(self._get_report())
+
+    def invalidate_cache(self) -> None:
+        """
+        Drop cached quota report so next call fetches a fresh one
+        """
+
+        self._cache = None
+
+    def _get_report(self) -> Dict[int, ProjectQuota]:
+        """
+        Return cached quota report if still valid, fetch (and cache) a new one otherwise
+
+        Returned dict is the cache itself and must not be altered
+
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
+
+        if self.cache_ttl is None:
+            return self._fetch_proj_quota()
+
+        if self._cache is not None and time.monotonic() - self._cache_time < self.cache_ttl:
+            self.cache_hits += 1
+            return self._cache
+
+        self.cache_misses += 1
+        self._store_cache(self._fetch_proj_quota())
+        return self._cache  # type: ignore
+
+    def _store_cache(self, quotas: Dict[int, ProjectQuota]) -> None:
+        """
+        Store a freshly fetched quota report in cache (if enabled)
+
+        :param quotas: Quota report, as returned by _fetch_proj_quota
+        :type quotas: dict
+        """
+
+        if self.cache_ttl is not None:
+            self._cache = quotas
+            self._cache_time = time.monotonic()
+
+    def _update_cache_limits(self, proj_id: int, soft: Optional[int], hard: Optional[int], isoft: Optional[int] = None, ihard: Optional[int] = None) -> None:  # pylint: disable=too-many-arguments
+        """
+        Write-through limits changed by this instance into cached report
+
+        Projects without usage are not part of xfs_quota report so they are not added to cache either
+
+        :param proj_id: Project id whose limits changed
+        :type proj_id: int
+        :param soft: New soft limit in bytes, None if unchanged
+        :type soft: int
+        :param hard: New hard limit in bytes, None if unchanged
+        :type hard: int
+        :param isoft: New inode soft limit, None if unchanged
+        :type isoft: int, defaults to None
+        :param ihard: New inode hard limit, None if unchanged
+        :type ihard: int, defaults to None
+        """
+
+        if self._cache is None or proj_id not in self._cache:
+            return
+        cached = self._cache[proj_id]
+        # Report is in KiB while limits are set in bytes
+        self._cache[proj_id] = cached._replace(
+            soft=cached.soft if soft is None else soft // 1024 * 1024,
+            hard=cached.hard if hard is None else hard // 1024 * 1024,
+            isoft=cached.isoft if isoft is None else isoft,
+            ihard=cached.ihard if ihard is None else ihard,
+        )
+
+    def _limits_applied(self, proj_id: int, soft: Optional[int], hard: Optional[int], isoft: Optional[int] = None, ihard: Optional[int] = None) -> None:  # pylint: disable=too-many-arguments
+        """
+        Keep cached report and reservation ledger in line with limits just applied, whichever API applied them
+
+        :param proj_id: Project id whose limits changed
+        :type proj_id: int
+        :param soft: New soft limit in bytes, None if unchanged
+        :type soft: int
+        :param hard: New hard limit in bytes, None if unchanged
+        :type hard: int
+        :param isoft: New inode soft limit, None if unchanged
+        :type isoft: int, defaults to None
+        :param ihard: New inode hard limit, None if unchanged
+        :type ihard: int, defaults to None
+        """
+
+        self._update_cache_limits(proj_id, soft, hard, isoft=isoft, ihard=ihard)
+        # Inode limits do not reserve any space
+        if self._ledger is not None and (soft is not None or hard is not None):
+            self._ledger.update(proj_id, soft or 0, hard or 0)
+
+    def _fetch_proj_quota(self) -> Dict[int, ProjectQuota]:
+        """
+        Actually query mnt_point with xfs_quota (or quotactl), see list_proj_quota method instead
+
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
+
+        if self.backend == BACKEND_QUOTACTL:
+            return {x.proj_id: x for x in self._iter_proj_quota_quotactl()}
+
+        if self.session is not None:
+            stdout = self._session_run("report", [XFS_QUOTA_REPORT_COMMAND])
+        else:
+            stdout = self._call("subprocess", "report", subprocess.check_output, self._report_cmd())
+
+        return self._call("parse", "report", self._parse_xfs_quota_report, stdout)
+
+    def _report_cmd(self) -> List[str]:
+        """
+        Build xfs_quota command reporting project quotas of mnt_point
+
+        :returns: Command as a list of arguments
+        :rtype: list
+        """
+
+        return [self.xfs_quota, "-x", "-c", XFS_QUOTA_REPORT_COMMAND, str(self.mnt_point)]
+
+    @staticmethod
+    def _parse_xfs_quota_output(proj_id: int, stdout: bytes) -> Optional[ProjectQuota]:
+        """
+        Parse xfs_quota -x -c 'quota -p -b -i -n -N <proj_id>' output
+
+        See get_proj_quota method instead
+
+        :param proj_id: Project id quota has been queried for, not part of the output
+        :type proj_id: int
+        :param stdout: Raw stdout of xfs_quota command
+        :type stdout: bytes
+        :returns: Namedtuple with soft/hard/used values in bytes or None if project has no quota
+        :rtype: ProjectQuota
+        """
+
+        output = str(stdout, "utf-8").strip()
+        if not output:
+            return None
+        re_match = RE_QUOTA_OUTPUT.match(output)
+        assert re_match, "unable to parser xfs_quota quota output: %r" % output
+
+        return ProjectQuota(
+            proj_id=proj_id,
+            used=int(re_match.group("used")) * 1024,  # KiB, just like report command
+            soft=int(re_match.group("soft")) * 1024,
+            hard=int(re_match.group("hard")) * 1024,
+            warn=int(re_match.group("warn")),
+            grace=re_match.group("grace"),
+            iused=int(re_match.group("iused") or 0),
+            isoft=int(re_match.group("isoft") or 0),
+            ihard=int(re_match.group("ihard") or 0),
+            iwarn=int(re_match.group("iwarn") or 0),
+            igrace=re_match.group("igrace") or "--------",
+        )
+
+    def get_proj_quota(self, proj_id: int) -> Optional[ProjectQuota]:
+        """
+        Query mnt_point with xfs_quota (or quotactl) for a single project id, cache is not used
+
+        Cost does not depend on the number of projects on the volume, unlike list_proj_quota
+        With quotactl backend, a project having limits but neither blocks nor inodes used is returned as well, contrary to
+        list_proj_quota. With xfs_quota backend it is not (None is returned), quota command skipping such projects without -v
+
+        :param proj_id: Project id to get quota for
+        :type proj_id: int
+        :raises subprocess.CalledProcessError: If xfs_quota command (or quotactl() call, see XfsPrjQuotaQuotactlError) failed
+        :returns: Namedtuple with soft/hard/used values in bytes or None if project has no quota
+        :rtype: ProjectQuota
+        """
+
+        assert isinstance(proj_id, int) and 0 <= proj_id <= 0xFFFFFFFF, "proj_id parameter must be an integer between 0 and 2^32-1"
+
+        if self.backend == BACKEND_QUOTACTL:
+            dquot = FsDiskQuota()
+            try:
+                self._quotactl(Q_XGETQUOTA, proj_id, dquot)
+            except OSError as exc:
+                if exc.errno == errno.ENOENT:  # No quota for this project id
+                    return None
+                raise
+            return self._fs_disk_quota_to_project_quota(dquot)
+
+        # -p project quota, -n numeric project id, -N hide header
+        command = XFS_QUOTA_QUOTA_COMMAND % proj_id
+        if self.session is not None:
+            stdout = self._session_run("quota", [command])
+        else:
+            stdout = self._call("subprocess", "quota", subprocess.check_output, [self.xfs_quota, "-x", "-c", command, str(self.mnt_point)])
+
+        return self._call("parse", "quota", self._parse_xfs_quota_output, proj_id, stdout)
+
+    def get_proj_quotas(self, proj_ids: Iterable[int]) -> Dict[int, ProjectQuota]:
+        """
+        Query quota for given project ids only, projects without quota are not part of the returned dict
+
+        Each project is queried individually, except with xfs_quota backend without session where
+        a full report is cheaper than forking xfs_quota many times
+
+        :param proj_ids: Project ids to get quota for
+        :type proj_ids: iterable
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
+
+        proj_ids = set(proj_ids)
+        if self.backend == BACKEND_XFS_QUOTA and self.session is None and len(proj_ids) > 1:
+            return {k: v for k, v in self._fetch_proj_quota().items() if k in proj_ids}
+
+        quotas = {}
+        for proj_id in proj_ids:
+            quota = self.get_proj_quota(proj_id)
+            if quota is not None:
+                quotas[proj_id] = quota
+        return quotas
+
+    @property
+    def next_available_project_id(self) -> int:
+        """
+       Return next available project id (current used greatest project id + 1), see allocate_project_id to reuse released ids
+
+       :returns: Int of next free poject id
+       :rtype: int
+       """
+
+        used_ids = self._get_report().keys()
+        return max(used_ids, default=0) + 1
+
+    @property
+    def id_allocator(self) -> ProjectIdAllocator:
+        """
+        Project id allocator, loaded from id_state_file if it exists or built from one quota report on first use
+
+        :returns: Allocator kept up to date by set_proj_id_for_path/allocate_project_id/release_project_id
+        :rtype: ProjectIdAllocator
+        """
+
+        if self._id_allocator is None:
+            self._id_allocator = self._load_id_allocator(self._get_report)
+        return self._id_allocator
+
+    def _load_id_allocator(self, get_report: Callable[[], Dict[int, ProjectQuota]]) -> ProjectIdAllocator:
+        """
+        Load project id allocator from id_state_file if it exists, build it from a quota report otherwise
+
+        :param get_report: Called to get a quota report, only if needed
+        :type get_report: callable
+        :returns: Project id allocator
+        :rtype: ProjectIdAllocator
+        """
+
+        if self.id_state_file is not None and os.path.exists(self.id_state_file):
+            return ProjectIdAllocator.load(self.id_state_file)
+        min_id, max_id = self.id_range
+        return ProjectIdAllocator.from_used_ids(get_report().keys(), min_id=min_id, max_id=max_id, state_file=self.id_state_file)
+
+    def allocate_project_id(self) -> int:
+        """
+        Allocate a free project id, reusing released ones, without querying quota report
+
+        :raises XfsPrjQuotaNoProjectId: If every project id in id_range is in use
+        :returns: Project id that can be assigned to a folder
+        :rtype: int
+        """
+
+        return self.id_allocator.allocate()
+
+    def release_project_id(self, proj_id: int) -> None:
+        """
+        Release project id so allocate_project_id can hand it out again
+
+        Folders must have been moved out of this project and its limits removed first, see __main__
+
+        :param proj_id: Project id no longer in use
+        :type proj_id: int
+        """
+
+        self.id_allocator.release(proj_id)
+
+    @property
+    def ledger(self) -> ReservationLedger:
+        """
+        Reservation ledger, built from one quota report on first use
+
+        :returns: Ledger kept up to date by set_quota_for_proj_id/set_quotas_for_proj_ids
+        :rtype: ReservationLedger
+        """
+
+        if self._ledger is None:
+            self._ledger = ReservationLedger.from_report(self.mnt_point, self._get_report(), overcommit_ratio=self.overcommit_ratio)
+        return self._ledger
+
+    def can_reserve(self, soft: int, hard: int, proj_id: Optional[int] = None) -> bool:
+        """
+        Dry-run reservation against ledger, tell whether given limits could be set without raising nor reserving anything
+
+        Cheap enough to be called thousands of times per second by a scheduler, see ReservationLedger.can_reserve
+
+        :param soft: Soft limit in bytes (0 means no limit)
+        :type soft: int
+        :param hard: Hard limit in bytes (0 means no limit)
+        :type hard: int
+        :param proj_id: Project id the limits are for, its current reservation is replaced, None for a new project
+        :type proj_id: int, defaults to None
+        :returns: True if limits fit in non reserved space
+        :rtype: bool
+        """
+
+        return self.ledger.can_reserve(soft, hard, proj_id=proj_id, free_space=self._free_space())
+
+    def raise_not_enough_space(self, quota: int) -> None:
+        """
+        Raise exception if requested quota cannot be fulfilled
+
+        :param quota: Quota to verify in bytes (0 or positive integer)
+        :type quota: int
+        :raises XfsPrjQuotaNoSpace: If requested quota exceed available non reserved space
+        """
+
+        assert quota is None or (isinstance(quota, int) and quota >= 0), "quota parameter must be a positive integer or zero"
+
+        if self.reservation_ledger:
+            self.ledger.raise_not_enough_space(quota, quota, free_space=self._free_space())
+            return
+
+        self._raise_not_enough_space_from(quota, self._free_space(), self._get_report())
+
+    def _raise_not_enough_space_from(self, quota: int, free_space: int, quotas: Dict[int, ProjectQuota]) -> None:
+        """
+        Raise exception if requested quota cannot be fulfilled given current free space and quota report
+
+        See raise_not_enough_space method instead
+
+        :param quota: Quota to verify in bytes (0 or positive integer)
+        :type quota: int
+        :param free_space: Free space on mnt_point in bytes
+        :type free_space: int
+        :param quotas: Current quota report, as returned by list_proj_quota
+        :type quotas: dict
+        :raises XfsPrjQuotaNoSpace: If requested quota exceed available non reserved space
+        """
+
+        reserved_by_quotas = sum([max(x.soft, x.hard) for x in quotas.values()])
+        available_space = free_space - reserved_by_quotas
+
+        if quota > available_space:
+            err_msg = "Cannot allocate %d bytes soft quota, max available is %d bytes" % (quota, available_space)
+            self.logger.error(err_msg)
+            raise XfsPrjQuotaNoSpace(err_msg, max_available_bytes=available_space)
+
+    def _set_quota_for_proj_id_quotactl(self, proj_id: int, bsoft: Optional[int], bhard: Optional[int], isoft: Optional[int] = None, ihard: Optional[int] = None) -> None:  # pylint: disable=too-many-arguments
+        """
+        Set block and inode limits for given project id using Q_XSETQLIM quotactl command
+
+        :param proj_id: Project id to set limits for
+        :type proj_id: int
+        :param bsoft: Block soft limit in bytes (0 means no limit), None to leave unchanged
+        :type bsoft: int
+        :param bhard: Block hard limit in bytes (0 means no limit), None to leave unchanged
+        :type bhard: int
+        :param isoft: Inode soft limit (0 means no limit), None to leave unchanged
+        :type isoft: int, defaults to None
+        :param ihard: Inode hard limit (0 means no limit), None to leave unchanged
+        :type ihard: int, defaults to None
+        :raises XfsPrjQuotaQuotactlError: If quotactl() call failed
+        """
+
+        dquot = FsDiskQuota()
+        dquot.d_version = FS_DQUOT_VERSION
+        dquot.d_flags = FS_PROJ_QUOTA
+        dquot.d_id = proj_id
+        dquot.d_fieldmask = 0
+        if bsoft is not None:
+            dquot.d_fieldmask |= FS_DQ_BSOFT
+            dquot.d_blk_softlimit = bsoft // XFS_BB_SIZE  # xfs_quota rounds bytes down to basic blocks too
+        if bhard is not None:
+            dquot.d_fieldmask |= FS_DQ_BHARD
+            dquot.d_blk_hardlimit = bhard // XFS_BB_SIZE
+        if isoft is not None:
+            dquot.d_fieldmask |= FS_DQ_ISOFT
+            dquot.d_ino_softlimit = isoft
+        if ihard is not None:
+            dquot.d_fieldmask |= FS_DQ_IHARD
+            dquot.d_ino_hardlimit = ihard
+
+        self._quotactl(Q_XSETQLIM, proj_id, dquot)
+
+    def set_quota_for_proj_id(self, proj_id: int, soft: Optional[int] = None, hard: Optional[int] = None, safe_space: bool = True, isoft: Optional[int] = None, ihard: Optional[int] = None) -> None:  # pylint: disable=too-many-arguments
+        """
+        Set soft/hard quotas for given project_id
+
+        Will be done using xfs_quota command (or quotactl() with BACKEND_QUOTACTL)
+
+        :param proj_id: Project id to set
+        :type proj_id: int
+        :param soft: Assign given soft quota (bytes)
+        :type soft: int, defaults to None
+        :param hard: Assign given hard quota (bytes)
+        :type hard: int, defaults to None
+        :param safe_space: Set to True if you want to check there is enough free space (reserved quota taken in account too)
+        :type safe_space: bool, defaults to True
+        :param isoft: Assign given inode soft quota (0 to remove it), None leaves current value unchanged
+        :type isoft: int, defaults to None
+        :param ihard: Assign given inode hard quota (0 to remove it), None leaves current value unchanged
+        :type ihard: int, defaults to None
+        :raises XfsPrjQuotaNoSpace: If safe_space == True but request quota exceed available non reserved space
+        :raises subprocess.CalledProcessError: If xfs_quota command (or quotactl() call, see XfsPrjQuotaQuotactlError) failed
+        """
+
+        self._assert_quota_args(proj_id, soft, hard, safe_space, isoft, ihard)
+
+        valid_soft = 0 if soft is None else soft
+        valid_hard = 0 if hard is None else hard
+
+        if safe_space and self.reservation_ledger:
+            self.ledger.raise_not_enough_space(valid_soft, valid_hard, proj_id=proj_id, free_space=self._free_space())
+        elif safe_space:
+            # Whichever limit is larger is what gets reserved, check it once against a single report
+            self.raise_not_enough_space(max(valid_soft, valid_hard))
+
+        if self.backend == BACKEND_QUOTACTL:
+            self._set_quota_for_proj_id_quotactl(proj_id, valid_soft, valid_hard, isoft=isoft, ihard=ihard)
+        elif self.session is not None:
+            command = self._limit_command(proj_id, valid_soft, valid_hard, isoft=isoft, ihard=ihard)
+            output = self._session_run("limit", [command])
+            # limit prints nothing on success, there is no exit code to check in a session
+            if output.strip():
+                raise subprocess.CalledProcessError(1, command, output=output)
+        else:
+            self._call("subprocess", "limit", subprocess.check_call, self._limit_cmd(proj_id, valid_soft, valid_hard, isoft=isoft, ihard=ihard))
+
+        self._limits_applied(proj_id, valid_soft, valid_hard, isoft=isoft, ihard=ihard)
+
+    def set_inode_quota_for_proj_id(self, proj_id: int, isoft: Optional[int] = None, ihard: Optional[int] = None) -> None:
+        """
+        Set inode soft/hard quotas for given project_id, block limits are left unchanged
+
+        Inode limits do not reserve any space so there is no free space check
+
+        :param proj_id: Project id to set
+        :type proj_id: int
+        :param isoft: Assign given inode soft quota (0 to remove it), None leaves current value unchanged
+        :type isoft: int, defaults to None
+        :param ihard: Assign given inode hard quota (0 to remove it), None leaves current value unchanged
+        :type ihard: int, defaults to None
+        :raises subprocess.CalledProcessError: If xfs_quota command (or quotactl() call, see XfsPrjQuotaQuotactlError) failed
+        """
+
+        self._assert_quota_args(proj_id, None, None, False, isoft, ihard)
+        if isoft is None and ihard is None:
+            return
+
+        if self.backend == BACKEND_QUOTACTL:
+            self._set_quota_for_proj_id_quotactl(proj_id, None, None, isoft=isoft, ihard=ihard)
+        elif self.session is not None:
+            command = self._limit_command(proj_id, None, None, isoft=isoft, ihard=ihard)
+            output = self._session_run("limit", [command])
+            if output.strip():
+                raise subprocess.CalledProcessError(1, command, output=output)
+        else:
+            self._call("subprocess", "limit", subprocess.check_call, self._limit_cmd(proj_id, None, None, isoft=isoft, ihard=ihard))
+
+        self._limits_applied(proj_id, None, None, isoft=isoft, ihard=ihard)
+
+    @staticmethod
+    def _assert_quota_args(proj_id: int, soft: Optional[int], hard: Optional[int], safe_space: bool, isoft: Optional[int], ihard: Optional[int]) -> None:  # pylint: disable=too-many-arguments
+        """
+        Validate set_quota_for_proj_id parameters
+
+        :raises AssertionError: If any of the parameters is invalid
+        """
+
+        assert isinstance(proj_id, int) and proj_id >= 0, "proj_id parameter must be a positive or zero integer"
+        assert soft is None or (isinstance(soft, int) and soft > 0), "soft parameter must be a positive integer or None"
+        assert hard is None or (isinstance(hard, int) and hard > 0), "hard parameter must be a positive integer or None"
+        assert safe_space is True or safe_space is False, "safe_space parameter must be True or False"
+        assert isoft is None or (isinstance(isoft, int) and isoft >= 0), "isoft parameter must be a positive or zero integer or None"
+        assert ihard is None or (isinstance(ihard, int) and ihard >= 0), "ihard parameter must be a positive or zero integer or None"
+
+    @staticmethod
+    def _limit_command(proj_id: int, bsoft: Optional[int], bhard: Optional[int], isoft: Optional[int] = None, ihard: Optional[int] = None) -> str:  # pylint: disable=too-many-arguments
+        """
+        Build xfs_quota limit command (to be passed with -c) setting limits for given project id
+
+        :param proj_id: Project id to set limits for
+        :type proj_id: int
+        :param bsoft: Block soft limit in bytes (0 means no limit), None to leave unchanged
+        :type bsoft: int
+        :param bhard: Block hard limit in bytes (0 means no limit), None to leave unchanged
+        :type bhard: int
+        :param isoft: Inode soft limit (0 means no limit), None to leave unchanged
+        :type isoft: int, defaults to None
+        :param ihard: Inode hard limit (0 means no limit), None to leave unchanged
+        :type ihard: int, defaults to None
+        :returns: xfs_quota limit command
+        :rtype: str
+        """
+
+        limits = " ".join("%s=%d" % (k, v) for k, v in (("bsoft", bsoft), ("bhard", bhard), ("isoft", isoft), ("ihard", ihard)) if v is not None)
+        return "limit -p %s %d" % (limits, proj_id)
+
+    def _limit_cmd(self, proj_id: int, bsoft: Optional[int], bhard: Optional[int], isoft: Optional[int] = None, ihard: Optional[int] = None) -> List[str]:  # pylint: disable=too-many-arguments
+        """
+        Build xfs_quota command setting limits for given project id
+
+        See _limit_command for parameters description
+
+        :returns: Command as a list of arguments
+        :rtype: list
+        """
+
+        return [self.xfs_quota, "-x", "-c", self._limit_command(proj_id, bsoft, bhard, isoft=isoft, ihard=ihard), str(self.mnt_point)]
+
+    @staticmethod
+    def _assert_batch_limits(limits: Dict[int, Union[QuotaLimits, tuple]], safe_space: bool) -> Dict[int, QuotaLimits]:
+        """
+        Validate set_quotas_for_proj_ids parameters and normalize limits as QuotaLimits
+
+        :raises AssertionError: If any of the parameters is invalid
+        :returns: Dict with project id as key and QuotaLimits as value
+        :rtype: dict
+        """
+
+        assert isinstance(limits, dict), "limits parameter must be a dict with project id as key and QuotaLimits (or soft, hard tuple) as value"
+        valid_limits = {}
+        for proj_id, limit in limits.items():
+            assert isinstance(limit, tuple), "limits parameter values must be QuotaLimits (or soft, hard tuple)"
+            valid_limit = limit if isinstance(limit, QuotaLimits) else QuotaLimits(*limit)
+            XfsPrjQuota._assert_quota_args(proj_id, valid_limit.soft, valid_limit.hard, safe_space, valid_limit.isoft, valid_limit.ihard)
+            valid_limits[proj_id] = valid_limit
+        return valid_limits
+
+    def _raise_not_enough_space_for_batch(self, limits: Dict[int, QuotaLimits], free_space: int, quotas: Dict[int, ProjectQuota]) -> None:
+        """
+        Raise exception if the whole batch of limits cannot be fulfilled
+
+        Current reservation of project ids being changed by the batch is replaced by the requested one
+
+        :param limits: Dict with project id as key and QuotaLimits as value
+        :type limits: dict
+        :param free_space: Free space on mnt_point in bytes
+        :type free_space: int
+        :param quotas: Current quota report, as returned by list_proj_quota
+        :type quotas: dict
+        :raises XfsPrjQuotaNoSpace: If requested quotas exceed available non reserved space
+        """
+
+        requested = sum([max(x.soft or 0, x.hard or 0) for x in limits.values()])
+        others = {k: v for k, v in quotas.items() if k not in limits}
+        self._raise_not_enough_space_from(requested, free_space, others)
+
+    def _batch_limit_cmds(self, limits: Dict[int, QuotaLimits]) -> List[List[str]]:
+        """
+        Build xfs_quota commands setting all limits with chained -c arguments
+
+        :param limits: Dict with project id as key and QuotaLimits as value
+        :type limits: dict
+        :returns: List of commands, each as a list of arguments, most of the time only one
+        :rtype: list
+        """
+
+        commands = [self._limit_command(k, v.soft or 0, v.hard or 0, isoft=v.isoft, ihard=v.ihard) for k, v in limits.items()]
+        cmds = []
+        for idx in range(0, len(commands), XFS_QUOTA_MAX_BATCH_COMMANDS):
+            cmd = [self.xfs_quota, "-x"]
+            for command in commands[idx : idx + XFS_QUOTA_MAX_BATCH_COMMANDS]:
+                cmd.extend(["-c", command])
+            cmd.append(str(self.mnt_point))
+            cmds.append(cmd)
+        return cmds
+
+    @staticmethod
+    def _batch_result_from_report(limits: Dict[int, QuotaLimits], quotas: Dict[int, ProjectQuota], error: str) -> BatchResult:
+        """
+        Find out which limits have actually been applied by comparing them against a fresh report
+
+        Used when xfs_quota reported an error, as chained commands do not tell which one failed
+
+        :param limits: Dict with project id as key and QuotaLimits as value
+        :type limits: dict
+        :param quotas: Quota report fetched after limits have been applied
+        :type quotas: dict
+        :param error: Error message to associate to project ids whose limits have not been applied
+        :type error: str
+        :returns: Succeeded and failed project ids
+        :rtype: BatchResult
+        """
+
+        result = BatchResult(succeeded=[], failed={})
+        for proj_id, limit in limits.items():
+            # Report is in KiB while limits are set in bytes
+            expected = ((limit.soft or 0) // 1024, (limit.hard or 0) // 1024)
+            current = quotas.get(proj_id)
+            found = (current.soft // 1024, current.hard // 1024) if current is not None else (0, 0)  # Projects without usage are not reported
+            # Inode limits left unchanged (None) cannot be verified
+            inodes_applied = (limit.isoft is None or limit.isoft == (current.isoft if current is not None else 0)) and (limit.ihard is None or limit.ihard == (current.ihard if current is not None else 0))
+            if found == expected and inodes_applied:
+                result.succeeded.append(proj_id)
+            else:
+                result.failed[proj_id] = error
+        return result
+
+    def _set_quotas_for_proj_ids_quotactl(self, limits: Dict[int, QuotaLimits]) -> BatchResult:
+        """
+        Apply all limits with one Q_XSETQLIM quotactl call per project id
+
+        :param limits: Dict with project id as key and QuotaLimits as value
+        :type limits: dict
+        :returns: Succeeded and failed project ids
+        :rtype: BatchResult
+        """
+
+        result = BatchResult(succeeded=[], failed={})
+        for proj_id, limit in limits.items():
+            try:
+                self._set_quota_for_proj_id_quotactl(proj_id, limit.soft or 0, limit.hard or 0, isoft=limit.isoft, ihard=limit.ihard)
+            except OSError as exc:
+                result.failed[proj_id] = str(exc)
+            else:
+                result.succeeded.append(proj_id)
+        return result
+
+    def set_quotas_for_proj_ids(self, limits: Dict[int, Union[QuotaLimits, tuple]], safe_space: bool = True) -> BatchResult:
+        """
+        Set soft/hard quotas for many project ids at once
+
+        Free space is checked once for the whole batch (current reservation of the project ids in the batch being
+        replaced by the requested one), then all limits are applied with a single xfs_quota process chaining -c commands
+        (or a quotactl() loop with BACKEND_QUOTACTL)
+
+        :param limits: Dict with project id as key and QuotaLimits (or soft, hard tuple) as value
+        :type limits: dict
+        :param safe_space: Set to True if you want to check there is enough free space (reserved quota taken in account too)
+        :type safe_space: bool, defaults to True
+        :raises XfsPrjQuotaNoSpace: If safe_space == True but the batch exceed available non reserved space, nothing is applied
+        :returns: Succeeded and failed project ids, failed ones associated to an error message
+        :rtype: BatchResult
+        """
+
+        valid_limits = self._assert_batch_limits(limits, safe_space)
+        if not valid_limits:
+            return BatchResult(succeeded=[], failed={})
+
+        if safe_space and self.reservation_ledger:
+            self.ledger.raise_not_enough_space_for_batch(valid_limits, free_space=self._free_space())
+        elif safe_space:
+            self._raise_not_enough_space_for_batch(valid_limits, self._free_space(), self._get_report())
+
+        if self.backend == BACKEND_QUOTACTL:
+            result = self._set_quotas_for_proj_ids_quotactl(valid_limits)
+        else:
+            errors = []
+            if self.session is not None:
+                commands = [self._limit_command(k, v.soft or 0, v.hard or 0, isoft=v.isoft, ihard=v.ihard) for k, v in valid_limits.items()]
+                for idx in range(0, len(commands), XFS_QUOTA_MAX_BATCH_COMMANDS):
+                    output = self._session_run("limit_batch", commands[idx : idx + XFS_QUOTA_MAX_BATCH_COMMANDS])
+                    if output.strip():
+                        errors.append(str(output, "utf-8", "replace").strip())
+            else:
+                for cmd in self._batch_limit_cmds(valid_limits):
+                    process = self._call("subprocess", "limit_batch", subprocess.run, cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+                    if process.returncode != 0 or process.stderr.strip():
+                        errors.append(str(process.stderr, "utf-8", "replace").strip() or "xfs_quota exited with code %d" % process.returncode)
+            if errors:
+                quotas = self._fetch_proj_quota()
+                self._store_cache(quotas)
+                result = self._batch_result_from_report(valid_limits, quotas, "\n".join(errors))
+            else:
+                result = BatchResult(succeeded=list(valid_limits), failed={})
+
+        for proj_id in result.succeeded:
+            limit = valid_limits[proj_id]
+            self._limits_applied(proj_id, limit.soft or 0, limit.hard or 0, isoft=limit.isoft, ihard=limit.ihard)
+
+        for proj_id, error in result.failed.items():
+            self.logger.error("Unable to set limits for project id %d: %s", proj_id, error)
+
+        return result
+
+    @property
+    def lock_path(self) -> str:
+        """
+        Provisioning lock file, named after filesystem device number so every mount point of a filesystem shares it
+
+        :returns: Lock file path
+        :rtype: str
+        """
+
+        if self._lock_path is None:
+            lock_dir = self.lock_dir or next((x for x in PROVISIONING_LOCK_DIRS if os.access(x, os.W_OK)), PROVISIONING_LOCK_DIRS[-1])
+            self._lock_path = os.path.join(lock_dir, "python-xfs-quota-%d.lock" % os.stat(self.mnt_point).st_dev)
+        return self._lock_path
+
+    @contextlib.contextmanager
+    def provisioning_lock(self) -> Iterator[None]:
+        """
+        Context manager holding an exclusive flock() on lock_path while enclosed code runs
+
+        Lock file is opened again on every call, so threads of a process exclude each other just like processes do
+
+        :returns: Nothing, lock is released on exit
+        :rtype: iterator
+        """
+
+        with self._provisioning_lock_fd():
+            yield
+
+    @contextlib.contextmanager
+    def _provisioning_lock_fd(self) -> Iterator[int]:
+        """
+        Same as provisioning_lock, giving access to lock file descriptor
+
+        :returns: Lock file descriptor, closed on exit
+        :rtype: iterator
+        """
+
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        try:
+            self._call("lock", "flock", fcntl.flock, lock_fd, fcntl.LOCK_EX)
+            yield lock_fd
+        finally:
+            # Closing the file releases the lock
+            os.close(lock_fd)
+
+    @contextlib.contextmanager
+    def _provisioning(self, shared: bool) -> Iterator[None]:
+        """
+        Hold provisioning lock for create_quota_dir/release_quota_dir, reloading shared state only if needed
+
+        Every provisioning writes a new random token (generation) to lock file. If the token found there is not the one
+        this instance wrote last, another instance provisioned meanwhile and id allocator and ledger are reloaded,
+        otherwise they are still accurate and provisioning does not cost a quota report
+
+        :param shared: Reload id allocator and ledger if another instance provisioned since, False to never reload
+        :type shared: bool
+        :returns: Nothing, lock is released on exit
+        :rtype: iterator
+        """
+
+        with self._provisioning_lock_fd() as lock_fd:
+            if shared and os.pread(lock_fd, PROVISIONING_GENERATION_SIZE, 0) != self._shared_generation:
+                self._reload_shared_state()
+            try:
+                yield
+            finally:
+                self._shared_generation = os.urandom(PROVISIONING_GENERATION_SIZE)
+                os.pwrite(lock_fd, self._shared_generation, 0)
+
+    def _limits_report(self) -> Dict[int, ProjectQuota]:
+        """
+        Fetch a fresh quota report, with quotactl backend projects having limits but no block used are included too
+
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
+
+        if self.backend == BACKEND_QUOTACTL:
+            return {x.proj_id: x for x in self._iter_proj_quota_quotactl(include_empty=True)}
+        return self.refresh()
+
+    def _reload_shared_state(self) -> None:
+        """
+        Forget cached report and reload id allocator and ledger, other processes may have provisioned since they were built
+
+        With quotactl backend, projects having limits but no usage yet (e.g: just created by another process) are taken in account too.
+        Without id_state_file, ids found in the report are marked as used in current allocator so ids it released are still reused
+
+        Must be called with provisioning lock held
+        """
+
+        quotas: Optional[Dict[int, ProjectQuota]] = None
+
+        def get_report() -> Dict[int, ProjectQuota]:
+            nonlocal quotas
+            if quotas is None:
+                quotas = self._limits_report()
+            return quotas
+
+        self.invalidate_cache()
+        if self._id_allocator is None or (self.id_state_file is not None and os.path.exists(self.id_state_file)):
+            self._id_allocator = self._load_id_allocator(get_report)
+        else:
+            for proj_id in get_report():
+                self._id_allocator.mark_used(proj_id)
+        if self.reservation_ledger:
+            self._ledger = ReservationLedger.from_report(self.mnt_point, get_report(), overcommit_ratio=self.overcommit_ratio)
+
+    def create_quota_dir(
+        self,
+        path: Union[str, pathlib.Path],
+        soft: Optional[int] = None,
+        hard: Optional[int] = None,
+        safe_space: bool = True,
+        isoft: Optional[int] = None,
+        ihard: Optional[int] = None,
+        shared: bool = True,
+    ) -> int:  # pylint: disable=too-many-arguments
+        """
+        Create a folder with its own project id and limits as a single transaction, safe to call from concurrent threads and processes
+
+        Under provisioning lock: allocate a project id, create the folder, assign the project id and set limits.
+        If any step fails, previous ones are rolled back (project id reset to 0, folder removed, project id released)
+        and the exception is raised again, e.g: XfsPrjQuotaNoSpace
+
+        Use id_state_file when several processes provision the same filesystem: projects without usage are not
+        part of quota report, so an allocator rebuilt from a report may hand out an id already assigned to an empty folder
+
+        :param path: Folder to create, its parent must exist
+        :type path: str or pathlib.Path
+        :param soft: Assign given soft quota (bytes)
+        :type soft: int, defaults to None
+        :param hard: Assign given hard quota (bytes)
+        :type hard: int, defaults to None
+        :param safe_space: Set to True if you want to check there is enough free space (reserved quota taken in account too)
+        :type safe_space: bool, defaults to True
+        :param isoft: Assign given inode soft quota, None for no limit
+        :type isoft: int, defaults to None
+        :param ihard: Assign given inode hard quota, None for no limit
+        :type ihard: int, defaults to None
+        :param shared: Reload id allocator and ledger under the lock if another instance provisioned this filesystem since this one last did, False if only this instance does
+        :type shared: bool, defaults to True
+        :raises FileExistsError: If path already exists
+        :raises XfsPrjQuotaNoSpace: If safe_space == True but request quota exceed available non reserved space
+        :raises XfsPrjQuotaNoProjectId: If every project id in id_range is in use
+        :returns: Project id assigned to the folder
+        :rtype: int
+        """
+
+        self._assert_quota_args(0, soft, hard, safe_space, isoft, ihard)
+        assert isinstance(path, (str, pathlib.Path)) and path, "path parameter must be a non-emtpy string (or pathlib.Path)"
+        path = pathlib.Path(path) if isinstance(path, str) else path
+        assert self.mnt_point in path.parents, "provided path %s is not a sub path of %s" % (path, self.mnt_point)
+
+        with self._provisioning(shared):
+            proj_id = self.allocate_project_id()
+            created = tagged = False
+            try:
+                os.mkdir(path)
+                created = True
+                self.set_proj_id_for_path(path, proj_id)
+                tagged = True
+                self.set_quota_for_proj_id(proj_id, soft=soft, hard=hard, safe_space=safe_space, isoft=isoft, ihard=ihard)
+            except BaseException:
+                self._rollback_quota_dir(path, proj_id, created, tagged)
+                raise
+
+        self.logger.info("Folder %s created with project id %d", path, proj_id)
+        return proj_id
+
+    def _rollback_quota_dir(self, path: pathlib.Path, proj_id: int, created: bool, tagged: bool) -> None:
+        """
+        Undo create_quota_dir steps already done, errors are logged so the original exception is the one raised
+
+        :param path: Folder being created
+        :type path: pathlib.Path
+        :param proj_id: Project id allocated for the folder
+        :type proj_id: int
+        :param created: True if folder has been created
+        :type created: bool
+        :param tagged: True if project id has been assigned to folder
+        :type tagged: bool
+        """
+
+        try:
+            if tagged:
+                # Limits may have been partially applied
+                self.set_quota_for_proj_id(proj_id, safe_space=False, isoft=0, ihard=0)
+                self.set_proj_id_for_path(path, 0)
+            if created:
+                os.rmdir(path)
+            self.release_project_id(proj_id)
+            self.logger.warning("Creation of folder %s with project id %d rolled back", path, proj_id)
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception("Unable to roll back creation of folder %s with project id %d", path, proj_id)
+
+    def release_quota_dir(self, path: Union[str, pathlib.Path], shared: bool = True) -> int:
+        """
+        Detach a folder from its project: reset its project id to 0, remove project limits and release project id, under provisioning lock
+
+        Folder and its content are left in place, files below it keep their project id until moved or deleted
+
+        :param path: Folder created by create_quota_dir (or tagged with set_proj_id_for_path)
+        :type path: str or pathlib.Path
+        :param shared: Reload id allocator and ledger under the lock if another instance provisioned this filesystem since this one last did, False if only this instance does
+        :type shared: bool, defaults to True
+        :raises AssertionError: If folder has no project id
+        :returns: Released project id
+        :rtype: int
+        """
+
+        with self._provisioning(shared):
+            proj_id = self.get_proj_id_for_path(path)
+            assert proj_id != 0, "provided path %s has no project id" % path
+            self.set_proj_id_for_path(path, 0)
+            self.set_quota_for_proj_id(proj_id, safe_space=False, isoft=0, ihard=0)
+            self.release_project_id(proj_id)
+
+        self.logger.info("Folder %s and project id %d released", path, proj_id)
+        return proj_id
+
+    def export_snapshot(self, snapshot_file: Union[str, pathlib.Path], paths: bool = True, workers: int = 8) -> int:
+        """
+        Write project limits (and folders project ids are assigned to) of mnt_point to a JSON lines file, for restore_snapshot
+
+        First line is a header ({"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION, ...}), then one compact line per project:
+        {"id": 42, "soft": 1048576, "hard": 2097152, "isoft": 0, "ihard": 10000, "paths": ["tenants/a"]}, limits in bytes
+        (inodes for isoft/ihard, 0 for none) and paths relative to mnt_point so a snapshot can be restored on a volume mounted elsewhere.
+        Folders are taken from path index if enabled (it must be up to date), otherwise from a parallel walk of mnt_point folders.
+        File is written atomically
+
+        :param snapshot_file: File to write
+        :type snapshot_file: str or pathlib.Path
+        :param paths: Export project root folders too
+        :type paths: bool, defaults to True
+        :param workers: Number of threads walking mnt_point, only used with paths but without path index
+        :type workers: int, defaults to 8
+        :returns: Number of exported projects
+        :rtype: int
+        """
+
+        assert isinstance(snapshot_file, (str, pathlib.Path)) and str(snapshot_file), "snapshot_file parameter must be a non-empty string (or pathlib.Path)"
+        assert paths is True or paths is False, "paths parameter must be True or False"
+
+        mnt_point = str(self.mnt_point)
+        mnt_prefix = mnt_point.rstrip("/") + "/"
+        proj_paths: Dict[int, List[str]] = {}
+        if paths and self.path_index is not None:
+            proj_paths = self.path_index.mapping(mnt_point)
+        elif paths:
+            for path, proj_id in sorted(self._find_project_roots(os.path.normpath(mnt_point), workers).items()):
+                if proj_id:
+                    proj_paths.setdefault(proj_id, []).append(path)
+
+        quotas = self._limits_report()
+        proj_ids = sorted({x.proj_id for x in quotas.values() if x.soft or x.hard or x.isoft or x.ihard} | set(proj_paths))
+
+        snapshot_path = pathlib.Path(snapshot_file)
+        tmp_file = snapshot_path.with_name(snapshot_path.name + ".tmp")
+        with open(tmp_file, "w") as snapshot_fh:
+            header = {"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION, "mnt_point": mnt_point, "time": time.time(), "projects": len(proj_ids)}
+            snapshot_fh.write(json.dumps(header, sort_keys=True) + "\n")
+            for proj_id in proj_ids:
+                quota = quotas.get(proj_id)
+                entry: Dict[str, Any] = {"id": proj_id, "soft": quota.soft if quota else 0, "hard": quota.hard if quota else 0, "isoft": quota.isoft if quota else 0, "ihard": quota.ihard if quota else 0}
+                if proj_id in proj_paths:
+                    entry["paths"] = [x[len(mnt_prefix) :] if x.startswith(mnt_prefix) else "." for x in proj_paths[proj_id]]
+                snapshot_fh.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            snapshot_fh.flush()
+            os.fsync(snapshot_fh.fileno())
+        os.replace(tmp_file, snapshot_path)
+
+        self.logger.info("Snapshot of %d projects of %s written to %s", len(proj_ids), mnt_point, snapshot_path)
+        return len(proj_ids)
+
+    @staticmethod
+    def _read_snapshot(snapshot_file: Union[str, pathlib.Path]) -> Iterator[Dict[str, Any]]:
+        """
+        Read project entries of a file written by export_snapshot
+
+        Version 1 files have no isoft/ihard keys, restore_snapshot leaves inode limits unchanged for them
+
+        :param snapshot_file: File to read
+        :type snapshot_file: str or pathlib.Path
+        :raises AssertionError: If file is not a snapshot or its version is not supported
+        :returns: Iterator of dicts with id, soft, hard and (optional) isoft, ihard and paths keys
+        :rtype: iterator
+        """
+
+        with open(snapshot_file, "r") as snapshot_fh:
+            try:
+                header = json.loads(snapshot_fh.readline())
+            except ValueError:
+                header = None
+            assert isinstance(header, dict) and header.get("format") == SNAPSHOT_FORMAT, "%s is not a project quota snapshot" % snapshot_file
+            assert header.get("version") in range(1, SNAPSHOT_VERSION + 1), "unsupported snapshot version %r in %s" % (header.get("version"), snapshot_file)
+            for line in snapshot_fh:
+                if line.strip():
+                    yield json.loads(line)
+
+    def restore_snapshot(
+        self,
+        snapshot_file: Union[str, pathlib.Path],
+        paths: bool = True,
+        prune: bool = False,
+        safe_space: bool = True,
+        workers: int = 8,
+    ) -> RestoreResult:  # pylint: disable=too-many-arguments,too-many-locals
+        """
+        Apply a file written by export_snapshot to mnt_point, only what differs from current state is changed
+
+        Snapshot is compared with a single quota report and every changed limit is applied by one set_quotas_for_proj_ids
+        batch, folders project ids are read and set with a thread pool (only snapshot folders are tagged, not their
+        content, see set_proj_id_for_tree). Everything runs under provisioning lock
+
+        :param snapshot_file: File written by export_snapshot
+        :type snapshot_file: str or pathlib.Path
+        :param paths: Restore folders project ids too, folders missing on mnt_point are reported in tag_failed
+        :type paths: bool, defaults to True
+        :param prune: Remove limits of projects not found in snapshot
+        :type prune: bool, defaults to False
+        :param safe_space: Check there is enough free space for restored limits, see set_quotas_for_proj_ids
+        :type safe_space: bool, defaults to True
+        :param workers: Number of threads sending IOCTL
+        :type workers: int, defaults to 8
+        :raises AssertionError: If file is not a snapshot or its version is not supported
+        :raises XfsPrjQuotaNoSpace: If safe_space == True but restored limits exceed available non reserved space, no limit is applied
+        :returns: Applied changes
+        :rtype: RestoreResult
+        """
+
+        assert prune is True or prune is False, "prune parameter must be True or False"
+        assert isinstance(workers, int) and workers > 0, "workers parameter must be a positive integer"
+
+        start = time.monotonic()
+        snapshot_limits: Dict[int, QuotaLimits] = {}
+        snapshot_paths: Dict[str, int] = {}
+        for entry in self._read_snapshot(snapshot_file):
+            # Version 1 snapshots have no inode limits, they are left unchanged
+            snapshot_limits[entry["id"]] = QuotaLimits(soft=entry["soft"] or None, hard=entry["hard"] or None, isoft=entry.get("isoft"), ihard=entry.get("ihard"))
+            if paths:
+                for path in entry.get("paths", []):
+                    snapshot_paths[os.path.normpath(os.path.join(str(self.mnt_point), path))] = entry["id"]
+
+        with self.provisioning_lock():
+            quotas = self._limits_report()
+            limits = {}
+            for proj_id, limit in snapshot_limits.items():
+                current = quotas.get(proj_id) or ProjectQuota(proj_id, 0, 0, 0, 0, "")
+                if (current.soft, current.hard) != (limit.soft or 0, limit.hard or 0) or limit.isoft not in (None, current.isoft) or limit.ihard not in (None, current.ihard):
+                    limits[proj_id] = limit
+            if prune:
+                limits.update({x.proj_id: QuotaLimits(isoft=0, ihard=0) for x in quotas.values() if x.proj_id not in snapshot_limits and (x.soft or x.hard or x.isoft or x.ihard)})
+            limits_result = self.set_quotas_for_proj_ids(limits, safe_space=safe_space)  # type: ignore
+            if self._id_allocator is not None:
+                for proj_id in snapshot_limits:
+                    if proj_id != 0:
+                        self._id_allocator.mark_used(proj_id)
+
+            current_ids = self.get_proj_ids_for_paths(snapshot_paths, workers=workers, ignore_errors=True)
+            tag_failed = {x: "unable to read project id" for x in snapshot_paths if x not in current_ids}
+            to_tag = [(k, v) for k, v in snapshot_paths.items() if k in current_ids and current_ids[k].proj_id != v]
+            tagged = self._tag_folders(to_tag, workers, tag_failed)
+
+        result = RestoreResult(
+            limits=limits_result,
+            limits_unchanged=len(snapshot_limits) - len([x for x in limits if x in snapshot_limits]),
+            tagged=tagged,
+            tags_unchanged=len(current_ids) - len(to_tag),
+            tag_failed=tag_failed,
+        )
+        self.logger.info(
+            "Snapshot %s restored on %s: %d limits applied, %d failed, %d unchanged, %d folders tagged, %d failed, %d unchanged in %.1fs",
+            snapshot_file,
+            self.mnt_point,
+            len(limits_result.succeeded),
+            len(limits_result.failed),
+            result.limits_unchanged,
+            len(tagged),
+            len(tag_failed),
+            result.tags_unchanged,
+            time.monotonic() - start,
+        )
+        return result
+
+    def _tag_folders(self, folders: List[Tuple[str, int]], workers: int, failed: Dict[str, str]) -> List[str]:
+        """
+        Set project id of many folders with a thread pool, like set_proj_id_for_path does for one
+
+        :param folders: List of (folder path, project id) tuples
+        :type folders: list
+        :param workers: Number of threads sending IOCTL
+        :type workers: int
+        :param failed: Dict updated with folder path as key and error message as value for folders that could not be tagged
+        :type failed: dict
+        :returns: Tagged folders
+        :rtype: list
+        """
+
+        get_xattr, set_xattr = self._ioctl_funcs()
+        local = threading.local()
+
+        def tag(item: Tuple[str, int]) -> Optional[str]:
+            path, proj_id = item
+            fsxattr_struct = getattr(local, "fsxattr_struct", None)
+            if fsxattr_struct is None:
+                fsxattr_struct = local.fsxattr_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
+            try:
+                path_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+                try:
+                    get_xattr(path_fd, FS_IOC_FSGETXATTR, fsxattr_struct, True)
+                    fsxattr_struct[0] = fsxattr_struct[0] | FS_XFLAG_PROJINHERIT
+                    fsxattr_struct[3] = proj_id
+                    set_xattr(path_fd, FS_IOC_FSSETXATTR, fsxattr_struct, True)
+                finally:
+                    os.close(path_fd)
+            except OSError as exc:
+                return str(exc)
+            return None
+
+        tagged = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for (path, proj_id), error in zip(folders, executor.map(tag, folders)):
+                if error is not None:
+                    self.logger.error("Unable to set project id %d on %s: %s", proj_id, path, error)
+                    failed[path] = error
+                    continue
+                tagged.append(path)
+                # Same bookkeeping as set_proj_id_for_path, done from calling thread
+                if self._id_allocator is not None and proj_id != 0:
+                    self._id_allocator.mark_used(proj_id)
+                if self.path_index is not None:
+                    self.path_index.set(path, proj_id)
+
+        if tagged:
+            self.invalidate_cache()
+        return tagged
+
+
+class MountInfo(NamedTuple):
+    """
+    NamedTuple representing one entry of /proc/self/mountinfo
+    """
+
+    mount_id: int
+    mnt_point: str
+    fstype: str
+    device: str
+    opts: List[str]
+    super_opts: List[str]
+
+    @property
+    def has_prjquota(self) -> bool:
+        """
+        True if this is an XFS filesystem mounted with project quota enabled
+        """
+
+        return self.fstype == "xfs" and ("prjquota" in self.super_opts or "prjquota" in self.opts)
+
+
+class QuotaManager:
+    """
+    Handle project quotas of every XFS volume of the host
+
+    /proc/self/mountinfo is parsed once and only parsed again when the kernel signals the mount table changed
+    (POLLPRI on the file), so mapping a path to its volume is O(depth) dict lookups without any syscall,
+    and one XfsPrjQuota instance is kept per mount point
+
+    :param mountinfo: Path of mountinfo file to read mount table from
+    :type mountinfo: str, defaults to /proc/self/mountinfo
+    :param quota_kwargs: Extra keyword arguments passed to every XfsPrjQuota instance (backend, cache_ttl...)
+    """
+
+    def __init__(self, mountinfo: str = "/proc/self/mountinfo", **quota_kwargs: Any) -> None:
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.mountinfo = mountinfo
+        self.quota_kwargs = quota_kwargs
+        self.mounts: Dict[str, MountInfo] = {}
+        self._quotas: Dict[str, XfsPrjQuota] = {}
+        self._lock = threading.RLock()
+
+        self._mountinfo_fh = open(mountinfo, "rb")  # pylint: disable=consider-using-with
+        self._poll = select.poll()
+        self._poll.register(self._mountinfo_fh.fileno(), select.POLLPRI | select.POLLERR)
+        self._load_mounts()
+
+    def close(self) -> None:
+        """
+        Close mountinfo file and XfsPrjQuota instances, manager must not be used anymore afterwards
+        """
+
+        with self._lock:
+            for quota in self._quotas.values():
+                quota.close()
+        self._mountinfo_fh.close()
+
+    @staticmethod
+    def _unescape(value: str) -> str:
+        """
+        Decode octal escaped chars (e.g: \\040 for space) found in mountinfo fields
+
+        :param value: Escaped value
+        :type value: str
+        :returns: Unescaped value
+        :rtype: str
+        """
+
+        return RE_MOUNTS_ESCAPE.sub(lambda x: chr(int(x.group(1), 8)), value)
+
+    @classmethod
+    def parse_mountinfo(cls, content: bytes) -> Dict[str, MountInfo]:
+        """
+        Parse /proc/self/mountinfo content (see proc(5) for format details)
+
+        :param content: Raw mountinfo content
+        :type content: bytes
+        :returns: Dict with mount point as key and MountInfo as value (last mount wins when stacked)
+        :rtype: dict
+        """
+
+        mounts: Dict[str, MountInfo] = {}
+        for line in str(content, "utf-8", "surrogateescape").splitlines():
+            fields = line.split(" ")
+            if len(fields) < 10:
+                continue
+            # Optional fields end with a single dash separator
+            separator = fields.index("-", 6)
+            mount = MountInfo(
+                mount_id=int(fields[0]),
+                mnt_point=cls._unescape(fields[4]),
+                fstype=fields[separator + 1],
+                device=cls._unescape(fields[separator + 2]),
+                opts=fields[5].split(","),
+                super_opts=fields[separator + 3].split(",") if len(fields) > separator + 3 else [],
+            )
+            mounts[mount.mnt_point] = mount
+        return mounts
+
+    def _load_mounts(self) -> None:
+        """
+        (Re)read mount table and drop XfsPrjQuota instances of mount points that changed
+        """
+
+        self._mountinfo_fh.seek(0)
+        mounts = self.parse_mountinfo(self._mountinfo_fh.read())
+        with self._lock:
+            for mnt_point in list(self._quotas):
+                if mounts.get(mnt_point) != self.mounts.get(mnt_point):
+                    self._quotas.pop(mnt_point).close()
+            self.mounts = mounts
+        self.logger.debug("Mount table loaded from %s, %d mount points", self.mountinfo, len(mounts))
+
+    def refresh_if_changed(self) -> bool:
+        """
+        Reload mount table if kernel signaled it changed since last read, this is a cheap non blocking poll() call
+
+        :returns: True if mount table has been reloaded
+        :rtype: bool
+        """
+
+        if self._poll.poll(0):
+            self._load_mounts()
+            return True
+        return False
+
+    def quota_mounts(self) -> List[str]:
+        """
+        List mount points of XFS filesystems mounted with prjquota option
+
+        :returns: Sorted mount points
+        :rtype: list
+        """
+
+        self.refresh_if_changed()
+        return sorted(x.mnt_point for x in self.mounts.values() if x.has_prjquota)
+
+    def find_mount_point(self, path: Union[str, pathlib.Path]) -> str:
+        """
+        Find mount point for given path, i.e: the actual volume the provided path belongs to
+
+        Path is normalized without resolving symlinks and its parents are looked up in mount table index
 
-#: Hex value for fsx_xflags attr of struct fsxattr to set project id inheritance
-FS_XFLAG_PROJINHERIT = 0x200
+        :param path: Absolute path to find root volume for
+        :type path: str or pathlib.Path
+        :returns: Mount point the provided path belongs to
+        :rtype: str
+        """
 
-#: RE matcher for xfs_quota report entries
-RE_QUOTA_REPORT = re.compile(r"^#(?P<proj_id>[0-9]+)\s+(?P<used>[0-9]+)\s+(?P<soft>[0-9]+)\s+(?P<hard>[0-9]+)\s+(?P<warn>[0-9]+)\s+\[(?P<grace>.+)\]$")
+        assert isinstance(path, (str, pathlib.Path)) and str(path).startswith("/"), "path parameter must be a string (or pathlib.Path) starting with /"
 
+        self.refresh_if_changed()
+        mounts = self.mounts
+        current = os.path.normpath(str(path))
+        while current not in mounts and current != "/":
+            current = os.path.dirname(current)
+        return current
 
-class ProjectQuota(NamedTuple):
-    """
-    NamedTuple representing quota usage for a given project id
-    """
+    def get(self, path: Union[str, pathlib.Path]) -> XfsPrjQuota:
+        """
+        Get XfsPrjQuota instance handling the volume given path belongs to
 
-    proj_id: int
-    used: int
-    soft: int
-    hard: int
-    warn: int
-    grace: str
+        :param path: Mount point or any path on it
+        :type path: str or pathlib.Path
+        :raises AssertionError: If volume is not an XFS filesystem mounted with prjquota option
+        :returns: Instance shared by every caller of this manager
+        :rtype: XfsPrjQuota
+        """
 
+        mnt_point = self.find_mount_point(path)
+        with self._lock:
+            quota = self._quotas.get(mnt_point)
+            if quota is None:
+                mount = self.mounts.get(mnt_point)
+                assert mount is not None, "mount_point %s does not seems to be mounted" % mnt_point
+                assert mount.fstype == "xfs", "mount_point %s is not an XFS partition" % mnt_point
+                assert mount.has_prjquota, "mount_point %s is not mounted with prjquota options" % mnt_point
+                quota = self._quotas[mnt_point] = XfsPrjQuota(mnt_point, device=mount.device, **self.quota_kwargs)
+        return quota
 
-class XfsPrjQuotaNoSpace(Exception):
+    def list_all_proj_quota(self, workers: Optional[int] = None) -> Dict[str, Dict[int, ProjectQuota]]:
+        """
+        Report project quotas of every XFS prjquota volume in parallel
+
+        :param workers: Number of reports running at the same time, None for one per volume
+        :type workers: int, defaults to None
+        :returns: Dict with mount point as key and list_proj_quota result as value
+        :rtype: dict
+        """
+
+        quotas = [self.get(x) for x in self.quota_mounts()]
+        if not quotas:
+            return {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers or len(quotas)) as executor:
+            reports = executor.map(lambda x: x.list_proj_quota(), quotas)
+            return {str(quota.mnt_point): report for quota, report in zip(quotas, reports)}
+
+
+class QuotaWatcher:
     """
-    Raised when requested quota cannot be fulfilled
+    Poll project quotas of a volume and yield a QuotaEvent for changed projects only
 
-    :param message: Exception error message
-    :type message: str
-    :param max_available_bytes: Maximum available bytes on this storage
-    :type max_available_bytes: int
+    A project is reported when its usage or limits changed, it crossed warning/critical thresholds, its grace timer
+    started or stopped, or it showed up or disappeared from the report, consumers handle O(changes) per tick
+
+    Full reports are taken every interval seconds, this interval doubles (up to max_interval) after each report
+    without any change. Meanwhile hot projects (usage above hot_percent of their limit) are queried one by one with
+    get_proj_quota every hot_interval seconds, so projects close to their limit are followed closely while idle
+    volumes cost almost nothing. With xfs_quota backend, use an XfsPrjQuota with session=True to avoid forking for hot projects
+
+    Iterate over the instance for a blocking generator or use async for, blocking calls then run in the default executor.
+    stop() ends both (within a second for async iteration), exceptions raised while polling end the iteration too
+
+    :param quota: XfsPrjQuota instance of the volume to watch
+    :type quota: XfsPrjQuota
+    :param warning: Percentage of limit (soft limit, hard one if no soft) raising warning level
+    :type warning: float, defaults to 80.0
+    :param critical: Percentage of limit raising critical level
+    :type critical: float, defaults to 90.0
+    :param interval: Seconds between two full reports while usage changes
+    :type interval: float, defaults to 60.0
+    :param max_interval: Maximum seconds between two full reports while nothing changes
+    :type max_interval: float, defaults to 600.0
+    :param hot_interval: Seconds between two queries of hot projects
+    :type hot_interval: float, defaults to 5.0
+    :param hot_percent: Percentage of limit above which a project is hot
+    :type hot_percent: float, defaults to 75.0
+    :param max_hot: Maximum number of hot projects, closest to their limit first
+    :type max_hot: int, defaults to 100
+    :param emit_initial: Yield an event for every project found by first report, otherwise it only sets the baseline
+    :type emit_initial: bool, defaults to False
     """
 
-    def __init__(self, message: str, max_available_bytes: int) -> None:
-        super().__init__(message)
-        self.max_available_bytes = max_available_bytes
+    def __init__(
+        self,
+        quota: XfsPrjQuota,
+        warning: float = 80.0,
+        critical: float = 90.0,
+        interval: float = 60.0,
+        max_interval: float = 600.0,
+        hot_interval: float = 5.0,
+        hot_percent: float = 75.0,
+        max_hot: int = 100,
+        emit_initial: bool = False,
+    ) -> None:  # pylint: disable=too-many-arguments
 
+        self.logger = logging.getLogger(self.__class__.__name__)
 
-class XfsPrjQuota:
+        assert isinstance(quota, XfsPrjQuota), "quota parameter must be an XfsPrjQuota instance"
+        assert isinstance(warning, (int, float)) and isinstance(critical, (int, float)) and 0 < warning <= critical, "warning and critical parameters must be numbers with 0 < warning <= critical"
+        assert isinstance(interval, (int, float)) and interval > 0, "interval parameter must be a positive number"
+        assert isinstance(max_interval, (int, float)) and max_interval >= interval, "max_interval parameter must be a number greater or equal to interval"
+        assert isinstance(hot_interval, (int, float)) and hot_interval > 0, "hot_interval parameter must be a positive number"
+        assert isinstance(hot_percent, (int, float)) and hot_percent > 0, "hot_percent parameter must be a positive number"
+        assert isinstance(max_hot, int) and max_hot >= 0, "max_hot parameter must be a positive or zero integer"
+        assert emit_initial is True or emit_initial is False, "emit_initial parameter must be True or False"
+
+        self.quota = quota
+        self.warning = warning
+        self.critical = critical
+        self.interval = interval
+        self.max_interval = max_interval
+        self.hot_interval = hot_interval
+        self.hot_percent = hot_percent
+        self.max_hot = max_hot
+        self.emit_initial = emit_initial
+
+        #: Last known quota of every project, with project id as key
+        self.snapshot: Optional[Dict[int, ProjectQuota]] = None
+        #: Project ids queried every hot_interval
+        self.hot: List[int] = []
+        #: Seconds until next full report, between interval and max_interval
+        self.current_interval = interval
+
+        self._next_full = 0.0
+        self._next_hot = 0.0
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _usage_percent(quota: ProjectQuota) -> float:
+        """
+        Usage percentage of soft limit (hard one if no soft), 0 for projects without limit
+
+        Highest of blocks and inodes percentages is returned so running out of either raises the level
+
+        :param quota: Project quota
+        :type quota: ProjectQuota
+        :returns: Usage percentage
+        :rtype: float
+        """
+
+        limit = quota.soft or quota.hard
+        ilimit = quota.isoft or quota.ihard
+        return max(quota.used * 100 / limit if limit else 0.0, quota.iused * 100 / ilimit if ilimit else 0.0)
+
+    def level(self, quota: Optional[ProjectQuota]) -> str:
+        """
+        Threshold level of a project
+
+        :param quota: Project quota, None for a project without quota
+        :type quota: ProjectQuota
+        :returns: QUOTA_LEVEL_OK, QUOTA_LEVEL_WARNING or QUOTA_LEVEL_CRITICAL
+        :rtype: str
+        """
+
+        percent = self._usage_percent(quota) if quota is not None else 0.0
+        if percent >= self.critical:
+            return QUOTA_LEVEL_CRITICAL
+        if percent >= self.warning:
+            return QUOTA_LEVEL_WARNING
+        return QUOTA_LEVEL_OK
+
+    def _event(self, proj_id: int, previous: Optional[ProjectQuota], current: Optional[ProjectQuota]) -> Optional[QuotaEvent]:
+        """
+        Build event for a project if it changed, grace countdown alone is not a change
+
+        :returns: QuotaEvent or None if project did not change
+        :rtype: QuotaEvent
+        """
+
+        if previous is not None and current is not None:
+            if previous._replace(grace="", igrace="") == current._replace(grace="", igrace="") and QuotaEvent.in_grace(previous) == QuotaEvent.in_grace(current):
+                return None
+        elif previous is None and current is None:
+            return None
+        return QuotaEvent(proj_id=proj_id, previous=previous, current=current, previous_level=self.level(previous), level=self.level(current))
+
+    def poll(self) -> List[QuotaEvent]:
+        """
+        Take a full report, compare it with previous snapshot and pick hot projects
+
+        :returns: Events of changed projects, sorted by project id
+        :rtype: list
+        """
+
+        quotas = self.quota.list_proj_quota()
+        now = time.monotonic()
+        previous = self.snapshot
+
+        if previous is None:
+            events = [self._event(k, None, v) for k, v in sorted(quotas.items())] if self.emit_initial else []
+        else:
+            events = [self._event(k, previous.get(k), quotas.get(k)) for k in sorted(previous.keys() | quotas.keys())]
+        found = [x for x in events if x is not None]
+
+        self.snapshot = quotas
+        self.hot = [x.proj_id for x in heapq.nlargest(self.max_hot, (x for x in quotas.values() if self._usage_percent(x) >= self.hot_percent), key=self._usage_percent)]
+        self.current_interval = self.interval if found or previous is None else min(self.current_interval * 2, self.max_interval)
+        self._next_full = now + self.current_interval
+        self._next_hot = now + self.hot_interval
+        self.logger.debug("Full report of %s: %d projects, %d changed, %d hot, next one in %.0fs", self.quota.mnt_point, len(quotas), len(found), len(self.hot), self.current_interval)
+        return found
+
+    def poll_hot(self) -> List[QuotaEvent]:
+        """
+        Query hot projects only and compare them with previous snapshot
+
+        Projects using neither blocks nor inodes are dropped from snapshot, as a full report would not list them either
+
+        :returns: Events of changed projects, sorted by project id
+        :rtype: list
+        """
+
+        snapshot = self.snapshot
+        assert snapshot is not None, "a full report must be taken with poll() first"
+
+        quotas = self.quota.get_proj_quotas(self.hot)
+        found = []
+        for proj_id in sorted(self.hot):
+            current = quotas.get(proj_id)
+            if current is not None and not (current.used or current.iused):
+                current = None
+            event = self._event(proj_id, snapshot.get(proj_id), current)
+            if event is None:
+                continue
+            found.append(event)
+            if current is None:
+                snapshot.pop(proj_id, None)
+            else:
+                snapshot[proj_id] = current
+        self._next_hot = time.monotonic() + self.hot_interval
+        return found
+
+    def _tick(self) -> Tuple[List[QuotaEvent], float]:
+        """
+        Take whatever poll is due
+
+        :returns: Events found and seconds to wait before next tick
+        :rtype: tuple
+        """
+
+        now = time.monotonic()
+        if self.snapshot is None or now >= self._next_full:
+            events = self.poll()
+        elif self.hot and now >= self._next_hot:
+            events = self.poll_hot()
+        else:
+            events = []
+        next_tick = min(self._next_full, self._next_hot) if self.hot else self._next_full
+        return events, max(0.0, next_tick - time.monotonic())
+
+    def stop(self) -> None:
+        """
+        Make current and future iterations end
+        """
+
+        self._stopped.set()
+
+    def __iter__(self) -> Iterator[QuotaEvent]:
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            events, delay = self._tick()
+            yield from events
+            self._stopped.wait(delay)
+
+    async def __aiter__(self) -> AsyncIterator[QuotaEvent]:
+        self._stopped.clear()
+        loop = asyncio.get_running_loop()
+        while not self._stopped.is_set():
+            events, delay = await loop.run_in_executor(None, self._tick)
+            for event in events:
+                yield event
+            # Short sleeps so stop() is noticed quickly, without keeping an executor thread waiting
+            deadline = loop.time() + delay
+            while not self._stopped.is_set() and loop.time() < deadline:
+                await asyncio.sleep(min(1.0, deadline - loop.time()))
+
+
+class AsyncXfsPrjQuota:
     """
-    Class to handle XFS filesystems project (folder) quota in Python
+    Asyncio flavour of XfsPrjQuota, exposing the same methods as coroutines
 
-    Could be easily ported to Ext4 as it uses FS_IOC_FSGETXATTR/FS_IOC_FSSETXATTR IOCTL to assign project id to folder
-    But it currently relies on xfs_quota binary to assign quota to a project and report usage but this could probably done
-    by calling another binary or figure out which IOCTL to send to do that but that's too much work atm for me
+    xfs_quota calls are done using asyncio.create_subprocess_exec and IOCTL/quotactl/psutil calls
+    are sent to a bounded thread pool executor so the event loop never gets blocked
 
-    Be careful, as the class relies on xfs_quota shell calls it cannot be considered as thread/process safe
+    Concurrent list_proj_quota calls share the same in-flight report instead of spawning duplicates
 
-    TODO: Implement async API for asyncio usage
+    Limits set through this instance update cached report and reservation ledger of the sync instance, writes relying
+    on its xfs_quota session or on its reservation ledger admission are run by the sync instance in executor
+
+    Constructor checks mnt_point is mounted with a blocking psutil call (mount table scan) unless sync is provided,
+    use "await AsyncXfsPrjQuota.create(...)" from a running event loop instead
 
     :param mnt_point: Filesystem mount point to handle quota for
     :type mnt_point: str or pathlib.Path
+    :param backend: How to report and set quotas, BACKEND_XFS_QUOTA (fork xfs_quota) or BACKEND_QUOTACTL (call quotactl() directly)
+    :type backend: str, defaults to BACKEND_XFS_QUOTA
+    :param max_workers: Maximum number of threads used to run blocking calls
+    :type max_workers: int, defaults to 4
+    :param sync: Already built XfsPrjQuota instance to wrap, mnt_point and backend are taken from it
+    :type sync: XfsPrjQuota, defaults to None
     """
 
-    def __init__(self, mnt_point: Union[str, pathlib.Path]) -> None:
+    def __init__(self, mnt_point: Union[str, pathlib.Path], backend: str = BACKEND_XFS_QUOTA, max_workers: int = 4, sync: Optional[XfsPrjQuota] = None) -> None:
 
         self.logger = logging.getLogger(self.__class__.__name__)
 
-        assert isinstance(mnt_point, (str, pathlib.Path)) and str(mnt_point).startswith(
-            "/"
-        ), "mount_point parameter must be a non-emtpy string (or pathlib.Path) starting with /"
-        self.mnt_point = pathlib.Path(mnt_point) if isinstance(mnt_point, str) else mnt_point
+        assert isinstance(max_workers, int) and max_workers > 0, "max_workers parameter must be a positive integer"
+        assert sync is None or isinstance(sync, XfsPrjQuota), "sync parameter must be an XfsPrjQuota instance or None"
 
-        xfs_quota = shutil.which("xfs_quota")
-        assert xfs_quota, "xfs_quota command not found, may I suggest apt install xfsprogs ?"
-        self.xfs_quota = xfs_quota
+        #: Sync instance used for parameters validation, command building and blocking calls done in executor
+        self.sync = sync if sync is not None else XfsPrjQuota(mnt_point, backend=backend)
+        self.mnt_point = self.sync.mnt_point
+        self.backend = self.sync.backend
 
-        self._check_part_mounted()  # check partition is here and properly mounted
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.__class__.__name__)
+        self._report_future: Optional["asyncio.Future[Dict[int, ProjectQuota]]"] = None
 
-    def _check_part_mounted(self) -> None:
+    @classmethod
+    async def create(cls, mnt_point: Union[str, pathlib.Path], backend: str = BACKEND_XFS_QUOTA, max_workers: int = 4) -> "AsyncXfsPrjQuota":
         """
-        Verify provided partition path is mounted and has proper prjquota options
+        Build instance without blocking the event loop, mount checks of XfsPrjQuota constructor run in a thread
 
-        :raises AssertionError: If provided mnt_point cannot be used with XFS project quotas
+        See class parameters
+
+        :returns: Ready to use instance
+        :rtype: AsyncXfsPrjQuota
         """
 
-        mounted = psutil.disk_partitions()
-        target_mounted = [x for x in mounted if x.mountpoint == str(self.mnt_point)]
-        assert target_mounted, "mount_point %s does not seems to be mounted" % self.mnt_point
-        assert target_mounted[0].fstype == "xfs", "mount_point %s is not an XFS partition" % self.mnt_point
-        assert "prjquota" in target_mounted[0].opts.split(","), "mount_point %s is not mounted with prjquota options" % self.mnt_point
+        loop = asyncio.get_running_loop()
+        sync = await loop.run_in_executor(None, functools.partial(XfsPrjQuota, mnt_point, backend=backend))
+        return cls(mnt_point, backend=backend, max_workers=max_workers, sync=sync)
 
-    def get_proj_id_for_path(self, path: Union[str, pathlib.Path]) -> int:
+    def close(self) -> None:
+        """
+        Shutdown thread pool executor, instance must not be used anymore afterwards
         """
-        Get project id (int) for given path
 
-        I did not found any way to do this with xfs_quota command so I went the hard way
+        self.executor.shutdown(wait=False)
 
-        Send "FSGETXATTR" IOCTL and parse the returned struct which contains project id at index 3
-        (see linux/fs.h fsxattr struct definition)
+    async def _run_in_executor(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run blocking callable in bounded thread pool executor
+
+        :param func: Callable to run
+        :type func: callable
+        :returns: Whatever func returned
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _run(self, name: str, cmd: List[str], stderr: bool = False) -> Tuple[int, bytes, bytes]:
+        """
+        Run command asynchronously and report it to sync instance instrument callback if any
+
+        :param name: Call name, see CallTiming
+        :type name: str
+        :param cmd: Command as a list of arguments
+        :type cmd: list
+        :param stderr: Capture stderr too
+        :type stderr: bool, defaults to False
+        :returns: Command exit code, stdout and stderr (empty if not captured)
+        :rtype: tuple
+        """
+
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE if stderr else None)
+        stdout, stderr_output = await process.communicate()
+        assert process.returncode is not None, "returncode must be set once communicate() returned"
+        if self.sync.instrument is not None:
+            error = "exited with code %d" % process.returncode if process.returncode != 0 else None
+            self.sync.instrument(CallTiming("subprocess", name, time.perf_counter() - start, len(stdout), error))
+        return process.returncode, stdout, stderr_output or b""
+
+    async def _check_output(self, name: str, cmd: List[str]) -> bytes:
+        """
+        Asyncio version of subprocess.check_output
+
+        :param name: Call name, see CallTiming
+        :type name: str
+        :param cmd: Command as a list of arguments
+        :type cmd: list
+        :raises subprocess.CalledProcessError: If command exited with non zero code
+        :returns: Command stdout
+        :rtype: bytes
+        """
+
+        returncode, stdout, _ = await self._run(name, cmd)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, output=stdout)
+        return stdout
+
+    async def get_proj_id_for_path(self, path: Union[str, pathlib.Path]) -> int:
+        """
+        Get project id (int) for given path, see XfsPrjQuota.get_proj_id_for_path
 
         :param path: Path to get project id for
         :type path: str or pathlib.Path
@@ -127,23 +4469,11 @@ class XfsPrjQuota:
         :rtype: int
         """
 
-        assert isinstance(path, (str, pathlib.Path)) and path, "path parameter must be a non-emtpy string (or pathlib.Path)"
-        path = pathlib.Path(path) if isinstance(path, str) else path
-        assert self.mnt_point in path.parents or self.mnt_point == path, "provided path %s is not a sub path of %s" % (path, self.mnt_point)
-        assert path.is_dir(), "provided path %s is not an existing directory" % path
-
-        path_fd = os.open(path, os.O_DIRECTORY)
-        ret_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
-        fcntl.ioctl(path_fd, FS_IOC_FSGETXATTR, ret_struct, True)  # type: ignore
-
-        return ret_struct[3]  # project id stored at index 3, see fsxattr struct definition
+        return await self._run_in_executor(self.sync.get_proj_id_for_path, path)
 
-    def set_proj_id_for_path(self, path: Union[str, pathlib.Path], proj_id: int) -> None:
+    async def set_proj_id_for_path(self, path: Union[str, pathlib.Path], proj_id: int) -> None:
         """
-        Set project id (int) for given path
-
-        Send "FSSETXATTR" IOCTL and enable FS_XFLAG_PROJINHERIT so subfolders/subfiles inherit from this setting
-        (see linux/fs.h fsxattr struct definition)
+        Set project id (int) for given path, see XfsPrjQuota.set_proj_id_for_path
 
         :param path: Path to set project id for
         :type path: str or pathlib.Path
@@ -152,84 +4482,102 @@ class XfsPrjQuota:
         :raises AssertionError: If provided path in not sub path of self.mnt_point or not an existing directory
         """
 
-        assert isinstance(path, (str, pathlib.Path)) and path, "path parameter must be a non-emtpy string (or pathlib.Path)"
-        path = pathlib.Path(path) if isinstance(path, str) else path
-        assert self.mnt_point in path.parents or self.mnt_point == path, "provided path %s is not a sub path of %s" % (path, self.mnt_point)
-        assert path.is_dir(), "provided path %s is not an existing directory" % path
-        assert isinstance(proj_id, int) and proj_id >= 0, "proj_id parameter must be a positive or zero integer"
+        await self._run_in_executor(self.sync.set_proj_id_for_path, path, proj_id)
 
-        # Get current values first
-        path_fd = os.open(path, os.O_DIRECTORY)
-        fsxattr_struct = array.array("I", [0, 0, 0, 0, 0])  # __u32
-        fcntl.ioctl(path_fd, FS_IOC_FSGETXATTR, fsxattr_struct, True)  # type: ignore
+    async def _list_proj_quota(self) -> Dict[int, ProjectQuota]:
+        """
+        Actually query mnt_point, see list_proj_quota method instead
+
+        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
+        :rtype: dict
+        """
 
-        # Set new value
-        fsxattr_struct[0] = fsxattr_struct[0] | FS_XFLAG_PROJINHERIT
-        fsxattr_struct[3] = proj_id
-        fcntl.ioctl(path_fd, FS_IOC_FSSETXATTR, fsxattr_struct, True)  # type: ignore
+        if self.backend == BACKEND_QUOTACTL:
+            return await self._run_in_executor(self.sync._fetch_proj_quota)  # pylint: disable=protected-access
 
-        self.logger.debug("Project id %d assigned to folder %s", proj_id, str(path))
+        stdout = await self._check_output("report", self.sync._report_cmd())  # pylint: disable=protected-access
+        # Parsing a large report takes hundreds of ms, do not block the event loop meanwhile
+        return await self._run_in_executor(self.sync._call, "parse", "report", self.sync._parse_xfs_quota_report, stdout)  # pylint: disable=protected-access
 
-    @staticmethod
-    def _parse_xfs_quota_report(stdout: bytes) -> Dict[int, ProjectQuota]:
+    async def list_proj_quota(self) -> Dict[int, ProjectQuota]:
         """
-        Parse xfs_quota -x -c 'report -p -n -N' output
+        Query mnt_point with xfs_quota (or quotactl) and return a dict indexed by project id and usage/limit values
 
-        See list_proj_quota method instead
+        If a report is already in-flight for this mount point, wait for it instead of starting a new one
 
-        :param stdout: Raw stdout of xfs_quota command
-        :type stdout: bytes
         :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
         :rtype: dict
         """
 
-        parsed: Dict[int, ProjectQuota] = {}
-        for line in str(stdout, "utf-8").splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            re_match = RE_QUOTA_REPORT.match(line)
-            assert re_match, "unable to parser xfs_quota report line: %r" % line
-
-            as_named_tuple = ProjectQuota(
-                proj_id=int(re_match.group("proj_id")),
-                used=int(re_match.group("used")) * 1024,  # For some reason setting quota in bytes, listing state in KiB
-                soft=int(re_match.group("soft")) * 1024,
-                hard=int(re_match.group("hard")) * 1024,
-                warn=int(re_match.group("warn")),
-                grace=re_match.group("grace"),
-            )
-            parsed[as_named_tuple.proj_id] = as_named_tuple
+        if self._report_future is None:
+            self._report_future = asyncio.ensure_future(self._list_proj_quota())
+            self._report_future.add_done_callback(self._clear_report_future)
 
-        return parsed
+        # Shield so a cancelled caller does not cancel the report shared with others
+        report = await asyncio.shield(self._report_future)
+        return dict(report)  # Shallow copy so callers cannot alter each other results
 
-    def list_proj_quota(self) -> Dict[int, ProjectQuota]:
+    def _clear_report_future(self, future: "asyncio.Future[Dict[int, ProjectQuota]]") -> None:
         """
-        Query mnt_point with xfs_quota and return a dict indexed by project id and usage/limit values
+        Forget finished in-flight report so next list_proj_quota call starts a fresh one
 
-        :returns: Dict with project id as key and namedtuple as value with soft/hard/used values in bytes
-        :rtype: dict
+        :param future: Finished report future
+        :type future: asyncio.Future
         """
 
-        # -p project quota, -n numeric project id, -N hide header
-        cmd = [self.xfs_quota, "-x", "-c", "report -p -n -N", str(self.mnt_point)]
-        stdout = subprocess.check_output(cmd)
+        if self._report_future is future:
+            self._report_future = None
+
+    async def get_proj_quota(self, proj_id: int) -> Optional[ProjectQuota]:
+        """
+        Query mnt_point for a single project id, see XfsPrjQuota.get_proj_quota
+
+        :param proj_id: Project id to get quota for
+        :type proj_id: int
+        :returns: Namedtuple with soft/hard/used values in bytes or None if project has no quota
+        :rtype: ProjectQuota
+        """
 
-        return self._parse_xfs_quota_report(stdout)
+        return await self._run_in_executor(self.sync.get_proj_quota, proj_id)
 
     @property
-    def next_available_project_id(self) -> int:
+    async def next_available_project_id(self) -> int:
         """
-       Return next available project id (current used greatest project id + 1)
+        Return project id allocate_project_id would hand out, without allocating it
 
-       :returns: Int of next free poject id
-       :rtype: int
-       """
+        Taken from sync instance id_allocator (within id_range), so it is consistent with ids allocated by sync callers
 
-        used_ids = self.list_proj_quota().keys()
-        return max(used_ids) + 1
+        To be awaited: await quota.next_available_project_id
 
-    def raise_not_enough_space(self, quota: int) -> None:
+        :raises XfsPrjQuotaNoProjectId: If every project id in id_range is in use
+        :returns: Int of next free poject id
+        :rtype: int
+        """
+
+        return await self._run_in_executor(lambda: self.sync.id_allocator.peek())  # pylint: disable=unnecessary-lambda # Allocator may be built from a report on first use
+
+    async def allocate_project_id(self) -> int:
+        """
+        Allocate a free project id, see XfsPrjQuota.allocate_project_id
+
+        :raises XfsPrjQuotaNoProjectId: If every project id in id_range is in use
+        :returns: Project id that can be assigned to a folder
+        :rtype: int
+        """
+
+        return await self._run_in_executor(self.sync.allocate_project_id)
+
+    async def release_project_id(self, proj_id: int) -> None:
+        """
+        Release project id so allocate_project_id can hand it out again, see XfsPrjQuota.release_project_id
+
+        :param proj_id: Project id no longer in use
+        :type proj_id: int
+        """
+
+        await self._run_in_executor(self.sync.release_project_id, proj_id)
+
+    async def raise_not_enough_space(self, quota: int) -> None:
         """
         Raise exception if requested quota cannot be fulfilled
 
@@ -240,20 +4588,16 @@ class XfsPrjQuota:
 
         assert quota is None or (isinstance(quota, int) and quota >= 0), "quota parameter must be a positive integer or zero"
 
-        free_space = psutil.disk_usage(self.mnt_point).free
-        reserved_by_quotas = sum([max(x.soft, x.hard) for x in self.list_proj_quota().values()])
-        available_space = free_space - reserved_by_quotas
+        if self.sync.reservation_ledger:
+            await self._run_in_executor(self.sync.raise_not_enough_space, quota)
+            return
 
-        if quota > available_space:
-            err_msg = "Cannot allocate %d bytes soft quota, max available is %d bytes" % (quota, available_space)
-            self.logger.error(err_msg)
-            raise XfsPrjQuotaNoSpace(err_msg, max_available_bytes=available_space)
+        free_space, quotas = await asyncio.gather(self._run_in_executor(self.sync._free_space), self.list_proj_quota())  # pylint: disable=protected-access
+        self.sync._raise_not_enough_space_from(quota, free_space, quotas)  # pylint: disable=protected-access
 
-    def set_quota_for_proj_id(self, proj_id: int, soft: Optional[int] = None, hard: Optional[int] = None, safe_space: bool = True) -> None:
+    async def set_quota_for_proj_id(self, proj_id: int, soft: Optional[int] = None, hard: Optional[int] = None, safe_space: bool = True, isoft: Optional[int] = None, ihard: Optional[int] = None) -> None:  # pylint: disable=too-many-arguments
         """
-        Set soft/hard quotas for given project_id
-
-        Will be done using xfs_quota command
+        Set soft/hard quotas for given project_id, see XfsPrjQuota.set_quota_for_proj_id
 
         :param proj_id: Project id to set
         :type proj_id: int
@@ -263,23 +4607,143 @@ class XfsPrjQuota:
         :type hard: int, defaults to None
         :param safe_space: Set to True if you want to check there is enough free space (reserved quota taken in account too)
         :type safe_space: bool, defaults to True
+        :param isoft: Assign given inode soft quota (0 to remove it), None leaves current value unchanged
+        :type isoft: int, defaults to None
+        :param ihard: Assign given inode hard quota (0 to remove it), None leaves current value unchanged
+        :type ihard: int, defaults to None
         :raises XfsPrjQuotaNoSpace: If safe_space == True but request quota exceed available non reserved space
         """
 
-        assert isinstance(proj_id, int) and proj_id >= 0, "proj_id parameter must be a positive or zero integer"
-        assert soft is None or (isinstance(soft, int) and soft > 0), "soft parameter must be a positive integer or None"
-        assert hard is None or (isinstance(hard, int) and hard > 0), "hard parameter must be a positive integer or None"
-        assert safe_space is True or safe_space is False, "safe_space parameter must be True or False"
+        self.sync._assert_quota_args(proj_id, soft, hard, safe_space, isoft, ihard)  # pylint: disable=protected-access
+
+        # A session is a single xfs_quota process fed through pipes, only sync instance drives it
+        if self.sync.session is not None or (safe_space and self.sync.reservation_ledger):
+            await self._run_in_executor(self.sync.set_quota_for_proj_id, proj_id, soft=soft, hard=hard, safe_space=safe_space, isoft=isoft, ihard=ihard)
+            return
 
         valid_soft = 0 if soft is None else soft
         valid_hard = 0 if hard is None else hard
 
         if safe_space:
-            self.raise_not_enough_space(valid_soft)
-            self.raise_not_enough_space(valid_hard)
+            # Whichever limit is larger is what gets reserved, check it once against a single report
+            await self.raise_not_enough_space(max(valid_soft, valid_hard))
+
+        if self.backend == BACKEND_QUOTACTL:
+            await self._run_in_executor(self.sync._set_quota_for_proj_id_quotactl, proj_id, valid_soft, valid_hard, isoft=isoft, ihard=ihard)  # pylint: disable=protected-access
+        else:
+            await self._check_output("limit", self.sync._limit_cmd(proj_id, valid_soft, valid_hard, isoft=isoft, ihard=ihard))  # pylint: disable=protected-access
+
+        self.sync._limits_applied(proj_id, valid_soft, valid_hard, isoft=isoft, ihard=ihard)  # pylint: disable=protected-access
+
+    async def set_inode_quota_for_proj_id(self, proj_id: int, isoft: Optional[int] = None, ihard: Optional[int] = None) -> None:
+        """
+        Set inode soft/hard quotas for given project_id, see XfsPrjQuota.set_inode_quota_for_proj_id
+
+        :param proj_id: Project id to set
+        :type proj_id: int
+        :param isoft: Assign given inode soft quota (0 to remove it), None leaves current value unchanged
+        :type isoft: int, defaults to None
+        :param ihard: Assign given inode hard quota (0 to remove it), None leaves current value unchanged
+        :type ihard: int, defaults to None
+        """
+
+        self.sync._assert_quota_args(proj_id, None, None, False, isoft, ihard)  # pylint: disable=protected-access
+        if isoft is None and ihard is None:
+            return
+
+        if self.sync.session is not None:
+            await self._run_in_executor(self.sync.set_inode_quota_for_proj_id, proj_id, isoft=isoft, ihard=ihard)
+            return
+
+        if self.backend == BACKEND_QUOTACTL:
+            await self._run_in_executor(self.sync._set_quota_for_proj_id_quotactl, proj_id, None, None, isoft=isoft, ihard=ihard)  # pylint: disable=protected-access
+        else:
+            await self._check_output("limit", self.sync._limit_cmd(proj_id, None, None, isoft=isoft, ihard=ihard))  # pylint: disable=protected-access
+
+        self.sync._limits_applied(proj_id, None, None, isoft=isoft, ihard=ihard)  # pylint: disable=protected-access
+
+    async def set_quotas_for_proj_ids(self, limits: Dict[int, Union[QuotaLimits, tuple]], safe_space: bool = True) -> BatchResult:
+        """
+        Set soft/hard quotas for many project ids at once, see XfsPrjQuota.set_quotas_for_proj_ids
+
+        :param limits: Dict with project id as key and QuotaLimits (or soft, hard tuple) as value
+        :type limits: dict
+        :param safe_space: Set to True if you want to check there is enough free space (reserved quota taken in account too)
+        :type safe_space: bool, defaults to True
+        :raises XfsPrjQuotaNoSpace: If safe_space == True but the batch exceed available non reserved space, nothing is applied
+        :returns: Succeeded and failed project ids, failed ones associated to an error message
+        :rtype: BatchResult
+        """
+
+        valid_limits = self.sync._assert_batch_limits(limits, safe_space)  # pylint: disable=protected-access
+        if not valid_limits:
+            return BatchResult(succeeded=[], failed={})
+
+        # Same as set_quota_for_proj_id: sync instance drives sessions and owns the reservation ledger
+        if self.sync.session is not None or (safe_space and self.sync.reservation_ledger):
+            return await self._run_in_executor(self.sync.set_quotas_for_proj_ids, valid_limits, safe_space=safe_space)
+
+        if safe_space:
+            free_space, quotas = await asyncio.gather(self._run_in_executor(self.sync._free_space), self.list_proj_quota())  # pylint: disable=protected-access
+            self.sync._raise_not_enough_space_for_batch(valid_limits, free_space, quotas)  # pylint: disable=protected-access
+
+        if self.backend == BACKEND_QUOTACTL:
+            result = await self._run_in_executor(self.sync._set_quotas_for_proj_ids_quotactl, valid_limits)  # pylint: disable=protected-access
+        else:
+            errors = []
+            for cmd in self.sync._batch_limit_cmds(valid_limits):  # pylint: disable=protected-access
+                returncode, _, stderr = await self._run("limit_batch", cmd, stderr=True)
+                if returncode != 0 or stderr.strip():
+                    errors.append(str(stderr, "utf-8", "replace").strip() or "xfs_quota exited with code %d" % returncode)
+            if errors:
+                # Do not share an in-flight report that may have been started before limits were applied
+                quotas = await self._list_proj_quota()
+                self.sync._store_cache(quotas)  # pylint: disable=protected-access
+                result = self.sync._batch_result_from_report(valid_limits, quotas, "\n".join(errors))  # pylint: disable=protected-access
+            else:
+                result = BatchResult(succeeded=list(valid_limits), failed={})
+
+        for proj_id in result.succeeded:
+            limit = valid_limits[proj_id]
+            self.sync._limits_applied(proj_id, limit.soft or 0, limit.hard or 0, isoft=limit.isoft, ihard=limit.ihard)  # pylint: disable=protected-access
+
+        for proj_id, error in result.failed.items():
+            self.logger.error("Unable to set limits for project id %d: %s", proj_id, error)
+        return result
+
+    async def create_quota_dir(self, path: Union[str, pathlib.Path], soft: Optional[int] = None, hard: Optional[int] = None, safe_space: bool = True, isoft: Optional[int] = None, ihard: Optional[int] = None) -> int:  # pylint: disable=too-many-arguments
+        """
+        Create a folder with its own project id and limits as a single transaction, see XfsPrjQuota.create_quota_dir
+
+        :param path: Folder to create, its parent must exist
+        :type path: str or pathlib.Path
+        :param soft: Assign given soft quota (bytes)
+        :type soft: int, defaults to None
+        :param hard: Assign given hard quota (bytes)
+        :type hard: int, defaults to None
+        :param safe_space: Set to True if you want to check there is enough free space (reserved quota taken in account too)
+        :type safe_space: bool, defaults to True
+        :param isoft: Assign given inode soft quota, None for no limit
+        :type isoft: int, defaults to None
+        :param ihard: Assign given inode hard quota, None for no limit
+        :type ihard: int, defaults to None
+        :returns: Project id assigned to the folder
+        :rtype: int
+        """
 
-        cmd = [self.xfs_quota, "-x", "-c", "limit -p bsoft=%d bhard=%d %d" % (valid_soft, valid_hard, proj_id), str(self.mnt_point)]
-        subprocess.check_call(cmd)
+        return await self._run_in_executor(self.sync.create_quota_dir, path, soft=soft, hard=hard, safe_space=safe_space, isoft=isoft, ihard=ihard)
+
+    async def release_quota_dir(self, path: Union[str, pathlib.Path]) -> int:
+        """
+        Detach a folder from its project and release project id, see XfsPrjQuota.release_quota_dir
+
+        :param path: Folder created by create_quota_dir
+        :type path: str or pathlib.Path
+        :returns: Released project id
+        :rtype: int
+        """
+
+        return await self._run_in_executor(self.sync.release_quota_dir, path)
 
 
 if __name__ == "__main__":
@@ -319,7 +4783,7 @@ if __name__ == "__main__":
 
             print("Folder %s has project id %d" % (full_path, cur_proj_id))
 
-            new_proj_id = new_proj_id if new_proj_id is not None else QUOTA.next_available_project_id
+            new_proj_id = new_proj_id if new_proj_id is not None else QUOTA.allocate_project_id()
             QUOTA.set_proj_id_for_path(full_path, new_proj_id)
             print("Folder %s has been set to project id %d" % (full_path, new_proj_id))
 
@@ -331,12 +4795,38 @@ if __name__ == "__main__":
         # Remove completely a quota and release used projectId
         # Yes you need to do this, otherwise projectId never get released
         folder_1_path = os.path.join(MNT_POINT, TEST_FOLDERS[1][0])
-        folder_1_proj_id = QUOTA.get_proj_id_for_path(folder_1_path)
-        QUOTA.set_proj_id_for_path(folder_1_path, 0)
-        QUOTA.set_quota_for_proj_id(folder_1_proj_id, soft=None, hard=None)
+        folder_1_proj_id = QUOTA.release_quota_dir(folder_1_path)
         print("Folder %s and project id %d have been released" % (folder_1_path, folder_1_proj_id))
 
+        # Same thing as above in a single locked transaction, safe with concurrent workers
+        folder_5_path = os.path.join(MNT_POINT, "python_xfs_quota_005_%d" % os.getpid())
+        folder_5_proj_id = QUOTA.create_quota_dir(folder_5_path, soft=10 * 1024 * 1024, hard=12 * 1024 * 1024)
+        print("Folder %s has been created with project id %d" % (folder_5_path, folder_5_proj_id))
+        QUOTA.release_quota_dir(folder_5_path)
+        os.rmdir(folder_5_path)
+
         quota_details = QUOTA.list_proj_quota()
         pprint(quota_details)
 
+    async def test_async():
+        """
+        Test async API
+        """
+
+        async_quota = await AsyncXfsPrjQuota.create(MNT_POINT)
+
+        # Concurrent reports share the same xfs_quota call
+        reports = await asyncio.gather(*[async_quota.list_proj_quota() for _ in range(5)])
+        pprint(reports[0])
+
+        folder_0_path = os.path.join(MNT_POINT, TEST_FOLDERS[0][0])
+        folder_0_proj_id = await async_quota.get_proj_id_for_path(folder_0_path)
+        print("Folder %s has project id %d" % (folder_0_path, folder_0_proj_id))
+
+        await async_quota.set_quota_for_proj_id(folder_0_proj_id, soft=30 * 1024 * 1024, hard=30 * 1024 * 1024)
+        pprint((await async_quota.list_proj_quota())[folder_0_proj_id])
+
+        async_quota.close()
+
     test_sync()
+    asyncio.run(test_async())
@@ -0,0 +1,372 @@
+#!/usr/bin/python3
+
+
+# pylint: disable=line-too-long
+
+
+"""
+Prometheus exporter for XFS project quotas of every prjquota volume of the host
+
+Quotas are collected on a background interval and exposition text is rendered once per collection,
+scrapes only send pre-rendered bytes so their latency does not depend on the number of projects
+"""
+
+
+import os
+import glob
+import gzip
+import time
+import logging
+import argparse
+import threading
+import http.server
+import concurrent.futures
+from typing import Dict, List, Tuple, Optional, NamedTuple
+
+from xfs_prjquota import QuotaManager, ProjectQuota, ProjectPathIndex, BACKEND_XFS_QUOTA, BACKEND_QUOTACTL
+
+
+#: Content type of Prometheus text exposition format
+EXPOSITION_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#: Per project metrics, name, help and ProjectQuota field
+PROJECT_METRICS = [
+    ("xfs_prjquota_used_bytes", "Space used by project", "used"),
+    ("xfs_prjquota_soft_limit_bytes", "Project soft limit, 0 if unset", "soft"),
+    ("xfs_prjquota_hard_limit_bytes", "Project hard limit, 0 if unset", "hard"),
+    ("xfs_prjquota_warnings", "Number of warnings issued for project", "warn"),
+    ("xfs_prjquota_used_inodes", "Inodes used by project", "iused"),
+    ("xfs_prjquota_inode_soft_limit", "Project inode soft limit, 0 if unset", "isoft"),
+    ("xfs_prjquota_inode_hard_limit", "Project inode hard limit, 0 if unset", "ihard"),
+    ("xfs_prjquota_inode_warnings", "Number of inode warnings issued for project", "iwarn"),
+]
+
+
+class MountCollection(NamedTuple):
+    """
+    NamedTuple representing the outcome of collecting quotas of one mount point
+    """
+
+    mnt_point: str
+    quotas: Optional[Dict[int, ProjectQuota]]
+    duration: float
+    paths: Dict[int, List[str]]
+
+
+class Exposition(NamedTuple):
+    """
+    NamedTuple holding rendered exposition text, plain and gzip compressed
+    """
+
+    plain: bytes
+    gzipped: bytes
+
+
+def escape_label(value: str) -> str:
+    """
+    Escape label value as required by Prometheus text exposition format
+
+    :param value: Raw label value
+    :type value: str
+    :return: Escaped value, without surrounding quotes
+    :rtype: str
+    """
+
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class QuotaCollector:
+    """
+    Collect project quotas of every XFS prjquota volume in a background thread and keep exposition text rendered
+
+    :param manager: QuotaManager used to find volumes and report them
+    :type manager: QuotaManager
+    :param interval: Seconds between two collections
+    :type interval: int or float, defaults to 60
+    :param path_patterns: Directories (glob patterns allowed) whose project id is exposed as path label of xfs_prjquota_project_info
+    :type path_patterns: list, defaults to None
+    :param workers: Number of volumes reported at the same time, None for one per volume
+    :type workers: int, defaults to None
+    """
+
+    def __init__(self, manager: QuotaManager, interval: float = 60, path_patterns: Optional[List[str]] = None, workers: Optional[int] = None) -> None:
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        assert isinstance(interval, (int, float)) and interval > 0, "interval parameter must be a positive number"
+        assert workers is None or (isinstance(workers, int) and workers > 0), "workers parameter must be a positive integer or None"
+
+        self.manager = manager
+        self.interval = interval
+        self.path_patterns = path_patterns or []
+        self.workers = workers
+
+        self.collections = 0
+        self.errors: Dict[str, int] = {}
+        self._errors_lock = threading.Lock()
+        self.exposition = Exposition(plain=b"", gzipped=gzip.compress(b""))
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _paths_by_mount(self) -> Dict[str, List[str]]:
+        """
+        Expand path patterns and group matching directories by mount point
+
+        :return: Dict with mount point as key and list of paths as value
+        :rtype: dict
+        """
+
+        by_mount: Dict[str, List[str]] = {}
+        for pattern in self.path_patterns:
+            for path in sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]:
+                path = os.path.abspath(path)
+                by_mount.setdefault(self.manager.find_mount_point(path), []).append(path)
+        return by_mount
+
+    def _collect_mount(self, mnt_point: str, paths: List[str]) -> MountCollection:
+        """
+        Report project quotas of one mount point and resolve project id of its mapped paths
+
+        :param mnt_point: Mount point to collect
+        :type mnt_point: str
+        :param paths: Mapped paths belonging to this mount point
+        :type paths: list
+        :return: Collection result, quotas is None if report failed
+        :rtype: MountCollection
+        """
+
+        start = time.monotonic()
+        quotas: Optional[Dict[int, ProjectQuota]] = None
+        proj_paths: Dict[int, List[str]] = {}
+        try:
+            quota = self.manager.get(mnt_point)
+            quotas = quota.list_proj_quota()
+            for path, proj in quota.get_proj_ids_for_paths(paths, ignore_errors=True).items():
+                proj_paths.setdefault(proj.proj_id, []).append(str(path))
+            if quota.path_index is not None:
+                for proj_id, indexed_paths in quota.path_index.mapping(mnt_point).items():
+                    known = proj_paths.setdefault(proj_id, [])
+                    known.extend(x for x in indexed_paths if x not in known)
+        except Exception as exc:  # pylint: disable=broad-except
+            self.logger.error("Unable to collect project quotas of %s: %s: %s", mnt_point, exc.__class__.__name__, exc)
+            with self._errors_lock:  # Mount points are collected from executor threads
+                self.errors[mnt_point] = self.errors.get(mnt_point, 0) + 1
+        return MountCollection(mnt_point=mnt_point, quotas=quotas, duration=time.monotonic() - start, paths=proj_paths)
+
+    def collect(self) -> None:
+        """
+        Collect every volume once and swap rendered exposition text
+        """
+
+        start = time.monotonic()
+        mnt_points = self.manager.quota_mounts()
+        paths = self._paths_by_mount()
+
+        if mnt_points:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers or len(mnt_points)) as executor:
+                results = list(executor.map(lambda x: self._collect_mount(x, paths.get(x, [])), mnt_points))
+        else:
+            results = []
+
+        self.collections += 1
+        plain = self.render(results, time.monotonic() - start)
+        # Reference assignment is atomic, scrapes always see a complete exposition
+        self.exposition = Exposition(plain=plain, gzipped=gzip.compress(plain, compresslevel=6))
+        self.logger.debug("Collected %d mount points in %.3fs, exposition is %d bytes", len(results), time.monotonic() - start, len(plain))
+
+    def render(self, results: List[MountCollection], duration: float) -> bytes:
+        """
+        Render collection results into Prometheus text exposition format
+
+        :param results: Collection result of every mount point
+        :type results: list
+        :param duration: Whole collection duration in seconds
+        :type duration: float
+        :return: Exposition text
+        :rtype: bytes
+        """
+
+        lines: List[str] = []
+        labels: List[Tuple[str, List[ProjectQuota]]] = []
+        for result in results:
+            if result.quotas is not None:
+                labels.append((escape_label(result.mnt_point), sorted(result.quotas.values())))
+
+        for name, help_text, field in PROJECT_METRICS:
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s gauge" % name)
+            for mount_label, quotas in labels:
+                lines.extend('%s{mount="%s",project="%d"} %d' % (name, mount_label, x.proj_id, getattr(x, field)) for x in quotas)
+
+        lines.append("# HELP xfs_prjquota_project_info Mapping of project id to path, join on mount and project labels")
+        lines.append("# TYPE xfs_prjquota_project_info gauge")
+        for result in results:
+            for proj_id, proj_paths in sorted(result.paths.items()):
+                lines.extend('xfs_prjquota_project_info{mount="%s",project="%d",path="%s"} 1' % (escape_label(result.mnt_point), proj_id, escape_label(x)) for x in proj_paths)
+
+        lines.append("# HELP xfs_prjquota_collection_success Whether last report of the mount point succeeded")
+        lines.append("# TYPE xfs_prjquota_collection_success gauge")
+        lines.extend('xfs_prjquota_collection_success{mount="%s"} %d' % (escape_label(x.mnt_point), x.quotas is not None) for x in results)
+        lines.append("# HELP xfs_prjquota_collection_duration_seconds Duration of last report of the mount point")
+        lines.append("# TYPE xfs_prjquota_collection_duration_seconds gauge")
+        lines.extend('xfs_prjquota_collection_duration_seconds{mount="%s"} %.6f' % (escape_label(x.mnt_point), x.duration) for x in results)
+        lines.append("# HELP xfs_prjquota_report_projects Number of projects found in last report of the mount point")
+        lines.append("# TYPE xfs_prjquota_report_projects gauge")
+        lines.extend('xfs_prjquota_report_projects{mount="%s"} %d' % (escape_label(x.mnt_point), len(x.quotas)) for x in results if x.quotas is not None)
+        lines.append("# HELP xfs_prjquota_collection_errors_total Number of failed reports of the mount point")
+        lines.append("# TYPE xfs_prjquota_collection_errors_total counter")
+        with self._errors_lock:
+            errors = sorted(self.errors.items())
+        lines.extend('xfs_prjquota_collection_errors_total{mount="%s"} %d' % (escape_label(k), v) for k, v in errors)
+        lines.append("# HELP xfs_prjquota_collections_total Number of collections since exporter start")
+        lines.append("# TYPE xfs_prjquota_collections_total counter")
+        lines.append("xfs_prjquota_collections_total %d" % self.collections)
+        lines.append("# HELP xfs_prjquota_last_collection_duration_seconds Duration of last collection of all mount points")
+        lines.append("# TYPE xfs_prjquota_last_collection_duration_seconds gauge")
+        lines.append("xfs_prjquota_last_collection_duration_seconds %.6f" % duration)
+        lines.append("# HELP xfs_prjquota_last_collection_timestamp_seconds UNIX timestamp of last collection end")
+        lines.append("# TYPE xfs_prjquota_last_collection_timestamp_seconds gauge")
+        lines.append("xfs_prjquota_last_collection_timestamp_seconds %.3f" % time.time())
+
+        body = "\n".join(lines) + "\n"
+        # Size of the exposition itself is only known once rendered
+        body += "# HELP xfs_prjquota_exposition_bytes Size of last rendered exposition text\n# TYPE xfs_prjquota_exposition_bytes gauge\nxfs_prjquota_exposition_bytes %d\n" % len(body)
+        return body.encode("utf-8")
+
+    def run(self) -> None:
+        """
+        Collect every interval seconds (drift free) until stop is called, first collection is expected to be done by start
+        """
+
+        next_run = time.monotonic() + self.interval
+        while not self._stop.wait(max(next_run - time.monotonic(), 0)):
+            try:
+                self.collect()
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("Collection failed")
+            next_run += self.interval
+
+    def start(self) -> None:
+        """
+        Start background collection thread, first collection is done synchronously so exporter never serves an empty exposition
+        """
+
+        self.collect()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop background collection thread
+        """
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    HTTP handler serving collector pre-rendered exposition text, collector is set as server attribute
+    """
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Serve /metrics, gzip compressed if client accepts it
+        """
+
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+
+        exposition = self.server.collector.exposition  # type: ignore
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = exposition.gzipped if use_gzip else exposition.plain
+
+        self.send_response(200)
+        self.send_header("Content-Type", EXPOSITION_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:  # pylint: disable=redefined-builtin
+        """
+        Send access log to logging module at debug level instead of stderr
+        """
+
+        logging.getLogger(self.__class__.__name__).debug("%s - %s", self.address_string(), format % args)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse command line arguments
+
+    :return: argparse.Namespace object with all command line arguments as attributes (dash replace by underscore)
+    :type: argparse.Namespace
+    """
+
+    argparser = argparse.ArgumentParser(description=__doc__.strip())
+    argparser.add_argument("-l", "--listen", type=str, default="0.0.0.0:9731", metavar="0.0.0.0:9731", help="Address and port to serve metrics on")
+    argparser.add_argument("-i", "--interval", type=float, default=60, metavar="60", help="Seconds between two collections")
+    argparser.add_argument("-P", "--path", type=str, action="append", default=[], metavar="/srv/tenants/*", help="Directory (glob allowed) to expose as path label of its project, may be repeated")
+    argparser.add_argument("-w", "--workers", type=int, default=None, metavar="4", help="Number of volumes reported at the same time, defaults to one per volume")
+    argparser.add_argument(
+        "-B", "--backend", type=str, default=BACKEND_XFS_QUOTA, choices=[BACKEND_XFS_QUOTA, BACKEND_QUOTACTL], help="How to query quota usage, forking xfs_quota or calling quotactl()"
+    )
+    argparser.add_argument("-I", "--path-index", type=str, default=None, metavar="/var/lib/xfs_prjquota/paths.sqlite", help="ProjectPathIndex database whose project roots are exposed as path labels too")
+    argparser.add_argument("-s", "--session", action="store_true", help="Keep one xfs_quota process per volume instead of forking it on every collection")
+    argparser.add_argument("-d", "--debug", action="store_true", help="Enable debug logging")
+    args = argparser.parse_args()
+
+    host, _, port = args.listen.rpartition(":")
+    if not port.isdigit():
+        argparser.error("--listen must be formatted as address:port")
+    args.listen = (host.strip("[]"), int(port))
+
+    if args.interval <= 0:
+        argparser.error("--interval must be a positive number")
+
+    if args.session and args.backend != BACKEND_XFS_QUOTA:
+        argparser.error("--session requires %s backend" % BACKEND_XFS_QUOTA)
+
+    return args
+
+
+def main(config: argparse.Namespace) -> None:
+    """
+    Start collector and serve metrics until interrupted
+
+    :param config: argparse.Namespace instance representing command line arguments
+    :rtype config: argparse.Namespace
+    """
+
+    logging.basicConfig(level=logging.DEBUG if config.debug else logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    path_index = ProjectPathIndex(config.path_index) if config.path_index else None
+    manager = QuotaManager(backend=config.backend, session=config.session, path_index=path_index)
+    collector = QuotaCollector(manager, interval=config.interval, path_patterns=config.path, workers=config.workers)
+    collector.start()
+
+    server = http.server.ThreadingHTTPServer(config.listen, MetricsHandler)
+    server.daemon_threads = True
+    server.collector = collector  # type: ignore
+    logging.getLogger("main").info("Serving metrics on http://%s:%d/metrics", *config.listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        collector.stop()
+        manager.close()
+        if path_index is not None:
+            path_index.close()
+
+
+if __name__ == "__main__":
+
+    main(parse_args())